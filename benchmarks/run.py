@@ -0,0 +1,323 @@
+"""
+Micro-benchmarks of the prediction paths of the forecast service.
+
+Run from the repository root with:
+    python -m benchmarks.run [--output results.json] [--baseline benchmarks/baseline.json] [--threshold 0.25]
+
+Each benchmark is timed over many iterations on rows sampled from src/ml/dataset.csv and the median, p95 and
+throughput are written to a JSON file. The medians are compared with the stored baseline and the run fails if any
+benchmark is slower than the baseline by more than the threshold. Timings from another Python or scikit-learn
+version, architecture or CPU count are not comparable, so the comparison is skipped when the baseline was recorded
+on a different environment. Pass --update-baseline to store the new results as the baseline after an intended
+change, or to record a baseline for this environment.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from itertools import cycle
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import jwt
+import pandas as pd
+import sklearn
+from fastapi.testclient import TestClient
+
+from src import services
+from src.artifact import ARTIFACT_FILE, export_artifact
+from src.ml import dataset as columnar
+from src.auth import SECRET_KEY, ALGORITHM
+from src.main import app, get_db
+from src.registry import ModelRegistry
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+DATASET_PATH = os.path.join(BENCHMARK_DIR, "..", "src", "ml", "dataset.csv")
+BASELINE_PATH = os.path.join(BENCHMARK_DIR, "baseline.json")
+
+# Fraction a median can be slower than the baseline before the run fails
+DEFAULT_THRESHOLD = 0.25
+
+# Report fields that must match the baseline for its timings to be comparable
+ENVIRONMENT_FIELDS = ('python', 'sklearn', 'machine', 'cpu_count')
+
+# Batch sizes of the batch inference benchmarks
+BATCH_SIZES = (1, 10, 100, 1000)
+
+# Batch sizes the compiled predictor is compared with the sklearn pipelines at
+ENGINE_BATCH_SIZES = (1000, 10000)
+
+VENDOR_ID = "e27daa6e-3e67-4d51-8ac0-cc73c621fd40"
+FEATURES = ['discount', 'price', 'weather', 'category', 'temperature', 'day', 'lead_time', 'window_length', 'time_of_day']
+
+
+def load_rows(n_rows=500, seed=42):
+    """
+    Samples realistic model inputs from the training dataset, the columnar build if there is one.
+    :param n_rows: Number of rows to sample.
+    :param seed: Random seed so every run uses the same rows.
+    :return: List of input dictionaries.
+    """
+    # Only the feature columns of the columnar dataset are read, the CSV is parsed if it has not been built or is
+    # newer than the build
+    if columnar.is_current():
+        dataset = columnar.load(columns=FEATURES)
+    else:
+        dataset = pd.read_csv(DATASET_PATH, usecols=FEATURES)
+    dataset = dataset.sample(n=n_rows, replace=True, random_state=seed)
+    dataset['time_of_day'] = dataset['time_of_day'].astype(int)
+    return dataset[FEATURES].astype({feature: object for feature in ('weather', 'category', 'day')}).to_dict('records')
+
+
+def bundle_from_row(row, index):
+    """
+    Builds the bundle columns the database would return for an input row, so the bundle path sees the same inputs.
+    :param row: Input dictionary.
+    :param index: Position of the row, used for a unique bundle ID.
+    :return: Dictionary of bundle columns and the vendor postcode.
+    """
+    # Finds the next date falling on the rows day from a fixed Monday
+    days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+    collection_start = datetime(2025, 1, 6) + timedelta(days=days.index(row['day']), hours=row['time_of_day'])
+
+    return {
+        'bundle_id': f"bundle-{index}",
+        'collection_start': collection_start,
+        'posting_time': collection_start - timedelta(hours=row['lead_time']),
+        'collection_end': collection_start + timedelta(hours=row['window_length']),
+        'retail_price': row['price'] / (1 - row['discount']) if row['discount'] < 1 else row['price'],
+        'price': row['price'],
+        'category': row['category'],
+        'postcode': "EX4 4QJ"
+    }
+
+
+def measure(fn, iterations, warmup=5):
+    """
+    Times repeated calls of fn.
+    :param fn: Function taking no arguments.
+    :param iterations: Number of timed calls.
+    :param warmup: Number of untimed calls made first.
+    :return: Dictionary of the median and p95 in milliseconds and the calls per second.
+    """
+    for _ in range(warmup):
+        fn()
+
+    timings = []
+    for _ in range(iterations):
+        started_at = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started_at)
+
+    timings.sort()
+    return {
+        'iterations': iterations,
+        'median_ms': statistics.median(timings) * 1000,
+        'p95_ms': timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000,
+        'ops_per_sec': len(timings) / sum(timings)
+    }
+
+
+def run_benchmarks(iterations):
+    """
+    Runs every benchmark.
+    :param iterations: Number of timed calls of each benchmark, batch benchmarks scale it down by batch size.
+    :return: Dictionary of benchmark name to its timings.
+    """
+    services.load_models()
+    rows = load_rows()
+    results = {}
+
+    # The prediction cache would answer repeated rows without running the models, so it is disabled throughout
+    with patch.object(services.prediction_cache, "ttl", 0):
+        inputs = cycle(rows)
+        results['services_predict'] = measure(lambda: services.predict(next(inputs)), iterations)
+
+        for size in BATCH_SIZES:
+            batch = pd.DataFrame([rows[i % len(rows)] for i in range(size)])
+            results[f'predict_batch_{size}'] = measure(
+                lambda: services.predict_batch(batch), max(10, iterations // max(1, size // 10))
+            )
+
+        results.update(run_engine_benchmarks(iterations))
+        results.update(run_endpoint_benchmarks(rows, iterations))
+
+    return results
+
+
+def run_engine_benchmarks(iterations):
+    """
+    Times the compiled predictor, the same version loaded from an exported artifact as the Docker image serves it,
+    and the sklearn pipelines on the same large batches. Artifact versions have no pipelines, so the compiled
+    predictor scores every batch size.
+    :param iterations: Number of timed calls at 1000 rows, scaled down for larger batches.
+    :return: Dictionary of benchmark name to its timings.
+    """
+    model_version = services.registry.current
+    if model_version.compiled_predictor is None or model_version.inference_engine is None:
+        return {}
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        export_artifact(model_version.compiled_predictor, os.path.join(directory, ARTIFACT_FILE), model_version.version)
+        artifact_version = ModelRegistry(directory).load(use_artifact=True)
+
+        for size in ENGINE_BATCH_SIZES:
+            # Sampled rather than repeated rows, as repeating a few rows flatters the sklearn tree traversal
+            batch = pd.DataFrame(load_rows(size, seed=size))
+            engine_iterations = max(10, iterations * 1000 // size // 10)
+            results[f'compiled_engine_{size}'] = measure(
+                lambda: model_version.compiled_predictor.predict(batch), engine_iterations
+            )
+            results[f'artifact_engine_{size}'] = measure(lambda: artifact_version.predict(batch), engine_iterations)
+            results[f'sklearn_engine_{size}'] = measure(
+                lambda: model_version.inference_engine.predict(batch), engine_iterations
+            )
+
+    return results
+
+
+def run_endpoint_benchmarks(rows, iterations):
+    """
+    Times the simulate and bundle endpoints end to end with the database and weather API stubbed.
+    :param rows: Input dictionaries to send.
+    :param iterations: Number of timed requests of each endpoint.
+    :return: Dictionary of benchmark name to its timings.
+    """
+    client = TestClient(app)
+    token = jwt.encode({"sub": VENDOR_ID, "exp": time.time() + 3600}, SECRET_KEY, algorithm=ALGORITHM)
+    headers = {"Authorization": f"Bearer {token}"}
+    bundles = [bundle_from_row(row, i) for i, row in enumerate(rows)]
+
+    # Every query returns the next bundle, like a vendor opening different bundles
+    session = MagicMock()
+    bundle_cycle = cycle(bundles)
+
+    async def execute(*args, **kwargs):
+        result = MagicMock()
+        result.mappings.return_value.first.return_value = next(bundle_cycle)
+        return result
+
+    session.execute = AsyncMock(side_effect=execute)
+    app.dependency_overrides[get_db] = lambda: session
+    results = {}
+
+    try:
+        with patch("src.main.get_current_weather", AsyncMock(return_value=("Sunny", 20.0))), \
+                patch("src.main.get_weather_for_postcode", AsyncMock(return_value=("Sunny", 20.0))):
+            payloads = cycle(rows)
+            results['simulate_forecast'] = measure(
+                lambda: check(client.post("/forecast/simulate", json=next(payloads), headers=headers)), iterations
+            )
+
+            bundle_ids = cycle(bundle['bundle_id'] for bundle in bundles)
+            results['predict_bundle'] = measure(
+                lambda: check(client.get(f"/forecast/predict/{next(bundle_ids)}", headers=headers)), iterations
+            )
+    finally:
+        app.dependency_overrides.clear()
+
+    return results
+
+
+def check(response):
+    """
+    Stops the run if a request fails, as timing error responses would hide a broken path.
+    """
+    if response.status_code != 200:
+        raise RuntimeError(f"Benchmark request failed with {response.status_code}: {response.text}")
+    return response
+
+
+def compare(results, baseline, threshold):
+    """
+    Compares the medians with the baseline.
+    :param results: Dictionary of benchmark name to its timings.
+    :param baseline: Baseline results in the same format.
+    :param threshold: Fraction a median can be slower than the baseline.
+    :return: List of (name, baseline median, new median, change) for every benchmark slower than allowed.
+    """
+    regressions = []
+    for name, timings in results.items():
+        if name not in baseline:
+            continue
+        previous = baseline[name]['median_ms']
+        change = timings['median_ms'] / previous - 1
+        if change > threshold:
+            regressions.append((name, previous, timings['median_ms'], change))
+    return regressions
+
+
+def environment_differences(report, baseline):
+    """
+    Compares the environment the results and the baseline were recorded on.
+    :param report: Report of the current run.
+    :param baseline: Stored baseline report.
+    :return: List of (field, baseline value, current value) for every field that differs.
+    """
+    return [
+        (field, baseline.get(field), report[field]) for field in ENVIRONMENT_FIELDS
+        if baseline.get(field) != report[field]
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the forecast service prediction paths.")
+    parser.add_argument("--output", default="benchmark_results.json", help="File the results are written to.")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline results to compare against.")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Fraction a median can be slower than the baseline before failing.")
+    parser.add_argument("--iterations", type=int, default=200, help="Timed calls of each benchmark.")
+    parser.add_argument("--update-baseline", action="store_true", help="Store the results as the new baseline.")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.iterations)
+    report = {
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'sklearn': sklearn.__version__,
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'results': results
+    }
+
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+
+    for name, timings in results.items():
+        print(f"{name:<22} median {timings['median_ms']:9.3f} ms   p95 {timings['p95_ms']:9.3f} ms   "
+              f"{timings['ops_per_sec']:10.1f} ops/s")
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(report, file, indent=2)
+        print(f"Baseline updated: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --update-baseline to create one")
+        return 0
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+
+    # Another machine is faster or slower across the board, which would report spurious or hide real regressions
+    differences = environment_differences(report, baseline)
+    if differences:
+        for field, recorded, current in differences:
+            print(f"WARNING baseline was recorded with {field} {recorded}, this run has {current}")
+        print("Skipping the comparison, run with --update-baseline to record a baseline for this environment")
+        return 0
+
+    regressions = compare(results, baseline['results'], args.threshold)
+    for name, previous, current, change in regressions:
+        print(f"REGRESSION {name}: {previous:.3f} ms -> {current:.3f} ms ({change:+.0%})")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,289 +1,282 @@
 import uuid
 
+import numpy as np
 import pandas as pd
-import math
-import random
-from datetime import datetime
 from pathlib import Path
 
 # Set seed to ensure same results across runs
 RANDOM_SEED = 12
-random.seed(RANDOM_SEED)
 
-# Load needed datasets
-WEATHER = pd.read_csv('weather_files/weather_data_exeter.csv.csv')
-BUNDLES = pd.read_csv('database_files/bundles.csv')
-USERS = pd.read_csv('database_files/users.csv')
-NORMALISED_CATEGORIES = pd.read_csv('normalisation_files/categories.csv')
-NORMALISED_WEATHER = pd.read_csv('normalisation_files/weather.csv')
+# Datasets are read and written relative to this folder so the script works from any directory
+DATA_DIR = Path(__file__).resolve().parent
+WEATHER_FILE = DATA_DIR / 'weather_files' / 'weather_data_exeter.csv.csv'
+BUNDLES_FILE = DATA_DIR / 'database_files' / 'bundles.csv'
+USERS_FILE = DATA_DIR / 'database_files' / 'users.csv'
+NORMALISED_CATEGORIES_FILE = DATA_DIR / 'normalisation_files' / 'categories.csv'
+NORMALISED_WEATHER_FILE = DATA_DIR / 'normalisation_files' / 'weather.csv'
+RESERVATIONS_FILE = DATA_DIR / 'database_files' / 'reservations.csv'
+DATASET_FILE = DATA_DIR.parent / 'src' / 'ml' / 'ml.csv'
+
+# Format of the bundle timestamps
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+# The weights for the reservation decision. The discount and price are the two main decision factors.
+RESERVATION_WEIGHTS = {
+    'discount': 0.3,
+    'price': 0.15,
+    'weather': 0.15,
+    'lead_time': 0.1,
+    'temperature': 0.1,
+    'day_of_week': 0.05,
+    'window_length': 0.05,
+    'time_of_day': 0.05,
+    'category': 0.05
+}
+
+# The weights for the collection decision. The weather conditions and temperature are the two main decision factors.
+COLLECTION_WEIGHTS = {
+    'weather': 0.3,
+    'temperature': 0.15,
+    'window_length': 0.15,
+    'day_of_week': 0.1,
+    'time_of_day': 0.1,
+    'lead_time': 0.05,
+    'discount': 0.05,
+    'price': 0.05,
+    'category': 0.05
+}
 
 
 def normalise_price(price):
     """
     Normalises price using exponential decay.
-    :param price: The price to normalise.
-    :return: Normalised price.
+    :param price: Array of prices to normalise.
+    :return: Normalised prices.
     """
-    return math.exp(-0.1 * price)
+    return np.exp(-0.1 * price)
 
 
-def normalise_weather(condition):
+def normalise_lookup(values, table, key):
     """
-    Uses the NORMALISED_WEATHER to normalise weather condition.
-    :param condition: The weather condition to normalise.
-    :return: Normalised weather condition.
+    Normalises values using a normalisation table, such as the weather or category tables.
+    :param values: Series of values to normalise.
+    :param table: Dataframe with the key column and a value column, the first row of each key is used.
+    :param key: Name of the key column.
+    :return: Array of normalised values.
+    :raises: ValueError if a value is not in the table.
     """
-    return NORMALISED_WEATHER.loc[NORMALISED_WEATHER['condition'] == condition, 'value'].values[0]
-
-
-def normalise_category(category):
-    """
-    Uses the NORMALISED_CATEGORIES to normalise category.
-    :param category: The category to normalise.
-    :return: The normalised category.
-    """
-    return NORMALISED_CATEGORIES.loc[NORMALISED_CATEGORIES['category'] == category, 'value'].values[0]
+    lookup = table.drop_duplicates(key).set_index(key)['value']
+    normalised = values.map(lookup)
+    if normalised.isna().any():
+        raise ValueError(f"No normalised {key} for {sorted(values[normalised.isna()].unique())}")
+    return normalised.to_numpy(dtype=np.float64)
 
 
 def normalise_temperature(temp_c):
     """
     Normalises temperature using gaussian distribution where 20 degrees is the optimal temperature.
-    :param temp_c: The temperature to normalise.
-    :return: The normalised temperature.
+    :param temp_c: Array of temperatures to normalise.
+    :return: The normalised temperatures.
     """
     optimal_temp = 20
     standard_deviation = 10
-    return math.exp(-((temp_c - optimal_temp) ** 2) / (2 * (standard_deviation ** 2)))
+    return np.exp(-((temp_c - optimal_temp) ** 2) / (2 * (standard_deviation ** 2)))
 
 
 def normalise_lead_time(hours):
     """
     Normalises lead time. The optimal lead time is between 1 and 4 hours. Lead times of less than 1 hour and more than 6 hours are less desirable.
-    :param hours: The lead time to normalise.
-    :return: The normalised lead time.
+    :param hours: Array of lead times to normalise.
+    :return: The normalised lead times.
     """
-    if hours < 1: return 0.3
-    if 1 <= hours <= 4: return 1.0
-    if hours > 6: return 0.4
-    return 0.6
+    return np.select([hours < 1, hours <= 4, hours > 6], [0.3, 1.0, 0.4], default=0.6)
 
 
 def normalise_window_length(hours):
     """
     Normalise the window length. Longer window length is more desirable, up to 4 hours.
-    :param hours: The window length to normalise.
-    :return: Then normalised window length.
+    :param hours: Array of window lengths to normalise.
+    :return: Then normalised window lengths.
     """
-    return min(1.0, hours / 4.0)
+    return np.minimum(1.0, hours / 4.0)
 
 
 def normalise_time_of_day(hour):
     """
     Normalise the time of day. 11:00 to 14:00 and 17:00 to 20:00 are the most optimal times.
-    :param hour: The time of day to normalise.
-    :return: Then normalised time of day.
+    :param hour: Array of hours to normalise.
+    :return: Then normalised times of day.
     """
-    if 11 <= hour <= 14: return 1.0
-    if 17 <= hour <= 20: return 0.9
-    if 8 <= hour <= 10: return 0.6
-    if hour > 21: return 0.2
-    return 0.5
+    return np.select(
+        [(hour >= 11) & (hour <= 14), (hour >= 17) & (hour <= 20), (hour >= 8) & (hour <= 10), hour > 21],
+        [1.0, 0.9, 0.6, 0.2], default=0.5
+    )
 
 
-def calculate_decision(bundle, weights, threshold, create_dataset_entry=False):
+def bundle_factors(bundles, weather, normalised_weather, normalised_categories):
     """
-    Calculates the reservation decision based on numerous factors surrounding the bundle.
-    :param bundle: The bundle.
-    :param weights: The weights of the factors.
-    :param threshold: The threshold for the reservation decision.
-    :param create_dataset_entry: If true, returns the raw features for the ML dataset.
-    :return: Bool indicating if score > threshold and a dictionary containing the raw features for the ML dataset if create_dataset_entry is true.
+    Derives the raw and normalised decision factors of every bundle at once.
+    :param bundles: Dataframe of bundles.
+    :param weather: Dataframe of the daily weather, the first row of each date is used.
+    :param normalised_weather: Dataframe of the normalised value of each weather condition.
+    :param normalised_categories: Dataframe of the normalised value of each category.
+    :return: Dataframe of the raw factors for the ML dataset and dataframe of the normalised factors.
+    :raises: ValueError if there is no weather for the collection date of a bundle.
     """
-
-    fmt = "%Y-%m-%dT%H:%M:%S"
-    post_datetime = datetime.strptime(bundle['posting_time'], fmt)
-    start_datetime = datetime.strptime(bundle['collection_start'], fmt)
-    end_datetime = datetime.strptime(bundle['collection_end'], fmt)
+    post_datetime = pd.to_datetime(bundles['posting_time'], format=TIME_FORMAT)
+    start_datetime = pd.to_datetime(bundles['collection_start'], format=TIME_FORMAT)
+    end_datetime = pd.to_datetime(bundles['collection_end'], format=TIME_FORMAT)
 
     # Get factors that are found in the bundle dataset
-    price = bundle['price']
-    retail_price = bundle['retail_price']
-    category = bundle['category']
-    date = start_datetime.strftime('%Y-%m-%d')
+    price = bundles['price'].to_numpy(dtype=np.float64)
+    retail_price = bundles['retail_price'].to_numpy(dtype=np.float64)
 
     # Calculate the factors that are not found in the bundle dataset
-    discount = max(0, (retail_price - price) / retail_price)
-    lead_time_hrs = (start_datetime - post_datetime).total_seconds() / 3600
-    window_length_hrs = (end_datetime - start_datetime).total_seconds() / 3600
-    pickup_hour = start_datetime.hour
-    is_weekend = start_datetime.weekday() >= 5
-
-    # Get the weather condition and temperature from the saved weather csv file
-    weather = WEATHER[WEATHER['date'] == date].iloc[0]
-    condition = weather['condition'].strip()
-    temperature = weather['avgtemp_c']
+    discount = np.maximum(0, (retail_price - price) / retail_price)
+    lead_time_hrs = ((start_datetime - post_datetime).dt.total_seconds() / 3600).to_numpy()
+    window_length_hrs = ((end_datetime - start_datetime).dt.total_seconds() / 3600).to_numpy()
+    pickup_hour = start_datetime.dt.hour.to_numpy()
+    is_weekend = (start_datetime.dt.weekday >= 5).to_numpy()
+
+    # Get the weather condition and temperature of each collection date from the saved weather
+    daily = weather.drop_duplicates('date').set_index('date')
+    dates = start_datetime.dt.strftime('%Y-%m-%d')
+    missing = ~dates.isin(daily.index)
+    if missing.any():
+        raise ValueError(f"No weather data for {sorted(dates[missing].unique())}")
+    condition = daily['condition'].str.strip().reindex(dates).to_numpy()
+    temperature = daily['avgtemp_c'].reindex(dates).to_numpy(dtype=np.float64)
+
+    raw = pd.DataFrame({
+        'discount': discount,
+        'price': price,
+        'weather': condition,
+        'category': bundles['category'].to_numpy(),
+        'temperature': temperature,
+        'day': start_datetime.dt.day_name().to_numpy(),
+        'lead_time': lead_time_hrs,
+        'window_length': window_length_hrs,
+        'time_of_day': pickup_hour
+    })
 
     # Normalise all the factors
-    normalised_discount = discount
-    normalised_price = normalise_price(price)
-    normalised_weather = normalise_weather(condition)
-    normalised_category = normalise_category(category)
-    normalised_temperature = normalise_temperature(temperature)
-    normalised_day = 1.0 if is_weekend else 0.7
-    normalised_lead_time = normalise_lead_time(lead_time_hrs)
-    normalised_window_length = normalise_window_length(window_length_hrs)
-    normalised_time_of_day = normalise_time_of_day(pickup_hour)
-
+    normalised = pd.DataFrame({
+        'discount': discount,
+        'price': normalise_price(price),
+        'weather': normalise_lookup(pd.Series(condition), normalised_weather, 'condition'),
+        'category': normalise_lookup(
+            bundles['category'].reset_index(drop=True), normalised_categories, 'category'
+        ),
+        'temperature': normalise_temperature(temperature),
+        'day_of_week': np.where(is_weekend, 1.0, 0.7),
+        'lead_time': normalise_lead_time(lead_time_hrs),
+        'window_length': normalise_window_length(window_length_hrs),
+        'time_of_day': normalise_time_of_day(pickup_hour)
+    })
+
+    return raw, normalised
+
+
+def calculate_decision(normalised, weights, thresholds):
+    """
+    Calculates a decision for every bundle from the normalised factors surrounding it.
+    :param normalised: Dataframe of the normalised factors.
+    :param weights: The weights of the factors.
+    :param thresholds: Array with the threshold of each decision.
+    :return: Bool array indicating if score > threshold.
+    """
     # Get the sum of multiplying all the normalised factors by their weights
-    score = (
-            (normalised_discount * weights['discount']) +
-            (normalised_price * weights['price']) +
-            (normalised_weather * weights['weather']) +
-            (normalised_category * weights['category']) +
-            (normalised_temperature * weights['temperature']) +
-            (normalised_day * weights['day_of_week']) +
-            (normalised_lead_time * weights['lead_time']) +
-            (normalised_window_length * weights['window_length']) +
-            (normalised_time_of_day * weights['time_of_day'])
-    )
-
-    # Create a dictionary of the raw factors if create_dataset is true
-    if create_dataset_entry:
-        dataset_entry = {
-            'discount': discount,
-            'price': price,
-            'weather': condition,
-            'category': category,
-            'temperature': temperature,
-            'day': start_datetime.strftime('%A'),
-            'lead_time': lead_time_hrs,
-            'window_length': window_length_hrs,
-            'time_of_day': pickup_hour
-        }
-
-        return score > threshold, dataset_entry
+    score = normalised[list(weights)].to_numpy() @ np.array(list(weights.values()))
+    return score > thresholds
 
-    return score > threshold
 
-
-def simulate_reservation(bundle, user_id):
+def simulate_reservations(bundles, users, weather, normalised_weather, normalised_categories, seed=RANDOM_SEED):
     """
-    Simulates whether a given bundle will be reserved and then if it will be collected.
-    :param bundle: The bundle.
-    :param user_id: ID of the user.
-    :return: Either reservation dictionary or None and dataset entry dictionary.
+    Simulates whether each bundle will be reserved and then if it will be collected.
+    :param bundles: Dataframe of bundles.
+    :param users: Dataframe of users, each bundle is reserved by a random one.
+    :param weather: Dataframe of the daily weather.
+    :param normalised_weather: Dataframe of the normalised value of each weather condition.
+    :param normalised_categories: Dataframe of the normalised value of each category.
+    :param seed: Random seed so every run gives the same results.
+    :return: Dataframe of reservations and dataframe of the ML dataset with one row per bundle.
     """
-
-    # The weights for the reservation decision. The discount and price are the two main decision factors.
-    reservation_weights = {
-        'discount': 0.3,
-        'price': 0.15,
-        'weather': 0.15,
-        'lead_time': 0.1,
-        'temperature': 0.1,
-        'day_of_week': 0.05,
-        'window_length': 0.05,
-        'time_of_day': 0.05,
-        'category': 0.05
-    }
+    rng = np.random.default_rng(seed)
+    n_bundles = len(bundles)
+    bundles = bundles.reset_index(drop=True)
+    raw, normalised = bundle_factors(bundles, weather, normalised_weather, normalised_categories)
 
     # Adds randomness so each decision is not defined solely by the factor weights
-    threshold = 0.5 + random.uniform(-0.05, 0.05)
-
-    is_reserved, dataset_entry = calculate_decision(bundle, reservation_weights, threshold, True)
-    dataset_entry['is_reserved'] = is_reserved
-
-    # The weights for the collection decision. The weather conditions and temperature are the two main decision factors.
-    collection_weights = {
-        'weather': 0.3,
-        'temperature': 0.15,
-        'window_length': 0.15,
-        'day_of_week': 0.1,
-        'time_of_day': 0.1,
-        'lead_time': 0.05,
-        'discount': 0.05,
-        'price': 0.05,
-        'category': 0.05
-    }
-
-    # If the bundle is reserved the collection decision is then calculated
-    if is_reserved:
-        threshold = 0.5 + random.uniform(-0.05, 0.05)
-        is_collected = calculate_decision(bundle, collection_weights, threshold, False)
-        dataset_entry['is_collected'] = is_collected
-    else:
-        # If the bundle is not reserved the function returns early and does not return an entry for the reservation dataset
-        dataset_entry['is_collected'] = False
-        return None, dataset_entry
-
-    # If the collection decision is true the status is set to COLLECTED to match the enum used in the database
-    if is_collected:
-        status = 'COLLECTED'
-    else:
-        status = 'NO_SHOW'
-
-    reservation_id = uuid.uuid4()
-    bundle_id = bundle['bundle_id']
-
-    posting_timestamp = datetime.fromisoformat(bundle['posting_time']).timestamp()
-    collection_start_timestamp = datetime.fromisoformat(bundle['collection_start']).timestamp()
-    collection_end_timestamp = datetime.fromisoformat(bundle['collection_end']).timestamp()
-
-    # A random reservation time is chosen between the posting time and collection end time
-    reservation_time_unix = random.uniform(posting_timestamp, collection_end_timestamp - 3600)
-    reservation_time = datetime.fromtimestamp(reservation_time_unix).isoformat()
-
-    # A random collection time is chosen between the collection start time or reservation time and collection end time
-    collection_time_unix = random.uniform(max(reservation_time_unix, collection_start_timestamp), collection_end_timestamp)
-    collection_time = datetime.fromtimestamp(collection_time_unix).isoformat()
+    user_ids = users['user_id'].to_numpy()[rng.integers(0, len(users), n_bundles)]
+    is_reserved = calculate_decision(normalised, RESERVATION_WEIGHTS, 0.5 + rng.uniform(-0.05, 0.05, n_bundles))
+    is_collected = is_reserved & calculate_decision(
+        normalised, COLLECTION_WEIGHTS, 0.5 + rng.uniform(-0.05, 0.05, n_bundles)
+    )
 
-    reservation = {
-        'reservation_id': reservation_id,
-        'bundle_id': bundle_id,
-        'user_id': user_id,
-        'amount_due': bundle['price'],
-        'reservation_time': reservation_time,
-        'collection_time': collection_time,
-        'collection_status': status,
-    }
+    dataset = raw.assign(is_reserved=is_reserved, is_collected=is_collected)
 
-    return reservation, dataset_entry
+    # Only reserved bundles get a reservation, a collection decision of true sets the status to COLLECTED to match the enum used in the database
+    reserved = bundles[is_reserved]
+    n_reservations = len(reserved)
+    post_datetime = pd.to_datetime(reserved['posting_time'], format=TIME_FORMAT)
+    start_datetime = pd.to_datetime(reserved['collection_start'], format=TIME_FORMAT)
+    end_datetime = pd.to_datetime(reserved['collection_end'], format=TIME_FORMAT)
 
+    # A random reservation time is chosen between the posting time and an hour before the collection end time
+    reservation_time = post_datetime + rng.uniform(0, 1, n_reservations) * (
+        end_datetime - pd.Timedelta(hours=1) - post_datetime
+    )
 
-def generate_reservations():
+    # A random collection time is chosen between the collection start time or reservation time and collection end time
+    earliest_collection = reservation_time.where(reservation_time > start_datetime, start_datetime)
+    collection_time = earliest_collection + rng.uniform(0, 1, n_reservations) * (end_datetime - earliest_collection)
+
+    # Reservation ids are drawn from the seeded generator too, so every run writes the same file
+    id_bytes = rng.integers(0, 256, (n_reservations, 16), dtype=np.uint8)
+    reservation_ids = [uuid.UUID(bytes=row.tobytes(), version=4) for row in id_bytes]
+
+    reservations = pd.DataFrame({
+        'reservation_id': reservation_ids,
+        'bundle_id': reserved['bundle_id'].to_numpy(),
+        'user_id': user_ids[is_reserved],
+        'amount_due': reserved['price'].to_numpy(),
+        'reservation_time': reservation_time.dt.strftime('%Y-%m-%dT%H:%M:%S.%f').to_numpy(),
+        'collection_time': collection_time.dt.strftime('%Y-%m-%dT%H:%M:%S.%f').to_numpy(),
+        'collection_status': np.where(is_collected[is_reserved], 'COLLECTED', 'NO_SHOW'),
+    })
+
+    return reservations, dataset
+
+
+def generate_reservations(bundles_path=BUNDLES_FILE, users_path=USERS_FILE, weather_path=WEATHER_FILE,
+                          normalised_weather_path=NORMALISED_WEATHER_FILE,
+                          normalised_categories_path=NORMALISED_CATEGORIES_FILE,
+                          reservations_path=RESERVATIONS_FILE, dataset_path=DATASET_FILE):
     """
-    Iterates through each bundle and simulates reservation and collections for each one
+    Simulates reservations and collections for every bundle and saves the reservations and the ML dataset.
+    :param bundles_path: CSV file of the bundles.
+    :param users_path: CSV file of the users.
+    :param weather_path: CSV file of the daily weather.
+    :param normalised_weather_path: CSV file of the normalised value of each weather condition.
+    :param normalised_categories_path: CSV file of the normalised value of each category.
+    :param reservations_path: CSV file the reservations are written to.
+    :param dataset_path: CSV file the ML dataset is written to.
+    :return: Dataframe of reservations and dataframe of the ML dataset.
     """
 
     print("Generating Reservations...")
 
-    users_list = USERS.to_dict('records')
-
-    reservations = []
-    dataset = []
-
-    # Iterates through each bundle
-    for _, bundle in BUNDLES.iterrows():
-        user_id = random.choice(users_list)['user_id']
-        reservation, dataset_entry = simulate_reservation(bundle, user_id)
-
-        dataset.append(dataset_entry)
-
-        # If a reservation occurs the reservation dictionary is added to the list of all reservations
-        if reservation:
-            reservations.append(reservation)
-
-    # Converts list of dictionaries to dataframe
-    dataset_df = pd.DataFrame(dataset)
-    current_dir = Path(__file__).resolve().parent
-    target_dir = current_dir.parent / 'src' / 'ml'
-    file_path = target_dir / 'ml.csv'
-    dataset_df.to_csv(file_path, index=False)
+    reservations_df, dataset_df = simulate_reservations(
+        pd.read_csv(bundles_path), pd.read_csv(users_path), pd.read_csv(weather_path),
+        pd.read_csv(normalised_weather_path), pd.read_csv(normalised_categories_path)
+    )
 
-    reservations_df = pd.DataFrame(reservations)
-    reservations_df.to_csv('database_files/reservations.csv', index=False)
+    dataset_df.to_csv(dataset_path, index=False)
+    reservations_df.to_csv(reservations_path, index=False)
     print(f"Generated {len(reservations_df)} reservations")
 
+    return reservations_df, dataset_df
+
 
 if __name__ == "__main__":
-    generate_reservations()
\ No newline at end of file
+    generate_reservations()
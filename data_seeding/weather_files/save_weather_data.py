@@ -53,5 +53,25 @@ def save_weather_data(location):
     # Save to a CSV file using the name previously established
     df.to_csv(df_name, index=False)
 
+def save_climatology(location):
+    """
+    Saves the typical weather for each month, used by the forecast service when the weather API is unavailable.
+    :param location: The name of the location, its weather data must already have been saved.
+    :return: None: The CSV file is saved as 'src/ml/climatology.csv'
+    """
+
+    df = pd.read_csv(f"weather_data_{location.lower()}.csv")
+    df["month"] = pd.to_datetime(df["date"]).dt.month
+    df["condition"] = df["condition"].str.strip()
+
+    # Most common condition and average temperature for each month
+    climatology = df.groupby("month").agg(
+        condition=("condition", lambda conditions: conditions.mode().iloc[0]),
+        temperature=("avgtemp_c", "mean")
+    ).round({"temperature": 1}).reset_index()
+
+    climatology.to_csv(os.path.join("..", "..", "src", "ml", "climatology.csv"), index=False)
+
 if __name__ == "__main__":
-    save_weather_data("Exeter")
\ No newline at end of file
+    save_weather_data("Exeter")
+    save_climatology("Exeter")
\ No newline at end of file
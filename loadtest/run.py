@@ -0,0 +1,281 @@
+"""
+End-to-end load test of the forecast service against local stand-ins for Postgres and the weather API.
+
+Run from the repository root with:
+    python -m loadtest.run --rps 50 --duration 30 --simulate-ratio 0.3 --weather-latency-ms 80
+
+The service is started with uvicorn in a subprocess, reading bundles from a seeded SQLite database and the weather
+from a fake weather API. Requests are sent on a fixed schedule at the target rate, regardless of how quickly the
+service answers, and each latency is measured from when the request was due to be sent so queueing inside the
+service is not hidden. Any other service setting, such as INFERENCE_BACKEND or BATCH_MAX_WAIT_MS, can be set in the
+environment and is passed through to the service.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+import httpx
+import jwt
+import pandas as pd
+
+from .stand_ins import ROOT_DIR, DATASET_CSV, FakeWeatherServer, seed_database
+
+FEATURES = ['discount', 'price', 'weather', 'category', 'temperature', 'day', 'lead_time', 'window_length', 'time_of_day']
+
+
+def free_port():
+    """
+    :return: A free local TCP port.
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_service(port, database_path, weather_url, secret_key, workers, extra_env):
+    """
+    Starts the service with uvicorn, configured to use the stand-ins.
+    :param port: Port to serve on.
+    :param database_path: SQLite database file.
+    :param weather_url: Base URL of the fake weather API.
+    :param secret_key: Raw JWT signing key.
+    :param workers: Number of uvicorn worker processes.
+    :param extra_env: Further environment variables for the service.
+    :return: The uvicorn process.
+    """
+    env = dict(
+        os.environ,
+        ASYNC_DATABASE_URL=f"sqlite+aiosqlite:///{database_path}",
+        WEATHER_API_URL=weather_url,
+        WEATHER_API_KEY="load-test",
+        JWT_SECRET_KEY=base64.b64encode(secret_key).decode(),
+        **extra_env
+    )
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "src.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=ROOT_DIR, env=env
+    )
+
+
+def wait_until_ready(base_url, process, timeout=60):
+    """
+    Waits for the service to report it is ready, with the models warmed up and database connections open.
+    :raises: RuntimeError if the service exits or does not start in time.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Service exited with code {process.returncode}")
+        try:
+            if httpx.get(f"{base_url}/forecast/actuator/ready", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("Service did not start in time")
+
+
+class LoadResults:
+    """
+    Latencies and outcomes of every request, grouped by endpoint.
+    """
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.outcomes = defaultdict(Counter)
+        self.dropped = 0
+
+    def record(self, endpoint, latency, outcome):
+        self.latencies[endpoint].append(latency)
+        self.outcomes[endpoint][outcome] += 1
+
+    def summary(self, elapsed):
+        """
+        :param elapsed: Seconds the test ran for.
+        :return: Dictionary of throughput, latency percentiles and error rate for each endpoint and overall.
+        """
+        groups = dict(self.latencies)
+        groups['all'] = [latency for latencies in self.latencies.values() for latency in latencies]
+        outcomes = dict(self.outcomes)
+        outcomes['all'] = sum(self.outcomes.values(), Counter())
+
+        summary = {}
+        for endpoint, latencies in groups.items():
+            latencies = sorted(latencies)
+            total = len(latencies)
+            successes = outcomes[endpoint].get('200', 0)
+            summary[endpoint] = {
+                'requests': total,
+                'throughput_rps': successes / elapsed,
+                'error_rate': (total - successes) / total if total else 0.0,
+                'outcomes': dict(outcomes[endpoint]),
+                **{f'p{q}_ms': percentile(latencies, q) * 1000 for q in (50, 95, 99)}
+            }
+        summary['all']['dropped'] = self.dropped
+        return summary
+
+
+def percentile(sorted_values, q):
+    """
+    Gets the q-th percentile of sorted values using the nearest rank.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(q / 100 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+async def drive(base_url, bundles, rows, tokens, rps, duration, simulate_ratio, max_in_flight, seed=3):
+    """
+    Sends requests at a fixed rate and records how each one went.
+    :param base_url: URL of the service.
+    :param bundles: Dataframe of bundles, each predict request picks one and uses its vendors token.
+    :param rows: Input dictionaries used for simulate requests.
+    :param tokens: Dictionary of vendor ID to JWT.
+    :param rps: Target requests per second.
+    :param duration: Seconds to send requests for.
+    :param simulate_ratio: Fraction of requests sent to /simulate, the rest go to /predict/{bundle_id}.
+    :param max_in_flight: Requests allowed to be waiting at once, further requests are dropped and counted.
+    :return: The LoadResults and the seconds the test took.
+    """
+    rng = random.Random(seed)
+    results = LoadResults()
+    bundle_pairs = list(zip(bundles['bundle_id'], bundles['vendor_id']))
+    vendor_ids = list(tokens)
+    in_flight = set()
+
+    limits = httpx.Limits(max_connections=max_in_flight, max_keepalive_connections=max_in_flight)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+
+        async def send(due, endpoint, request):
+            try:
+                response = await request()
+                outcome = str(response.status_code)
+            except httpx.HTTPError as e:
+                outcome = type(e).__name__
+            results.record(endpoint, time.perf_counter() - due, outcome)
+
+        started_at = time.perf_counter()
+        for i in range(int(rps * duration)):
+            due = started_at + i / rps
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            if len(in_flight) >= max_in_flight:
+                results.dropped += 1
+                continue
+
+            if rng.random() < simulate_ratio:
+                endpoint = 'simulate'
+                payload = rng.choice(rows)
+                headers = {"Authorization": f"Bearer {tokens[rng.choice(vendor_ids)]}"}
+                request = lambda payload=payload, headers=headers: client.post(
+                    "/forecast/simulate", json=payload, headers=headers
+                )
+            else:
+                endpoint = 'predict'
+                bundle_id, vendor_id = rng.choice(bundle_pairs)
+                headers = {"Authorization": f"Bearer {tokens[vendor_id]}"}
+                request = lambda bundle_id=bundle_id, headers=headers: client.get(
+                    f"/forecast/predict/{bundle_id}", headers=headers
+                )
+
+            task = asyncio.create_task(send(due, endpoint, request))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+
+        if in_flight:
+            await asyncio.gather(*in_flight)
+        elapsed = time.perf_counter() - started_at
+
+    return results, elapsed
+
+
+def print_summary(summary):
+    """
+    Prints the results as a table.
+    """
+    print(f"{'endpoint':<10}{'requests':>10}{'ok rps':>10}{'errors':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for endpoint, stats in summary.items():
+        print(f"{endpoint:<10}{stats['requests']:>10}{stats['throughput_rps']:>10.1f}{stats['error_rate']:>9.1%}"
+              f"{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}")
+    for endpoint, stats in summary.items():
+        print(f"{endpoint} outcomes: {stats['outcomes']}")
+    print(f"dropped (over --max-in-flight): {summary['all']['dropped']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the forecast service against local stand-ins.")
+    parser.add_argument("--rps", type=float, default=20, help="Target requests per second.")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to send requests for.")
+    parser.add_argument("--simulate-ratio", type=float, default=0.3, help="Fraction of requests sent to /simulate.")
+    parser.add_argument("--max-in-flight", type=int, default=500, help="Requests allowed to be waiting at once.")
+    parser.add_argument("--workers", type=int, default=1, help="Uvicorn worker processes.")
+    parser.add_argument("--weather-latency-ms", type=float, default=50, help="Base latency of the fake weather API.")
+    parser.add_argument("--weather-jitter-ms", type=float, default=20, help="Random latency added to each weather call.")
+    parser.add_argument("--weather-error-rate", type=float, default=0.0, help="Fraction of weather calls that fail.")
+    parser.add_argument("--weather-cache-ttl", type=float, default=None,
+                        help="Weather cache ttl of the service, 0 sends every request to the weather API.")
+    parser.add_argument("--bundles-per-vendor", type=int, default=50,
+                        help="Bundles generated per vendor when bundles.csv does not exist.")
+    parser.add_argument("--output", help="File the results are written to as JSON.")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="forecast-loadtest-")
+    database_path = os.path.join(workdir, "forecast.db")
+    bundles = seed_database(database_path, args.bundles_per_vendor)
+    rows = pd.read_csv(DATASET_CSV, usecols=FEATURES, nrows=5000)
+    rows['time_of_day'] = rows['time_of_day'].astype(int)
+    rows = rows.to_dict('records')
+
+    weather = FakeWeatherServer(args.weather_latency_ms, args.weather_jitter_ms, args.weather_error_rate).start()
+
+    secret_key = os.urandom(32)
+    tokens = {
+        vendor_id: jwt.encode({"sub": vendor_id, "exp": time.time() + 86400}, secret_key, algorithm="HS256")
+        for vendor_id in bundles['vendor_id'].unique()
+    }
+
+    extra_env = {}
+    if args.weather_cache_ttl is not None:
+        extra_env['WEATHER_CACHE_TTL'] = str(args.weather_cache_ttl)
+
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    service = start_service(port, database_path, weather.url, secret_key, args.workers, extra_env)
+
+    try:
+        wait_until_ready(base_url, service)
+        print(f"Sending {args.rps:g} requests per second for {args.duration:g}s to {base_url}")
+        results, elapsed = asyncio.run(drive(
+            base_url, bundles, rows, tokens, args.rps, args.duration, args.simulate_ratio, args.max_in_flight
+        ))
+    finally:
+        service.terminate()
+        service.wait(timeout=30)
+        weather.stop()
+
+    summary = results.summary(elapsed)
+    print_summary(summary)
+    print(f"weather API calls: {weather.requests}")
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({'config': vars(args), 'elapsed_s': elapsed, 'weather_calls': weather.requests,
+                       'results': summary}, file, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
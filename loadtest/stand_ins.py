@@ -0,0 +1,192 @@
+"""
+Local stand-ins for the dependencies of the forecast service: a SQLite database in place of Postgres and a fake
+weather API with configurable latency.
+"""
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+DATABASE_FILES_DIR = os.path.join(ROOT_DIR, "data_seeding", "database_files")
+BUNDLES_CSV = os.path.join(DATABASE_FILES_DIR, "bundles.csv")
+VENDORS_CSV = os.path.join(DATABASE_FILES_DIR, "vendors.csv")
+DATASET_CSV = os.path.join(ROOT_DIR, "src", "ml", "dataset.csv")
+
+# Conditions returned by the fake weather API
+WEATHER_CONDITIONS = ["Sunny", "Partly cloudy", "Overcast", "Light rain", "Moderate rain", "Mist"]
+
+SCHEMA = """
+CREATE TABLE vendor (
+    vendor_id TEXT PRIMARY KEY,
+    name TEXT,
+    postcode TEXT
+);
+CREATE TABLE bundles (
+    bundle_id TEXT PRIMARY KEY,
+    vendor_id TEXT REFERENCES vendor (vendor_id),
+    name TEXT,
+    description TEXT,
+    retail_price REAL,
+    price REAL,
+    category TEXT,
+    posting_time TEXT,
+    collection_start TEXT,
+    collection_end TEXT
+);
+CREATE INDEX bundles_vendor ON bundles (vendor_id, collection_end);
+"""
+
+
+def synthesize_bundles(vendors, bundles_per_vendor=50, seed=12):
+    """
+    Generates upcoming bundles from rows of the training dataset, used when bundles.csv has not been generated.
+    :param vendors: Dataframe of vendors.
+    :param bundles_per_vendor: Number of bundles for each vendor.
+    :param seed: Random seed so every run uses the same bundles.
+    :return: Dataframe with the columns of the bundles table.
+    """
+    rng = random.Random(seed)
+    rows = pd.read_csv(DATASET_CSV, nrows=5000).to_dict('records')
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    bundles = []
+    for vendor_id in vendors['vendor_id']:
+        for _ in range(bundles_per_vendor):
+            row = rng.choice(rows)
+            collection_start = today + timedelta(days=rng.randint(1, 14), hours=int(row['time_of_day']))
+            bundles.append({
+                'bundle_id': str(uuid.UUID(int=rng.getrandbits(128))),
+                'vendor_id': vendor_id,
+                'name': f"{row['category']} bundle",
+                'description': "Load test bundle",
+                'retail_price': round(row['price'] / max(1 - row['discount'], 0.05), 2),
+                'price': row['price'],
+                'category': row['category'],
+                'posting_time': collection_start - timedelta(hours=row['lead_time']),
+                'collection_start': collection_start,
+                'collection_end': collection_start + timedelta(hours=row['window_length'])
+            })
+    return pd.DataFrame(bundles)
+
+
+def seed_database(path, bundles_per_vendor=50):
+    """
+    Creates a SQLite database with the vendor and bundles tables the service reads.
+    Bundles come from data_seeding/database_files/bundles.csv, or are generated if it has not been created yet.
+    :param path: File the database is written to.
+    :param bundles_per_vendor: Bundles generated for each vendor when bundles.csv does not exist.
+    :return: Dataframe of the seeded bundles.
+    """
+    vendors = pd.read_csv(VENDORS_CSV, usecols=['vendor_id', 'name', 'postcode'])
+
+    if os.path.exists(BUNDLES_CSV):
+        bundles = pd.read_csv(BUNDLES_CSV)
+    else:
+        print(f"{BUNDLES_CSV} not found, generating {bundles_per_vendor} bundles per vendor")
+        bundles = synthesize_bundles(vendors, bundles_per_vendor)
+
+    columns = ['bundle_id', 'vendor_id', 'name', 'description', 'retail_price', 'price', 'category',
+               'posting_time', 'collection_start', 'collection_end']
+    bundles = bundles[columns].copy()
+    for column in ('posting_time', 'collection_start', 'collection_end'):
+        bundles[column] = pd.to_datetime(bundles[column]).dt.strftime('%Y-%m-%d %H:%M:%S')
+
+    if os.path.exists(path):
+        os.remove(path)
+
+    with sqlite3.connect(path) as connection:
+        connection.executescript(SCHEMA)
+        connection.executemany("INSERT INTO vendor VALUES (?, ?, ?)", vendors.itertuples(index=False))
+        connection.executemany(
+            f"INSERT INTO bundles VALUES ({', '.join('?' * len(columns))})", bundles.itertuples(index=False)
+        )
+
+    return bundles
+
+
+class FakeWeatherServer:
+    """
+    Serves the /v1/current.json endpoint of the weather API from a background thread.
+    Every response is delayed by the latency plus a random jitter, and a fraction of requests can fail.
+    """
+
+    def __init__(self, latency_ms=50, jitter_ms=20, error_rate=0.0, seed=7):
+        """
+        :param latency_ms: Base response time.
+        :param jitter_ms: Maximum random time added to each response.
+        :param error_rate: Fraction of requests answered with a 503.
+        :param seed: Random seed for the conditions, jitter and errors.
+        """
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.error_rate = error_rate
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def _handler(self):
+        """
+        Creates the request handler class bound to this server.
+        """
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keeps connections open so the services connection pool behaves as it does with the real API
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                with fake._lock:
+                    fake.requests += 1
+                    delay = fake.latency + fake._random.uniform(0, fake.jitter)
+                    fail = fake._random.random() < fake.error_rate
+                    condition = fake._random.choice(WEATHER_CONDITIONS)
+                    temperature = round(fake._random.uniform(2, 24), 1)
+                time.sleep(delay)
+
+                if fail:
+                    self.send_response(503)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                body = json.dumps({'current': {'temp_c': temperature, 'condition': {'text': condition}}}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        """
+        Starts serving on a free local port.
+        """
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="fake-weather", daemon=True).start()
+        return self
+
+    def stop(self):
+        """
+        Stops serving.
+        """
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,255 @@
+"""
+Flat binary artifact holding the compiled reservation and collection models.
+
+Export it from the fitted pipelines, from the repository root, with:
+    python -m src.artifact [--model-dir src/ml] [--output src/ml/forecast_model.bin]
+
+The file starts with a fixed 64 byte header: the magic bytes, the schema version, the lengths of the metadata and
+data sections and a SHA-256 checksum of both. The metadata is JSON holding the encoder vocabularies, column names
+and scalar constants, and describing where each array is stored. The data section holds the scaler constants and
+tree arrays, each aligned to 64 bytes. Loading memory-maps the file and reads every array in place, so processes
+loading the same file share one copy in the page cache and nothing is unpickled.
+"""
+import argparse
+import hashlib
+import json
+import os
+import struct
+import sys
+
+import numpy as np
+
+from .predictor import CompiledPredictor, CompiledPreprocessor, CompiledEnsemble
+from .trees import FlatForest
+
+ARTIFACT_FILE = "forecast_model.bin"
+
+MAGIC = b"FCSTMDL\x00"
+
+# Bump when the layout of the header, metadata or arrays changes
+SCHEMA_VERSION = 1
+
+# Magic, schema version, reserved, metadata length, data length and checksum
+HEADER = struct.Struct("<8sII QQ 32s")
+ALIGNMENT = 64
+
+
+class ArtifactError(ValueError):
+    """
+    Raised when a model artifact is not a valid file of the supported schema version.
+    """
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+class _ArrayWriter:
+    """
+    Lays out arrays in the data section and records where each one is.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def add(self, array):
+        """
+        :return: Dictionary describing the array, stored in the metadata.
+        """
+        array = np.ascontiguousarray(array)
+        offset = _align(self.size)
+        self.chunks.append((offset, array.tobytes()))
+        self.size = offset + array.nbytes
+        return {'offset': offset, 'dtype': array.dtype.str, 'shape': list(array.shape)}
+
+    def tobytes(self):
+        data = bytearray(self.size)
+        for offset, chunk in self.chunks:
+            data[offset:offset + len(chunk)] = chunk
+        return bytes(data)
+
+
+def _describe_preprocessor(preprocessor, arrays):
+    return {
+        'input_columns': [str(column) for column in preprocessor.input_columns],
+        'categorical': [
+            {'column': str(column), 'categories': [_plain(category) for category in lookup]}
+            for column, lookup in preprocessor.categorical
+        ],
+        'numeric_columns': [str(column) for column in preprocessor.numeric_columns],
+        'numeric_offset': int(preprocessor.numeric_offset),
+        'n_outputs': int(preprocessor.n_outputs),
+        'log_mask': arrays.add(preprocessor.log_mask),
+        'mean': arrays.add(np.asarray(preprocessor.mean, dtype=np.float64)),
+        'scale': arrays.add(np.asarray(preprocessor.scale, dtype=np.float64))
+    }
+
+
+def _describe_ensemble(ensemble, arrays):
+    forest = ensemble.forest
+    return {
+        'classes': [_plain(value) for value in ensemble.classes],
+        'max_depth': int(forest.max_depth),
+        'init_raw': float(forest.init_raw),
+        'feature': arrays.add(forest.feature.astype(np.int64)),
+        'threshold': arrays.add(forest.threshold),
+        'value': arrays.add(forest.value)
+    }
+
+
+def _plain(value):
+    """
+    Converts NumPy scalars to the Python values JSON can store.
+    """
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def export_artifact(predictor, path, version):
+    """
+    Writes a compiled predictor to an artifact file, replacing it only once fully written.
+    :param predictor: The CompiledPredictor.
+    :param path: File to write.
+    :param version: Model version stored in the metadata.
+    :return: Size of the file in bytes.
+    """
+    arrays = _ArrayWriter()
+    shared = predictor.collection_preprocessor is predictor.reservation_preprocessor
+    reservation_preprocessor = _describe_preprocessor(predictor.reservation_preprocessor, arrays)
+    metadata = {
+        'version': version,
+        'reservation': {
+            'preprocessor': reservation_preprocessor,
+            'ensemble': _describe_ensemble(predictor.reservation_ensemble, arrays)
+        },
+        'collection': {
+            'preprocessor': None if shared else _describe_preprocessor(predictor.collection_preprocessor, arrays),
+            'ensemble': _describe_ensemble(predictor.collection_ensemble, arrays)
+        }
+    }
+
+    encoded = json.dumps(metadata).encode()
+    metadata_bytes = encoded + b" " * (_align(HEADER.size + len(encoded)) - HEADER.size - len(encoded))
+    data = arrays.tobytes()
+    checksum = hashlib.sha256(metadata_bytes + data).digest()
+
+    with open(path + ".tmp", "wb") as file:
+        file.write(HEADER.pack(MAGIC, SCHEMA_VERSION, 0, len(metadata_bytes), len(data), checksum))
+        file.write(metadata_bytes)
+        file.write(data)
+    os.replace(path + ".tmp", path)
+    return HEADER.size + len(metadata_bytes) + len(data)
+
+
+def _read_array(buffer, spec):
+    """
+    Gets a read-only view of an array in the mapped data section.
+    """
+    dtype = np.dtype(spec['dtype'])
+    count = int(np.prod(spec['shape'], dtype=np.int64))
+    end = spec['offset'] + count * dtype.itemsize
+    if end > len(buffer):
+        raise ArtifactError("Array extends past the end of the artifact")
+    return buffer[spec['offset']:end].view(dtype).reshape(spec['shape'])
+
+
+def _load_preprocessor(spec, buffer):
+    categorical = []
+    offset = 0
+    for column in spec['categorical']:
+        categorical.append((column['column'], {
+            category: offset + i for i, category in enumerate(column['categories'])
+        }))
+        offset += len(column['categories'])
+
+    return CompiledPreprocessor(
+        spec['input_columns'], categorical, spec['numeric_columns'], spec['numeric_offset'],
+        _read_array(buffer, spec['log_mask']), _read_array(buffer, spec['mean']), _read_array(buffer, spec['scale']),
+        spec['n_outputs']
+    )
+
+
+def _load_ensemble(spec, buffer):
+    forest = FlatForest(
+        _read_array(buffer, spec['feature']), _read_array(buffer, spec['threshold']),
+        _read_array(buffer, spec['value']), spec['max_depth'], spec['init_raw']
+    )
+    return CompiledEnsemble(forest, np.array(spec['classes']))
+
+
+def read_header(mapped):
+    """
+    Checks the header of a mapped artifact.
+    :param mapped: The artifact as a uint8 array.
+    :return: Metadata length, data length and checksum.
+    :raises: ArtifactError if the file is not an artifact of the supported schema version.
+    """
+    if len(mapped) < HEADER.size:
+        raise ArtifactError("File is too short to be a model artifact")
+    magic, schema_version, _, metadata_length, data_length, checksum = HEADER.unpack(mapped[:HEADER.size].tobytes())
+    if magic != MAGIC:
+        raise ArtifactError("File is not a model artifact")
+    if schema_version != SCHEMA_VERSION:
+        raise ArtifactError(f"Artifact has schema version {schema_version}, this service reads {SCHEMA_VERSION}")
+    if HEADER.size + metadata_length + data_length != len(mapped):
+        raise ArtifactError("Artifact is truncated or has trailing data")
+    return metadata_length, data_length, checksum
+
+
+def load_artifact(path, verify=True):
+    """
+    Memory-maps an artifact and builds the compiled predictor on top of it without copying the arrays.
+    :param path: The artifact file.
+    :param verify: Check the checksum, which reads the whole file once.
+    :return: The CompiledPredictor and the model version stored in the artifact.
+    :raises: ArtifactError if the file is not a valid artifact of the supported schema version.
+    """
+    mapped = np.memmap(path, dtype=np.uint8, mode='r')
+    metadata_length, _, checksum = read_header(mapped)
+
+    payload = mapped[HEADER.size:]
+    if verify and hashlib.sha256(payload).digest() != checksum:
+        raise ArtifactError("Artifact checksum does not match, the file is corrupt")
+
+    metadata = json.loads(payload[:metadata_length].tobytes())
+    data = payload[metadata_length:]
+
+    reservation_preprocessor = _load_preprocessor(metadata['reservation']['preprocessor'], data)
+    collection_spec = metadata['collection']['preprocessor']
+    collection_preprocessor = (
+        reservation_preprocessor if collection_spec is None else _load_preprocessor(collection_spec, data)
+    )
+
+    predictor = CompiledPredictor(
+        reservation_preprocessor, _load_ensemble(metadata['reservation']['ensemble'], data),
+        collection_preprocessor, _load_ensemble(metadata['collection']['ensemble'], data)
+    )
+    return predictor, metadata['version']
+
+
+def main(argv=None):
+    from .registry import ModelRegistry
+
+    parser = argparse.ArgumentParser(description="Export the fitted pipelines as a memory-mappable artifact.")
+    parser.add_argument("--model-dir", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "ml"),
+                        help="Model directory of the service.")
+    parser.add_argument("--version", help="Version to export, defaults to the models in the model directory.")
+    parser.add_argument("--output", help=f"File to write, defaults to {ARTIFACT_FILE} in the version directory.")
+    args = parser.parse_args(argv)
+
+    # Loaded from the pickles, as an existing artifact would otherwise be exported from itself
+    registry = ModelRegistry(args.model_dir)
+    model_version = registry.load(args.version, use_artifact=False)
+    # Models such as the 'hist' engine cannot be compiled, the registry serves them with the sklearn pipelines
+    if model_version.compiled_predictor is None:
+        print(f"Skipping export, models of version {model_version.version} cannot be compiled")
+        return 0
+
+    output = args.output or os.path.join(registry.version_path(args.version), ARTIFACT_FILE)
+    size = export_artifact(model_version.compiled_predictor, output, model_version.version)
+    print(f"Exported version {model_version.version} to {output} ({size / 1024:.0f} KB)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
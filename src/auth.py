@@ -1,11 +1,17 @@
 import os
+import hmac
+import time
 import base64
-from fastapi import Depends, HTTPException, status
+import hashlib
+from fastapi import Depends, Header, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 import jwt
 from jwt.exceptions import InvalidTokenError
 from dotenv import load_dotenv
 
+from .cache import TTLCache
+from .metrics import time_stage
+
 # Load environment variables
 load_dotenv()
 
@@ -26,12 +32,33 @@ except Exception as e:
     raise
 
 ALGORITHM = "HS256"
+
+# Token for the admin endpoints, which are disabled when it is not set
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "").strip()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# Verified tokens are cached so repeat requests with the same token skip signature verification
+TOKEN_CACHE_ENABLED = os.getenv("TOKEN_CACHE_ENABLED", "true").lower() == "true"
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+
+# Longest time a token stays cached, entries also expire when the token itself does
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", "300"))
+
+# Wall clock timer so entries expire at exactly the tokens exp claim
+token_cache = TTLCache(ttl=TOKEN_CACHE_TTL if TOKEN_CACHE_ENABLED else 0, maxsize=TOKEN_CACHE_SIZE, timer=time.time)
+
+
+def clear_token_cache():
+    """
+    Forgets every verified token, for example after the signing key is rotated.
+    """
+    token_cache.clear()
+
 
-def get_current_vendor_id(token: str = Depends(oauth2_scheme)):
+async def get_current_vendor_id(token: str = Depends(oauth2_scheme)):
     """
-    FastAPI Dependency to validate the JWT string and extract the vendor ID.
+    FastAPI Dependency to validate the JWT string and extract the vendor ID. Runs on the event loop rather than the
+    threadpool, as cached tokens are a dictionary lookup and verifying an HS256 signature is quicker than the hand-off.
     :param token: The JWT string.
     :return: The vendor ID.
     :raises: HTTPException 401 if the token is invalid.
@@ -39,6 +66,17 @@ def get_current_vendor_id(token: str = Depends(oauth2_scheme)):
              HTTPException 422 if the token is valid but does not contain a vendor ID.
     """
 
+    with time_stage("auth"):
+        return _verify_token(token)
+
+
+def _verify_token(token):
+    """
+    Verifies the JWT string, using the verified token cache when the token has been seen before.
+    :param token: The JWT string.
+    :return: The vendor ID.
+    """
+
     # If the secret cannot be pulled from the environment variables raise HttpException 403
     if RAW_SECRET_KEY == "secret":
         raise HTTPException(
@@ -46,6 +84,12 @@ def get_current_vendor_id(token: str = Depends(oauth2_scheme)):
             detail="JWT Token Not Being Pulled from environment variables"
         )
 
+    # Keyed by a digest so the cache does not hold usable tokens
+    token_key = hashlib.sha256(token.encode()).digest()
+    vendor_id = token_cache.get(token_key)
+    if vendor_id is not None:
+        return vendor_id
+
     try:
         # Decode token and verify signature
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
@@ -57,6 +101,11 @@ def get_current_vendor_id(token: str = Depends(oauth2_scheme)):
                 status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
                 detail="Token is valid, but it has no User ID inside it."
             )
+
+        # Only cached until the token expires, tokens without an expiry are cached for the default ttl
+        expires_at = payload.get("exp")
+        ttl = TOKEN_CACHE_TTL if expires_at is None else min(TOKEN_CACHE_TTL, expires_at - time.time())
+        token_cache.set(token_key, vendor_id, ttl=ttl if token_cache.ttl > 0 else 0)
         return vendor_id
 
     except InvalidTokenError as e:
@@ -64,4 +113,17 @@ def get_current_vendor_id(token: str = Depends(oauth2_scheme)):
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=f"Auth Failed: Invalid token or signature",
             headers={"WWW-Authenticate": "Bearer"},
-        )
\ No newline at end of file
+        )
+
+
+def verify_admin_token(x_admin_token: str = Header(default="")):
+    """
+    FastAPI Dependency to protect the admin endpoints with the ADMIN_TOKEN shared secret.
+    :param x_admin_token: The X-Admin-Token request header.
+    :raises: HTTPException 403 if admin endpoints are disabled or the token does not match.
+    """
+    if not ADMIN_TOKEN or not hmac.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin token missing or invalid"
+        )
@@ -0,0 +1,185 @@
+import asyncio
+import time
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+# Upper bounds of the batch size histogram buckets
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+def input_may_be_at_fault(error):
+    """
+    Decides whether a failed batch is worth retrying one row at a time, which only helps when one of the inputs
+    caused the failure. A busy or unavailable service fails every row alike, so 503s are passed straight on.
+    :param error: The exception the batch raised.
+    :return: True if the rows should be retried alone.
+    """
+    return not (isinstance(error, HTTPException) and error.status_code == 503)
+
+
+class _Pending:
+    """
+    A single prediction waiting to be batched.
+    """
+
+    def __init__(self, input_data, future):
+        self.input_data = input_data
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+
+
+class MicroBatcher:
+    """
+    Collects concurrent single predictions and runs them as one batched inference.
+    When nothing else is queued or running a request is dispatched straight away, so there is no added latency at
+    low load. Under load, requests that arrive while a batch is running are collected for up to max_wait_ms or
+    until max_batch_size is reached, and each caller is handed back its own row.
+    """
+
+    def __init__(self, predict_rows, max_batch_size, max_wait_ms, run=run_in_threadpool,
+                 retry_rows=input_may_be_at_fault):
+        """
+        :param predict_rows: Function taking a list of input dictionaries and returning one result per input.
+        :param max_batch_size: Maximum number of predictions run together.
+        :param max_wait_ms: Longest time the first request of a batch waits for others to join it.
+        :param run: Coroutine function used to run predict_rows off the event loop.
+        :param retry_rows: Function deciding from the exception whether a failed batch is retried row by row.
+        """
+        self.predict_rows = predict_rows
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.run = run
+        self.retry_rows = retry_rows
+        self._queue = None
+        self._loop = None
+        self._consumer = None
+        self._running_batches = 0
+        self._dispatching = set()
+        self.batches = 0
+        self.rows = 0
+        self.batch_size_counts = {bucket: 0 for bucket in BATCH_SIZE_BUCKETS + (float('inf'),)}
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+
+    def _ensure_consumer(self):
+        """
+        Starts the consumer task on the running event loop if it is not already running there.
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._consumer is None or self._consumer.done():
+            self._queue = asyncio.Queue()
+            self._loop = loop
+            self._running_batches = 0
+            self._consumer = loop.create_task(self._consume())
+
+    async def submit(self, input_data):
+        """
+        Queues a prediction and waits for its result.
+        :param input_data: Dictionary containing input data such as discount, price, weather etc.
+        :return: The result for this input.
+        """
+        self._ensure_consumer()
+        pending = _Pending(input_data, self._loop.create_future())
+        self._queue.put_nowait(pending)
+        return await pending.future
+
+    async def _consume(self):
+        """
+        Forms batches from the queue and dispatches them.
+        """
+        while True:
+            batch = [await self._queue.get()]
+
+            # Only waits for more requests when the service is busy, otherwise the request is run straight away
+            if self._running_batches > 0 or not self._queue.empty():
+                deadline = batch[0].enqueued_at + self.max_wait
+                while len(batch) < self.max_batch_size:
+                    if not self._queue.empty():
+                        batch.append(self._queue.get_nowait())
+                        continue
+                    timeout = deadline - time.perf_counter()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+
+            self._running_batches += 1
+
+            # A reference is kept so the dispatch task is not garbage collected while it runs
+            task = asyncio.ensure_future(self._dispatch(batch))
+            self._dispatching.add(task)
+            task.add_done_callback(self._dispatching.discard)
+
+    async def _dispatch(self, batch):
+        """
+        Runs a batch and hands each caller its result.
+        """
+        started_at = time.perf_counter()
+        self._record(batch, started_at)
+
+        try:
+            try:
+                results = await self.run(self.predict_rows, [pending.input_data for pending in batch])
+                outcomes = [(result, None) for result in results]
+            except Exception as e:
+                if len(batch) == 1 or not self.retry_rows(e):
+                    outcomes = [(None, e)] * len(batch)
+                else:
+                    # One bad input should not fail everyone else's request, so the rows are retried alone, concurrently
+                    outcomes = await asyncio.gather(*(self._run_single(pending.input_data) for pending in batch))
+
+            for pending, (result, error) in zip(batch, outcomes):
+                if pending.future.done():
+                    continue
+                if error is not None:
+                    pending.future.set_exception(error)
+                else:
+                    pending.future.set_result(result)
+        finally:
+            self._running_batches -= 1
+
+    async def _run_single(self, input_data):
+        """
+        Runs one input on its own.
+        :return: Tuple of the result and the exception raised, one of which is None.
+        """
+        try:
+            return (await self.run(self.predict_rows, [input_data]))[0], None
+        except Exception as e:
+            return None, e
+
+    def _record(self, batch, started_at):
+        """
+        Updates the batch size and queue wait metrics.
+        """
+        self.batches += 1
+        self.rows += len(batch)
+        bucket = next(bucket for bucket in self.batch_size_counts if len(batch) <= bucket)
+        self.batch_size_counts[bucket] += 1
+
+        for pending in batch:
+            wait = started_at - pending.enqueued_at
+            self.queue_wait_total += wait
+            self.queue_wait_max = max(self.queue_wait_max, wait)
+
+    def stats(self):
+        """
+        :return: Dictionary of batch size and queue wait metrics.
+        """
+        return {
+            'batches': self.batches,
+            'rows': self.rows,
+            'mean_batch_size': self.rows / self.batches if self.batches else 0.0,
+            'batch_size_counts': {
+                ('+Inf' if bucket == float('inf') else str(bucket)): count
+                for bucket, count in self.batch_size_counts.items()
+            },
+            'mean_queue_wait_ms': self.queue_wait_total / self.rows * 1000 if self.rows else 0.0,
+            'max_queue_wait_ms': self.queue_wait_max * 1000,
+            'queue_depth': self._queue.qsize() if self._queue else 0,
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000
+        }
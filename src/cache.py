@@ -0,0 +1,118 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Thread-safe, size-bounded cache whose entries expire after a time-to-live.
+    Concurrent loads of the same missing key are collapsed into a single call of the loader.
+    """
+
+    def __init__(self, ttl, maxsize, timer=time.monotonic):
+        """
+        :param ttl: Seconds an entry stays valid. A ttl of 0 or less disables storing entries.
+        :param maxsize: Maximum number of entries kept, the least recently used entry is evicted first.
+        :param timer: Clock used to expire entries.
+        """
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.timer = timer
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._async_inflight = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _lookup(self, key):
+        """
+        Returns the cached value for key or None if it is missing or expired. Must be called holding the lock.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        value, expires_at = entry
+        if expires_at <= self.timer():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return entry
+
+    def get(self, key):
+        """
+        Gets a value from the cache.
+        :param key: The cache key.
+        :return: The cached value or None if there is no valid entry.
+        """
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        """
+        Stores a value in the cache, evicting the least recently used entry if the cache is full.
+        :param key: The cache key.
+        :param value: The value to store.
+        :param ttl: Optional time-to-live overriding the cache default.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = (value, self.timer() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    async def aget_or_load(self, key, loader):
+        """
+        Gets a value from the cache, awaiting loader to fill it on a miss.
+        Only one loader runs per key at a time, other callers await its result.
+        :param key: The cache key.
+        :param loader: Coroutine function taking no arguments that returns the value.
+        :return: The cached or freshly loaded value.
+        :raises: Any exception raised by the loader, which is passed to every waiting caller and not cached.
+        """
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is not None:
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        task = self._async_inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._load_async(key, loader))
+            self._async_inflight[key] = task
+
+        # Shielded so a cancelled caller does not cancel the load other callers are waiting on
+        return await asyncio.shield(task)
+
+    async def _load_async(self, key, loader):
+        """
+        Runs an async loader and stores its result.
+        """
+        try:
+            value = await loader()
+            self.set(key, value)
+            return value
+        finally:
+            self._async_inflight.pop(key, None)
+
+    def clear(self):
+        """
+        Removes every entry from the cache.
+        """
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,273 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+
+from .metrics import collect_stages, observe_stages
+
+# Load environment variables
+load_dotenv()
+
+# Workers reserved for CPU-bound model inference, separate from the threadpool used for everything else
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# 'thread' runs inference on threads in this process, 'process' runs it on worker processes so it can use more than
+# one core. Worker processes only share the models when the version has an exported artifact
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "thread").lower()
+
+# Maximum concurrent operations for each stage of a request, the database limit matches the connection pool
+DB_CONCURRENCY = int(os.getenv("DB_CONCURRENCY", "15"))
+WEATHER_CONCURRENCY = int(os.getenv("WEATHER_CONCURRENCY", "20"))
+INFERENCE_CONCURRENCY = int(os.getenv("INFERENCE_CONCURRENCY", str(INFERENCE_WORKERS * 2)))
+
+# Seconds a request waits for a free slot in a stage before it is rejected
+STAGE_QUEUE_TIMEOUT = float(os.getenv("STAGE_QUEUE_TIMEOUT", "5"))
+
+
+class StageBusy(HTTPException):
+    """
+    Raised when a request waits too long for a free slot in a stage.
+    """
+
+    def __init__(self, stage):
+        super().__init__(status_code=503, detail=f"Service busy: {stage}")
+        self.stage = stage
+
+
+class StageLimiter:
+    """
+    Limits how many requests can be inside one stage of the request path at a time.
+    Each stage has its own limit, so a slow dependency only queues requests waiting for that dependency instead
+    of using up capacity every other stage needs. Requests that cannot get a slot in time fail with a 503.
+    """
+
+    def __init__(self, name, limit, queue_timeout=STAGE_QUEUE_TIMEOUT):
+        """
+        :param name: Name of the stage, used in errors and metrics.
+        :param limit: Maximum number of concurrent operations.
+        :param queue_timeout: Seconds to wait for a free slot.
+        """
+        self.name = name
+        self.limit = limit
+        self.queue_timeout = queue_timeout
+        self.in_use = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._semaphore = None
+        self._loop = None
+
+    def _get_semaphore(self):
+        """
+        Gets the semaphore for the running event loop.
+        """
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.limit)
+            self._loop = loop
+        return self._semaphore
+
+    async def __aenter__(self):
+        semaphore = self._get_semaphore()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise StageBusy(self.name)
+        finally:
+            self.waiting -= 1
+        self.in_use += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        self.in_use -= 1
+        self._semaphore.release()
+        return False
+
+    def stats(self):
+        """
+        :return: Dictionary of the limit and current usage of the stage.
+        """
+        return {'limit': self.limit, 'in_use': self.in_use, 'waiting': self.waiting, 'rejected': self.rejected}
+
+
+db_limiter = StageLimiter("database", DB_CONCURRENCY)
+weather_limiter = StageLimiter("weather", WEATHER_CONCURRENCY)
+inference_limiter = StageLimiter("inference", INFERENCE_CONCURRENCY)
+
+
+class WorkerHTTPError(Exception):
+    """
+    Carries a HTTPException raised in a worker process back to the service, as HTTPException cannot be unpickled.
+    """
+
+    def __init__(self, status_code, detail, stages=()):
+        super().__init__(status_code, detail, stages)
+        self.status_code = status_code
+        self.detail = detail
+        self.stages = stages
+
+
+def _call_in_worker(fn, *args):
+    """
+    Runs fn in a worker process, converting HTTPExceptions into an exception that can be sent back.
+    :return: The result of fn and the stages it timed, which the service observes in its own metrics.
+    """
+    with collect_stages() as stages:
+        try:
+            return fn(*args), stages
+        except HTTPException as e:
+            raise WorkerHTTPError(e.status_code, e.detail, stages) from None
+
+
+class InferencePool:
+    """
+    The executor CPU-bound inference runs on, either a thread pool or a pool of worker processes.
+    Worker processes are started from a forkserver rather than forked from the service, as the service has other
+    threads running that may hold locks a forked child would inherit. Each worker runs the initializer when it
+    starts, which loads the models being served, memory-mapping the exported artifact when the version has one
+    so the workers share its pages. Versions without an artifact are unpickled by every worker, multiplying their
+    memory by the number of workers. Workers only see the models that were loaded when they started, so the pool
+    is restarted whenever a new model version is activated.
+    """
+
+    def __init__(self, workers, backend="thread"):
+        """
+        :param workers: Number of worker threads or processes.
+        :param backend: 'thread' or 'process'.
+        """
+        if backend not in ("thread", "process"):
+            raise ValueError(f"Unknown inference backend '{backend}'")
+        self.workers = workers
+        self.backend = backend
+        self.restarts = 0
+        self.initializer = None
+        self.initargs = ()
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        """
+        Gets the executor, starting it if it is not running.
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = self._create()
+            return self._executor
+
+    def set_initializer(self, initializer, *initargs):
+        """
+        Sets the function each worker process runs when it starts, used to load the models being served.
+        Only workers started after the call run it, so it is followed by a restart to replace running workers.
+        :param initializer: Module level function, run once in every new worker process.
+        :param initargs: Arguments passed to initializer.
+        """
+        self.initializer = initializer
+        self.initargs = initargs
+
+    def _create(self):
+        """
+        Creates the executor. Worker processes are all started straight away so they load the current models.
+        """
+        if self.backend == "thread":
+            return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+
+        # The forkserver imports the initializers module once, so each worker only has to load the models
+        context = multiprocessing.get_context("forkserver")
+        if self.initializer is not None:
+            context.set_forkserver_preload([self.initializer.__module__])
+        executor = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=context, initializer=self.initializer, initargs=self.initargs
+        )
+        for future in [executor.submit(os.getpid) for _ in range(self.workers)]:
+            future.result()
+        return executor
+
+    def start(self):
+        """
+        Starts the executor and its worker processes now rather than on the first request.
+        """
+        return self.executor
+
+    def restart(self):
+        """
+        Replaces worker processes with new ones, which load the models set by the initializer.
+        The new workers are started in the calling thread while requests keep running on the old ones, then swapped
+        in once they have loaded the models, so the event loop never waits for them. Work already submitted
+        finishes on the old executor. Threads share the live models so are left running.
+        """
+        if self.backend == "thread" or self._executor is None:
+            return
+        replacement = self._create()
+        with self._lock:
+            previous = self._executor
+            if previous is not None:
+                self._executor = replacement
+                self.restarts += 1
+
+        # The pool was shut down while the new workers were starting, so they are not needed either
+        (previous or replacement).shutdown(wait=False)
+
+    def shutdown(self):
+        """
+        Stops the executor.
+        """
+        with self._lock:
+            previous, self._executor = self._executor, None
+        if previous is not None:
+            previous.shutdown(wait=True)
+
+    async def run(self, fn, *args):
+        """
+        Runs fn on the executor without blocking the event loop.
+        :param fn: The function to run, which must be a module level function for the process backend.
+        :param args: Arguments passed to fn.
+        :return: The result of fn.
+        """
+        loop = asyncio.get_running_loop()
+        if self.backend == "thread":
+            return await loop.run_in_executor(self.executor, fn, *args)
+
+        try:
+            result, stages = await loop.run_in_executor(self.executor, _call_in_worker, fn, *args)
+        except WorkerHTTPError as e:
+            observe_stages(e.stages)
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
+        observe_stages(stages)
+        return result
+
+    def stats(self):
+        """
+        :return: Dictionary describing the pool.
+        """
+        return {'backend': self.backend, 'workers': self.workers, 'restarts': self.restarts}
+
+
+inference_pool = InferencePool(INFERENCE_WORKERS, INFERENCE_BACKEND)
+
+
+async def run_inference(fn, *args):
+    """
+    Runs CPU-bound inference on the dedicated inference pool.
+    :param fn: The function to run.
+    :param args: Arguments passed to fn.
+    :return: The result of fn.
+    """
+    async with inference_limiter:
+        return await inference_pool.run(fn, *args)
+
+
+def stage_stats():
+    """
+    :return: Dictionary of the usage of every stage limiter and the inference pool.
+    """
+    return {
+        'database': db_limiter.stats(),
+        'weather': weather_limiter.stats(),
+        'inference': dict(inference_limiter.stats(), **inference_pool.stats())
+    }
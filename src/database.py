@@ -1,5 +1,9 @@
-from sqlalchemy import create_engine
+import threading
+import time
+from sqlalchemy import create_engine, exc, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 import os
 from dotenv import load_dotenv
 
@@ -15,17 +19,160 @@ DB_NAME = os.getenv("DB_NAME")
 # Construct database URL
 DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:5432/{DB_NAME}"
 
+# The request path uses the asyncpg driver so database calls do not hold a thread while they wait
+ASYNC_DATABASE_URL = os.getenv(
+    "ASYNC_DATABASE_URL", f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:5432/{DB_NAME}"
+)
+
+# Connection pool of each replica, the database must allow replicas * (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+
+# Milliseconds a query can run before the database cancels it, 0 disables the timeout
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "5000"))
+
+# Connections opened at startup so the first requests do not wait for connection setup
+DB_PREWARM_CONNECTIONS = int(os.getenv("DB_PREWARM_CONNECTIONS", str(DB_POOL_SIZE)))
+
+
+class PoolMetrics:
+    """
+    Counts connection checkouts from the async pool and how long each one waited for a connection.
+    """
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, wait, timed_out=False):
+        """
+        Records one checkout.
+        :param wait: Seconds spent waiting for the connection.
+        :param timed_out: True if no connection became free within the pool timeout.
+        """
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+
+
+pool_metrics = PoolMetrics()
+
+
+class TimedAsyncAdaptedQueuePool(AsyncAdaptedQueuePool):
+    """
+    The default async pool, timing how long every checkout waits for a free or new connection.
+    """
+
+    def _do_get(self):
+        started_at = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            pool_metrics.record(time.perf_counter() - started_at, timed_out=True)
+            raise
+        pool_metrics.record(time.perf_counter() - started_at)
+        return connection
+
+
+def async_engine_options(url):
+    """
+    Gets the pooling and timeout options for the async engine.
+    :param url: The async database URL.
+    :return: Dictionary of keyword arguments for create_async_engine.
+    """
+    # SQLite is only used for local testing and does not support these settings
+    if url.startswith("sqlite"):
+        return {}
+
+    options = {
+        'poolclass': TimedAsyncAdaptedQueuePool,
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': DB_POOL_PRE_PING
+    }
+    if DB_STATEMENT_TIMEOUT_MS > 0:
+        options['connect_args'] = {'server_settings': {'statement_timeout': str(DB_STATEMENT_TIMEOUT_MS)}}
+    return options
+
+
+# The blocking engine is kept for scripts and tooling that run outside the event loop
 engine = create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **async_engine_options(ASYNC_DATABASE_URL))
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
-def get_db():
+async def get_db():
     """
-    Creates a new database session and ensures it closes after.
+    Creates a new async database session and ensures it closes after.
     """
-    db = SessionLocal()
-    try:
+    async with AsyncSessionLocal() as db:
         yield db
+
+
+async def prewarm_pool(connections=DB_PREWARM_CONNECTIONS):
+    """
+    Opens connections and returns them to the pool, so they are already connected when requests arrive.
+    Also checks the database is reachable, as every connection runs a trivial query.
+    :param connections: Number of connections to open, at most the pool size is kept open afterwards.
+    :raises: Exception from the driver if the database cannot be reached.
+    """
+    opened = []
+    try:
+        for _ in range(connections):
+            connection = await async_engine.connect()
+            opened.append(connection)
+            await connection.execute(text("SELECT 1"))
     finally:
-        db.close()
\ No newline at end of file
+        for connection in opened:
+            await connection.close()
+
+
+async def set_statement_timeout(db, timeout_ms):
+    """
+    Overrides the statement timeout for the rest of the sessions current transaction.
+    :param db: Async database session.
+    :param timeout_ms: Milliseconds queries can run for, 0 for no limit.
+    """
+    if db.bind.dialect.name == "postgresql":
+        await db.execute(text(f"SET LOCAL statement_timeout = {int(timeout_ms)}"))
+
+
+def pool_stats():
+    """
+    :return: Dictionary of the async connection pool usage and checkout wait metrics.
+    """
+    pool = async_engine.pool
+    stats = {
+        'checkouts': pool_metrics.checkouts,
+        'checkout_timeouts': pool_metrics.timeouts,
+        'mean_checkout_wait_ms': (
+            pool_metrics.wait_total / pool_metrics.checkouts * 1000 if pool_metrics.checkouts else 0.0
+        ),
+        'max_checkout_wait_ms': pool_metrics.wait_max * 1000
+    }
+
+    if isinstance(pool, AsyncAdaptedQueuePool):
+        capacity = pool.size() + max(pool._max_overflow, 0)
+        stats.update({
+            'pool_size': pool.size(),
+            'max_overflow': pool._max_overflow,
+            'checked_out': pool.checkedout(),
+            'idle': pool.checkedin(),
+            'utilization': pool.checkedout() / capacity if capacity else 0.0
+        })
+    return stats
@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+
+# Model input features in the order of the training dataset
+FEATURES = ['discount', 'price', 'weather', 'category', 'temperature', 'day', 'lead_time', 'time_of_day',
+            'window_length']
+
+DAY_NAMES = np.array(['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'], dtype=object)
+
+
+def bundle_features(bundles, weather_lookup):
+    """
+    Derives the model input features of many bundles at once, used by the service for bundle forecasts and by
+    retraining for the bundles in the database so both always derive them the same way.
+    :param bundles: Dataframe or list of mappings of the bundle columns, with timestamps as strings or datetimes.
+    :param weather_lookup: Function taking an array of collection start datetimes and returning the weather
+                           condition and temperature of each, as arrays or as single values shared by every bundle.
+    :return: Dataframe of the features in the order of the training dataset.
+    """
+    columns = bundle_feature_columns(bundles, weather_lookup)
+    index = bundles.index if isinstance(bundles, pd.DataFrame) else None
+    return pd.DataFrame(columns, columns=FEATURES, index=index)
+
+
+def bundle_feature_columns(bundles, weather_lookup):
+    """
+    Derives the model input features of many bundles as NumPy arrays. Dates are worked out with NumPy rather than
+    pandas, which has too much overhead per call for forecasts of a single bundle.
+    :param bundles: Dataframe or list of mappings of the bundle columns, with timestamps as strings or datetimes.
+    :param weather_lookup: Function taking an array of collection start datetimes and returning the weather
+                           condition and temperature of each, as arrays or as single values shared by every bundle.
+    :return: Dictionary of feature name to an array with the value of every bundle.
+    """
+    collection_start = _timestamps(_column(bundles, 'collection_start'))
+    posting_time = _timestamps(_column(bundles, 'posting_time'))
+    collection_end = _timestamps(_column(bundles, 'collection_end'))
+    retail_price = np.asarray(_column(bundles, 'retail_price'), dtype=np.float64)
+    price = np.asarray(_column(bundles, 'price'), dtype=np.float64)
+
+    weather, temperature = weather_lookup(collection_start)
+
+    # 1970-01-01 was a Thursday, so counting days from it gives the day of the week
+    collection_day = collection_start.astype('datetime64[D]')
+    hour = np.timedelta64(1, 'h')
+
+    return {
+        'discount': np.maximum(0, (retail_price - price) / retail_price),
+        'price': price,
+        'weather': _per_bundle(weather, len(price), object),
+        'category': np.asarray(_column(bundles, 'category'), dtype=object),
+        'temperature': _per_bundle(temperature, len(price), np.float64),
+        'day': DAY_NAMES[(collection_day.view(np.int64) + 3) % 7],
+        'lead_time': (collection_start - posting_time) / hour,
+        'time_of_day': ((collection_start - collection_day) // hour).astype(np.int64),
+        'window_length': (collection_end - collection_start) / hour
+    }
+
+
+def _column(bundles, name):
+    """
+    Gets one column of the bundles, without building a dataframe from a list of mappings.
+    """
+    if isinstance(bundles, pd.DataFrame):
+        return bundles[name].to_numpy()
+    return [bundle[name] for bundle in bundles]
+
+
+def _timestamps(values):
+    """
+    Converts strings or datetimes to naive datetime64 values. Timezone aware values keep their local time, as they
+    did when the features were derived with pandas, rather than being converted to UTC by NumPy.
+    """
+    if isinstance(values, np.ndarray) and values.dtype.kind == 'M':
+        return values.astype('datetime64[us]')
+    if any(getattr(value, 'tzinfo', None) is not None for value in values):
+        return pd.DatetimeIndex(pd.to_datetime(values)).tz_localize(None).to_numpy(dtype='datetime64[us]')
+    return np.asarray(values, dtype='datetime64[us]')
+
+
+def _per_bundle(values, n_bundles, dtype):
+    """
+    Gets an array with a value for every bundle from a single value shared by all of them or a value per bundle.
+    """
+    if np.ndim(values) == 0:
+        return np.full(n_bundles, values, dtype=dtype)
+    return np.asarray(values, dtype=dtype)
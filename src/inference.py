@@ -0,0 +1,70 @@
+import joblib
+from scipy.special import expit
+
+from .metrics import time_stage
+
+
+class InferenceEngine:
+    """
+    Runs the reservation and collection pipelines together in a single pass.
+    Both pipelines are fitted on the same features, so when their preprocessors are identical the input is
+    transformed once and the matrix is given to both classifiers. Each classifier is only asked for its
+    decision scores, and both the prediction and the probability are derived from them.
+    """
+
+    def __init__(self, model_reservation, model_collection):
+        """
+        :param model_reservation: Fitted reservation pipeline ending in a binary GradientBoostingClassifier.
+        :param model_collection: Fitted collection pipeline ending in a binary GradientBoostingClassifier.
+        """
+        self.reservation_preprocessor = model_reservation[:-1]
+        self.reservation_classifier = model_reservation[-1]
+        self.collection_preprocessor = model_collection[:-1]
+        self.collection_classifier = model_collection[-1]
+
+        # joblib.hash compares the fitted state, so pipelines trained separately on the same data still match
+        self.shared_preprocessor = joblib.hash(self.reservation_preprocessor) == joblib.hash(self.collection_preprocessor)
+
+    def transform(self, input_df):
+        """
+        Applies the preprocessing of both pipelines.
+        :param input_df: Dataframe containing input data such as discount, price, weather etc.
+        :return: The transformed matrices for the reservation and collection classifiers.
+        """
+        reservation_matrix = self.reservation_preprocessor.transform(input_df)
+        if self.shared_preprocessor:
+            return reservation_matrix, reservation_matrix
+        return reservation_matrix, self.collection_preprocessor.transform(input_df)
+
+    def predict(self, input_df):
+        """
+        Predicts reservation and collection for every row of input_df.
+        :param input_df: Dataframe containing input data such as discount, price, weather etc.
+        :return: Arrays of reservation predictions, reservation probabilities, collection predictions and collection probabilities.
+        """
+        with time_stage("preprocessing"):
+            reservation_matrix, collection_matrix = self.transform(input_df)
+
+        with time_stage("inference_reservation"):
+            reservation_predictions, reservation_probabilities = _predict_from_decision(self.reservation_classifier, reservation_matrix)
+        with time_stage("inference_collection"):
+            collection_predictions, collection_probabilities = _predict_from_decision(self.collection_classifier, collection_matrix)
+
+        return reservation_predictions, reservation_probabilities, collection_predictions, collection_probabilities
+
+
+def _predict_from_decision(classifier, matrix):
+    """
+    Gets the prediction and the positive class probability from one decision_function call.
+    :param classifier: Fitted binary GradientBoostingClassifier trained with the log loss.
+    :param matrix: Preprocessed input matrix.
+    :return: Array of predicted classes and array of positive class probabilities.
+    """
+    scores = classifier.decision_function(matrix)
+
+    # Matches GradientBoostingClassifier.predict, which picks the positive class when the decision score is >= 0.
+    # Thresholding the probability at 0.5 instead differs for scores so close to 0 that the sigmoid rounds to 0.5.
+    predictions = classifier.classes_[(scores >= 0).astype(int)]
+
+    # The log loss turns scores into probabilities with the sigmoid, exactly as predict_proba does
+    return predictions, expit(scores)
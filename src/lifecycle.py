@@ -0,0 +1,110 @@
+import asyncio
+import os
+
+from dotenv import load_dotenv
+from starlette.concurrency import run_in_threadpool
+
+from .concurrency import inference_pool, run_inference
+from .database import prewarm_pool
+from .registry import WARM_UP_INPUT
+from . import services
+
+# Load environment variables
+load_dotenv()
+
+# Seconds between attempts to finish starting up when a step failed, such as the database being unreachable
+STARTUP_RETRY_INTERVAL = float(os.getenv("STARTUP_RETRY_INTERVAL", "5"))
+
+# Seconds opening the database connections can take before the attempt is abandoned and retried later
+STARTUP_DATABASE_TIMEOUT = float(os.getenv("STARTUP_DATABASE_TIMEOUT", "10"))
+
+
+class Readiness:
+    """
+    Tracks which startup steps have finished, so the service only reports ready once it can serve requests at
+    full speed. Steps run in order and each only runs once the ones before it have succeeded.
+    """
+
+    STEPS = ("models", "warm_up", "inference_pool", "database")
+
+    def __init__(self):
+        self.completed = {step: False for step in self.STEPS}
+        self.errors = {}
+
+    @property
+    def ready(self):
+        """
+        :return: True once every step has succeeded and a model version is being served.
+        """
+        return all(self.completed.values()) and services.registry.current is not None
+
+    def describe(self):
+        """
+        :return: Dictionary of the state of every step and the last error of those that failed.
+        """
+        return {
+            'ready': self.ready,
+            'checks': dict(self.completed),
+            'errors': dict(self.errors)
+        }
+
+
+readiness = Readiness()
+
+
+async def _load_models():
+    await run_in_threadpool(services.load_models)
+
+
+async def _warm_up():
+    await run_in_threadpool(services.warm_up)
+
+
+async def _start_inference_pool():
+    # Worker processes load the models when they start, which happens off the event loop, then a prediction goes
+    # through the pool so the first request does not pay for starting it either
+    await run_in_threadpool(inference_pool.start)
+    await run_inference(services.predict, WARM_UP_INPUT)
+
+
+async def _prewarm_database():
+    await asyncio.wait_for(prewarm_pool(), STARTUP_DATABASE_TIMEOUT)
+
+
+STEP_FUNCTIONS = {
+    'models': _load_models,
+    'warm_up': _warm_up,
+    'inference_pool': _start_inference_pool,
+    'database': _prewarm_database
+}
+
+
+async def start_up(state=readiness):
+    """
+    Runs the startup steps that have not succeeded yet, stopping at the first one that fails.
+    :param state: The Readiness to update.
+    :return: True if the service is ready.
+    """
+    for step in state.STEPS:
+        if state.completed[step]:
+            continue
+        try:
+            await STEP_FUNCTIONS[step]()
+        except Exception as e:
+            state.errors[step] = str(e) or type(e).__name__
+            print(f"Startup step '{step}' failed: {state.errors[step]}")
+            return False
+        state.completed[step] = True
+        state.errors.pop(step, None)
+    return state.ready
+
+
+async def keep_starting_up(state=readiness, interval=STARTUP_RETRY_INTERVAL):
+    """
+    Retries the failed startup steps until the service is ready, while liveness keeps reporting the process is up.
+    :param state: The Readiness to update.
+    :param interval: Seconds between attempts.
+    """
+    while not state.ready:
+        await asyncio.sleep(interval)
+        await start_up(state)
@@ -1,23 +1,66 @@
-import pandas as pd
+import asyncio
+import os
+import json
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
+from starlette.concurrency import run_in_threadpool
 from dotenv import load_dotenv
-from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from .auth import get_current_vendor_id
-from .database import get_db
-from .schemas import SimulationRequest
-from .services import predict, get_current_weather, model_reservation, model_collection
+from .auth import get_current_vendor_id, verify_admin_token, token_cache, clear_token_cache
+from .concurrency import StageBusy, db_limiter, run_inference, stage_stats, inference_pool
+from .metrics import MetricsMiddleware, time_stage, render_samples, STAGE_LATENCY, REQUEST_LATENCY, REQUESTS
+from .profiling import ProfilingMiddleware
+from .lifecycle import readiness, start_up, keep_starting_up
+from .database import get_db, AsyncSessionLocal, async_engine, set_statement_timeout, pool_stats
+from .repository import get_bundle, get_bundles, stream_active_bundles
+from .schemas import SimulationRequest, BatchPredictionRequest, ModelReloadRequest
+from .services import (
+    predict_async, predict_bundle_batch, build_bundle_input, get_current_weather, get_weather_for_postcode,
+    weather_client, registry, batcher, weather_cache, prediction_cache, MODEL_WATCH_INTERVAL
+)
 
 # Load environment variables
 load_dotenv()
 
+# Number of bundles read from the database and scored at a time when streaming
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", "500"))
+
+# Milliseconds the streaming query can run for, longer than other queries as it reads every bundle of a vendor
+STREAM_STATEMENT_TIMEOUT_MS = int(os.getenv("STREAM_STATEMENT_TIMEOUT_MS", "60000"))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Loads and warms up the models, starts the inference pool and opens database connections before traffic is
+    routed to the service, then closes them, the model file watcher and the pooled weather API connections when
+    the service shuts down. Startup steps that fail are retried in the background while readiness reports them.
+    """
+    retry = None
+    if not await start_up():
+        retry = asyncio.create_task(keep_starting_up())
+
+    # Checks for new model files once the service is up
+    if MODEL_WATCH_INTERVAL > 0:
+        registry.start_watching(MODEL_WATCH_INTERVAL)
+    yield
+    if retry is not None:
+        retry.cancel()
+    registry.stop_watching()
+    inference_pool.shutdown()
+    await weather_client.aclose()
+    await async_engine.dispose()
+
+
 # Initialize FastAPI app
 app = FastAPI(
     docs_url="/forecastservice/docs",
     openapi_url="/forecastservice/openapi.json",
-    root_path="/api"
+    root_path="/api",
+    lifespan=lifespan
 )
 
 # Configures CORS
@@ -30,12 +73,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Counts and times every request for the metrics endpoint
+app.add_middleware(MetricsMiddleware)
+
+# Profiles single prediction requests when enabled and asked for with the admin token
+app.add_middleware(ProfilingMiddleware)
+
 
 @app.post("/forecast/simulate")
-def simulate_forecast(
+async def simulate_forecast(
         request: SimulationRequest,
         vendor_id: str = Depends(get_current_vendor_id),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_db)
 ):
     """
     Simulate a forecast based on fake data inputted by the user.
@@ -45,7 +94,7 @@ def simulate_forecast(
     :return: A dictionary containing the forecast result for both reservation and collection.
     """
 
-    weather, temperature = get_current_weather(vendor_id, db)
+    weather, temperature = await get_current_weather(vendor_id, db)
 
     input_data = {
         'discount': request.discount,
@@ -59,15 +108,14 @@ def simulate_forecast(
         'time_of_day': request.time_of_day
     }
 
-    input_df = pd.DataFrame([input_data])
-    return predict(input_df)
+    return await predict_async(input_data)
 
 
 @app.get("/forecast/predict/{bundle_id}")
-def predict_bundle(
+async def predict_bundle(
         bundle_id: str,
         vendor_id: str = Depends(get_current_vendor_id),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_db)
 ):
     """
     Generates a forecast based on an existing bundle in the database.
@@ -80,13 +128,16 @@ def predict_bundle(
     """
 
     # Raises a HTTPException if the models cannot be loaded.
-    if not model_reservation or not model_collection:
+    if not registry.current:
         raise HTTPException(status_code=500, detail="ML Models not found")
 
     try:
-        # Gets all data about the bundle using parameterised query
-        query = text("SELECT * FROM bundles WHERE bundle_id = :bid AND vendor_id = :vid")
-        bundle = db.execute(query, {'bid': bundle_id, 'vid': vendor_id}).mappings().first()
+        # Gets the bundle and the vendors postcode in one round trip
+        async with db_limiter:
+            with time_stage("bundle_query"):
+                bundle = await get_bundle(db, bundle_id, vendor_id)
+    except StageBusy:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database Error: {e}")
 
@@ -94,46 +145,303 @@ def predict_bundle(
         raise HTTPException(status_code=404, detail="Bundle not found")
 
     try:
-        # Gets the weather conditions and temperature using a helper function
-        weather, temperature = get_current_weather(vendor_id, db)
+        # Gets the weather conditions and temperature at the postcode read with the bundle
+        weather, temperature = await get_weather_for_postcode(bundle['postcode'])
 
         # Gets the required input data from the returned bundle data
-        collection_start = pd.to_datetime(bundle['collection_start'])
-        posting_time = pd.to_datetime(bundle['posting_time'])
-        collection_end = pd.to_datetime(bundle['collection_end'])
-
-        retail_price = bundle['retail_price']
-        price = bundle['price']
-
-        discount = max(0, (retail_price - price) / retail_price)
-
-        input_data = {
-            'discount': discount,
-            'price': float(bundle['price']),
-            'weather': weather,
-            'category': bundle['category'],
-            'temperature': temperature,
-            'day': collection_start.strftime('%A'),
-            'lead_time': (collection_start - posting_time).total_seconds() / 3600,
-            'window_length': (collection_end - collection_start).total_seconds() / 3600,
-            'time_of_day': collection_start.hour
-        }
-
-        # The input data dictionary is converted into a dataframe and passed to the predict helper function
-        input_df = pd.DataFrame([input_data])
-        result = predict(input_df)
+        input_data = build_bundle_input(bundle, weather, temperature)
+
+        # The input data dictionary is passed to the predict helper function
+        result = await predict_async(input_data)
         result['bundle_id'] = bundle_id
 
         # The prediction result is returned
         return result
 
+    except StageBusy:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Prediction Failed: {e}")
 
 
+@app.post("/forecast/predict/batch")
+async def predict_bundles(
+        request: BatchPredictionRequest,
+        vendor_id: str = Depends(get_current_vendor_id),
+        db: AsyncSession = Depends(get_db)
+):
+    """
+    Generates forecasts for many existing bundles in a single request.
+    :param request: The list of bundle IDs to forecast.
+    :param vendor_id: ID of the vendor.
+    :param db: Database session.
+    :return: A dictionary containing a forecast for every bundle found and the IDs of any bundles that were not found.
+    :raises: HTTPException 500 if models cannot be loaded or if there is an error with accessing the database or if the prediction fails.
+    """
+
+    # Raises a HTTPException if the models cannot be loaded.
+    if not registry.current:
+        raise HTTPException(status_code=500, detail="ML Models not found")
+
+    # Removes duplicate IDs while keeping the order they were requested in
+    bundle_ids = list(dict.fromkeys(request.bundle_ids))
+
+    try:
+        # Gets all the requested bundles and the vendors postcode in one round trip
+        async with db_limiter:
+            with time_stage("bundle_query"):
+                bundles = await get_bundles(db, bundle_ids, vendor_id)
+    except StageBusy:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database Error: {e}")
+
+    found_ids = [bundle_id for bundle_id in bundle_ids if bundle_id in bundles]
+    not_found = [bundle_id for bundle_id in bundle_ids if bundle_id not in bundles]
+
+    if not found_ids:
+        return {'forecasts': [], 'not_found': not_found}
+
+    try:
+        # Every bundle belongs to the same vendor so the weather only has to be fetched once
+        weather, temperature = await get_weather_for_postcode(bundles[found_ids[0]]['postcode'])
+
+        # The features of every bundle are derived together on the inference pool, then each model runs once over
+        # the whole batch
+        results = await run_inference(
+            predict_bundle_batch, [dict(bundles[bundle_id]) for bundle_id in found_ids], weather, temperature
+        )
+
+        for bundle_id, result in zip(found_ids, results):
+            result['bundle_id'] = bundle_id
+
+        return {'forecasts': results, 'not_found': not_found}
+
+    except StageBusy:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Prediction Failed: {e}")
+
+
+@app.get("/forecast/stream")
+async def stream_vendor_forecasts(
+        vendor_id: str = Depends(get_current_vendor_id),
+        db: AsyncSession = Depends(get_db)
+):
+    """
+    Streams forecasts for every active or upcoming bundle of the vendor as newline delimited JSON.
+    Bundles are read with a server-side cursor and scored one chunk at a time so memory use stays flat.
+    :param vendor_id: ID of the vendor.
+    :param db: Database session.
+    :return: A streaming response with one forecast dictionary per line.
+    :raises: HTTPException 500 if models cannot be loaded or if the weather cannot be fetched.
+    """
+
+    # Raises a HTTPException if the models cannot be loaded.
+    if not registry.current:
+        raise HTTPException(status_code=500, detail="ML Models not found")
+
+    # The weather is fetched before streaming starts so failures can still return an error status
+    weather, temperature = await get_current_weather(vendor_id, db)
+
+    async def generate():
+        # The request session is closed once the response starts, so the stream uses its own session
+        stream_db = AsyncSessionLocal()
+        try:
+            await set_statement_timeout(stream_db, STREAM_STATEMENT_TIMEOUT_MS)
+
+            # Each chunk is scored as one batch and written out before the next chunk is read
+            async for chunk in stream_active_bundles(stream_db, vendor_id, STREAM_CHUNK_SIZE):
+                forecasts = await run_inference(
+                    predict_bundle_batch, [dict(bundle) for bundle in chunk], weather, temperature
+                )
+                for bundle, forecast in zip(chunk, forecasts):
+                    forecast['bundle_id'] = str(bundle['bundle_id'])
+                    yield json.dumps(forecast) + "\n"
+
+        except Exception as e:
+            # The status code has already been sent so the error is reported as the final line
+            yield json.dumps({'error': f"Prediction Failed: {e}"}) + "\n"
+        finally:
+            await stream_db.close()
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+@app.get("/forecast/admin/models")
+def get_model_version(_: None = Depends(verify_admin_token)):
+    """
+    Describes the model version currently being served and the versions served before it.
+    :return: A dictionary containing the current version and the history of activated versions.
+    :raises: HTTPException 503 if no models are loaded.
+    """
+    if not registry.current:
+        raise HTTPException(status_code=503, detail="ML Models not found")
+    return {'current': registry.current.describe(), 'history': registry.history}
+
+
+@app.post("/forecast/admin/models/reload")
+async def reload_models(request: ModelReloadRequest, _: None = Depends(verify_admin_token)):
+    """
+    Loads, warms up and swaps in a model version without restarting the service.
+    Requests already running finish on the previous version.
+    :param request: The version to load, or no version to reload the default models.
+    :return: A dictionary describing the new version and the version it replaced.
+    :raises: HTTPException 400 if the version name is invalid.
+             HTTPException 500 if the version cannot be loaded, in which case the previous version keeps serving.
+    """
+    previous = registry.current
+
+    try:
+        model_version = await run_in_threadpool(registry.reload, request.version)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Model Reload Failed: {e}")
+
+    return {
+        'current': model_version.describe(),
+        'previous_version': previous.version if previous else None
+    }
+
+
+@app.post("/forecast/admin/auth/cache/clear")
+def clear_auth_cache(_: None = Depends(verify_admin_token)):
+    """
+    Clears the verified token cache so every token is verified again, for example after the signing key is rotated.
+    :return: A dictionary containing the number of tokens that were cleared.
+    """
+    cleared = len(token_cache)
+    clear_token_cache()
+    return {'cleared': cleared}
+
+
+@app.get("/forecast/actuator/batching")
+def batching_stats():
+    """
+    Reports micro-batching metrics used to tune the batch size and wait window.
+    :return: A dictionary containing batch size and queue wait metrics.
+    """
+    return batcher.stats()
+
+
+@app.get("/forecast/actuator/cache")
+def cache_stats():
+    """
+    Reports the size and hit and miss counts of the weather, prediction and verified token caches.
+    :return: A dictionary containing the metrics of each cache.
+    """
+    return {
+        name: {'size': len(cache), 'hits': cache.hits, 'misses': cache.misses}
+        for name, cache in (('weather', weather_cache), ('prediction', prediction_cache), ('token', token_cache))
+    }
+
+
+@app.get("/forecast/actuator/database")
+def database_stats():
+    """
+    Reports connection pool utilization and how long requests wait to check out a connection.
+    :return: A dictionary containing the pool size, usage and checkout wait metrics.
+    """
+    return pool_stats()
+
+
+@app.get("/forecast/actuator/concurrency")
+def concurrency_stats():
+    """
+    Reports how much of each request stage's concurrency limit is in use.
+    :return: A dictionary containing the limit, usage, queue and rejections of each stage.
+    """
+    return stage_stats()
+
+
+@app.get("/forecast/metrics", response_class=PlainTextResponse)
+def metrics():
+    """
+    Reports request, stage latency, cache, connection pool and batching metrics in the Prometheus text format.
+    :return: The metrics as plain text.
+    """
+    caches = {'weather': weather_cache, 'prediction': prediction_cache, 'token': token_cache}
+    database = pool_stats()
+    stages = stage_stats()
+    batching = batcher.stats()
+
+    lines = STAGE_LATENCY.render() + REQUEST_LATENCY.render() + REQUESTS.render()
+    lines += render_samples(
+        "forecast_cache_entries", "Entries held in each cache.",
+        {name: len(cache) for name, cache in caches.items()}, "cache"
+    )
+    lines += render_samples(
+        "forecast_cache_hits_total", "Cache lookups that found a valid entry.",
+        {name: cache.hits for name, cache in caches.items()}, "cache", kind="counter"
+    )
+    lines += render_samples(
+        "forecast_cache_misses_total", "Cache lookups that found no valid entry.",
+        {name: cache.misses for name, cache in caches.items()}, "cache", kind="counter"
+    )
+    lines += render_samples(
+        "forecast_db_pool_checked_out", "Database connections in use.", database.get('checked_out', 0)
+    )
+    lines += render_samples(
+        "forecast_db_pool_utilization", "Fraction of the pool capacity in use.", database.get('utilization', 0.0)
+    )
+    lines += render_samples(
+        "forecast_db_pool_checkouts_total", "Database connections checked out.", database['checkouts'], kind="counter"
+    )
+    lines += render_samples(
+        "forecast_db_pool_checkout_timeouts_total", "Checkouts that timed out waiting for a connection.",
+        database['checkout_timeouts'], kind="counter"
+    )
+    lines += render_samples(
+        "forecast_db_pool_checkout_wait_max_seconds", "Longest wait for a database connection.",
+        database['max_checkout_wait_ms'] / 1000
+    )
+    lines += render_samples(
+        "forecast_stage_in_use", "Operations running in each limited stage.",
+        {name: stage['in_use'] for name, stage in stages.items()}, "stage"
+    )
+    lines += render_samples(
+        "forecast_stage_waiting", "Requests queued for a slot in each limited stage.",
+        {name: stage['waiting'] for name, stage in stages.items()}, "stage"
+    )
+    lines += render_samples(
+        "forecast_stage_rejected_total", "Requests rejected after waiting too long for a stage.",
+        {name: stage['rejected'] for name, stage in stages.items()}, "stage", kind="counter"
+    )
+    lines += render_samples(
+        "forecast_batch_queue_depth", "Predictions waiting to join a micro-batch.", batching['queue_depth']
+    )
+    lines += render_samples(
+        "forecast_batches_total", "Micro-batches run.", batching['batches'], kind="counter"
+    )
+    lines += render_samples(
+        "forecast_batch_rows_total", "Predictions run in micro-batches.", batching['rows'], kind="counter"
+    )
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+
 @app.get("/forecast/actuator")
 def health_check():
     """
     Simple health check endpoint.
     """
     return {"status": "ok", "message": "Forecast Service is running"}
+
+
+@app.get("/forecast/actuator/live")
+def liveness():
+    """
+    Liveness check, answering as long as the process can serve requests at all.
+    """
+    return {"status": "ok"}
+
+
+@app.get("/forecast/actuator/ready")
+def readiness_check():
+    """
+    Readiness check, only ready once the models are loaded and warmed up, the inference pool is running and the
+    database connections are open.
+    :return: The state of each startup step, with a 503 status until all of them have succeeded.
+    """
+    state = readiness.describe()
+    return JSONResponse(status_code=200 if state['ready'] else 503, content=state)
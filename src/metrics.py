@@ -0,0 +1,252 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds of the latency histogram buckets, from sub-millisecond inference up to slow API calls
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labelnames, labelvalues, extra=None):
+    """
+    Formats label names and values as a Prometheus label set.
+    """
+    pairs = list(zip(labelnames, labelvalues)) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    """
+    Formats a sample value, using the Prometheus spelling of infinity.
+    """
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Counter:
+    """
+    A monotonically increasing count for each combination of label values.
+    """
+
+    def __init__(self, name, documentation, labelnames=()):
+        """
+        :param name: Metric name.
+        :param documentation: Help text shown with the metric.
+        :param labelnames: Names of the labels each count is split by.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        """
+        Increases the count for the label values.
+        """
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        """
+        :return: The count for the label values.
+        """
+        return self._values.get(tuple(str(labels[name]) for name in self.labelnames), 0)
+
+    def render(self):
+        """
+        :return: Lines of the metric in the Prometheus text format.
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """
+    Counts observations into cumulative buckets for each combination of label values.
+    """
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        """
+        :param name: Metric name.
+        :param documentation: Help text shown with the metric.
+        :param labelnames: Names of the labels observations are split by.
+        :param buckets: Increasing bucket upper bounds, a +Inf bucket is always added.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) + (float('inf'),)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        """
+        Records one observation.
+        :param value: The observed value, in seconds for latencies.
+        """
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Observes how long the body of the with statement takes, including when it raises.
+        """
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started_at, **labels)
+
+    def count(self, **labels):
+        """
+        :return: Number of observations for the label values.
+        """
+        series = self._series.get(tuple(str(labels[name]) for name in self.labelnames))
+        return series[2] if series else 0
+
+    def render(self):
+        """
+        :return: Lines of the metric in the Prometheus text format.
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+def render_samples(name, documentation, samples, labelname=None, kind="gauge"):
+    """
+    Renders values read from elsewhere in the service at scrape time.
+    :param name: Metric name.
+    :param documentation: Help text shown with the metric.
+    :param samples: A single value, or a dictionary of label value to value when labelname is given.
+    :param labelname: Name of the label the samples are split by.
+    :param kind: Prometheus metric type, 'gauge' or 'counter'.
+    :return: Lines of the metric in the Prometheus text format.
+    """
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"]
+    if labelname is None:
+        lines.append(f"{name} {_format_value(samples)}")
+    else:
+        for labelvalue, value in samples.items():
+            lines.append(f"{name}{_format_labels((labelname,), (labelvalue,))} {_format_value(value)}")
+    return lines
+
+
+# Latency of each stage of a request, so slow requests can be traced to the weather API, Postgres or the models
+STAGE_LATENCY = Histogram(
+    "forecast_stage_duration_seconds", "Time spent in each stage of handling a request.", ("stage",)
+)
+REQUEST_LATENCY = Histogram(
+    "forecast_request_duration_seconds", "Time taken to handle each request.", ("method", "path")
+)
+REQUESTS = Counter("forecast_requests_total", "Requests handled, by response status.", ("method", "path", "status"))
+
+
+# Stage durations measured in an inference worker process are collected here and observed by the service
+_collected_stages = threading.local()
+
+
+@contextmanager
+def time_stage(stage):
+    """
+    Times a stage of a request, including when it raises.
+    Inside collect_stages the duration is collected instead, so it can be sent back from a worker process.
+    :param stage: Name of the stage, such as 'weather' or 'inference_reservation'.
+    :return: Context manager observing the duration of its body.
+    """
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - started_at
+        collected = getattr(_collected_stages, "stages", None)
+        if collected is not None:
+            collected.append((stage, duration))
+        else:
+            STAGE_LATENCY.observe(duration, stage=stage)
+
+
+@contextmanager
+def collect_stages():
+    """
+    Collects the stages timed in the body instead of observing them, as observations made in a worker process
+    would only update the workers copy of the metrics.
+    :return: Context manager giving the list of (stage, seconds) timed so far.
+    """
+    previous = getattr(_collected_stages, "stages", None)
+    _collected_stages.stages = []
+    try:
+        yield _collected_stages.stages
+    finally:
+        _collected_stages.stages = previous
+
+
+def observe_stages(stages):
+    """
+    Observes stage durations collected in a worker process.
+    :param stages: List of (stage, seconds).
+    """
+    for stage, duration in stages:
+        STAGE_LATENCY.observe(duration, stage=stage)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware counting requests by status and timing each one.
+    Requests are labelled with their route template rather than the raw path, so bundle IDs do not each create a
+    new series.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started_at = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router adds the matched route to the scope, unmatched paths share one label
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            REQUESTS.inc(method=scope["method"], path=path, status=status)
+            REQUEST_LATENCY.observe(time.perf_counter() - started_at, method=scope["method"], path=path)
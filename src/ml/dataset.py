@@ -0,0 +1,174 @@
+"""
+Columnar, typed copy of the training dataset.
+
+Build it from the CSV, from the repository root, with:
+    python -m src.ml.dataset [--csv src/ml/dataset.csv] [--output src/ml/dataset]
+
+Every column is saved as its own .npy file with an explicit dtype, float32 for the numeric features, small integer
+codes for the categorical features and bool for the targets, described by a schema.json file listing each
+columns dtype and categories. Loading memory-maps the files, so only the columns asked for are read, and only
+the pages that are used, without parsing any text. The schema also records the size, modification time and hash of
+the CSV it was built from, so a build older than the CSV is detected and rebuilt.
+
+The numeric features are stored as float32, so models trained on the columnar dataset see values rounded to
+float32 while the service predicts on float64 inputs. The difference is below the precision of the features.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+ML_DIR = os.path.dirname(os.path.abspath(__file__))
+CSV_PATH = os.path.join(ML_DIR, "dataset.csv")
+DATASET_DIR = os.path.join(ML_DIR, "dataset")
+SCHEMA_FILE = "schema.json"
+
+# Bump when the file layout changes so old builds are rebuilt instead of misread
+SCHEMA_VERSION = 2
+
+# Storage type of every column of the training dataset
+COLUMN_TYPES = {
+    'discount': 'float32',
+    'price': 'float32',
+    'weather': 'category',
+    'category': 'category',
+    'temperature': 'float32',
+    'day': 'category',
+    'lead_time': 'float32',
+    'time_of_day': 'int8',
+    'window_length': 'float32',
+    'is_reserved': 'bool',
+    'is_collected': 'bool'
+}
+
+
+def build(csv_path=CSV_PATH, output_dir=DATASET_DIR):
+    """
+    Converts the CSV dataset into one typed .npy file per column.
+    :param csv_path: CSV file of the training dataset.
+    :param output_dir: Directory the columns and schema are written to.
+    :return: Number of rows written.
+    """
+    # Reading with the final dtypes up front means the text is never held as Python strings
+    read_types = {column: ('float32' if dtype == 'int8' else dtype) for column, dtype in COLUMN_TYPES.items()}
+    df = pd.read_csv(csv_path, usecols=list(COLUMN_TYPES), dtype=read_types, true_values=['True'],
+                     false_values=['False'])
+
+    os.makedirs(output_dir, exist_ok=True)
+    schema = {'version': SCHEMA_VERSION, 'rows': len(df), 'source': source_signature(csv_path), 'columns': {}}
+    for column, dtype in COLUMN_TYPES.items():
+        if dtype == 'category':
+            categories = df[column].cat.categories
+            codes = df[column].cat.codes.to_numpy().astype(np.int8 if len(categories) < 128 else np.int16)
+            np.save(os.path.join(output_dir, f"{column}.npy"), codes)
+            schema['columns'][column] = {'dtype': 'category', 'codes': str(codes.dtype),
+                                         'categories': [str(category) for category in categories]}
+        else:
+            np.save(os.path.join(output_dir, f"{column}.npy"), df[column].to_numpy().astype(dtype))
+            schema['columns'][column] = {'dtype': dtype}
+
+    # Written last, so a directory without a schema is an unfinished build
+    with open(os.path.join(output_dir, SCHEMA_FILE), "w") as file:
+        json.dump(schema, file, indent=2)
+    return len(df)
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def source_signature(csv_path):
+    """
+    :return: Dictionary of the size, modification time and SHA-256 hash of the CSV a dataset is built from.
+    """
+    stat = os.stat(csv_path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': _sha256(csv_path)}
+
+
+def is_current(path=DATASET_DIR, csv_path=CSV_PATH):
+    """
+    Checks a built dataset still matches the CSV, hashing the CSV only if its modification time has changed.
+    :param path: Directory of the built dataset.
+    :param csv_path: CSV file the dataset is built from.
+    :return: True if a finished dataset of this schema version is at path and the CSV has not changed since,
+             or there is no CSV to compare it with.
+    """
+    if not exists(path):
+        return False
+    with open(os.path.join(path, SCHEMA_FILE)) as file:
+        schema = json.load(file)
+    if schema['version'] != SCHEMA_VERSION:
+        return False
+    if not os.path.exists(csv_path):
+        return True
+
+    source = schema['source']
+    stat = os.stat(csv_path)
+    if stat.st_size != source['size']:
+        return False
+    return stat.st_mtime_ns == source['mtime_ns'] or _sha256(csv_path) == source['sha256']
+
+
+def read_schema(path=DATASET_DIR):
+    """
+    :return: The schema of a built dataset.
+    :raises: ValueError if the dataset was built with another schema version.
+    """
+    with open(os.path.join(path, SCHEMA_FILE)) as file:
+        schema = json.load(file)
+    if schema['version'] != SCHEMA_VERSION:
+        raise ValueError(f"Dataset at {path} has schema version {schema['version']}, rebuild it with this version")
+    return schema
+
+
+def exists(path=DATASET_DIR):
+    """
+    :return: True if a finished dataset is at path.
+    """
+    return os.path.exists(os.path.join(path, SCHEMA_FILE))
+
+
+def load(path=DATASET_DIR, columns=None, mmap=True):
+    """
+    Loads the dataset without copying the columns into memory.
+    :param path: Directory of the built dataset.
+    :param columns: Columns to load, defaults to every column.
+    :param mmap: Memory-map the column files rather than reading them.
+    :return: Dataframe backed by the column files, with categorical columns for weather, category and day.
+    """
+    schema = read_schema(path)
+    mmap_mode = 'r' if mmap else None
+
+    data = {}
+    for column in columns or list(schema['columns']):
+        spec = schema['columns'][column]
+        values = np.load(os.path.join(path, f"{column}.npy"), mmap_mode=mmap_mode)
+        if spec['dtype'] == 'category':
+            dtype = pd.CategoricalDtype(spec['categories'])
+            data[column] = pd.Categorical.from_codes(values, dtype=dtype, validate=False)
+        else:
+            data[column] = values
+    return pd.DataFrame(data, copy=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the columnar training dataset from the CSV.")
+    parser.add_argument("--csv", default=CSV_PATH, help="CSV file of the training dataset.")
+    parser.add_argument("--output", default=DATASET_DIR, help="Directory the dataset is written to.")
+    args = parser.parse_args(argv)
+
+    rows = build(args.csv, args.output)
+    print(f"Wrote {rows} rows to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
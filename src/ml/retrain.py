@@ -0,0 +1,354 @@
+"""
+Retrains the reservation and collection pipelines from the bundles and reservations in the database.
+
+Run from the repository root with:
+    python -m src.ml.retrain [--mode auto|warm_start|refit] [--chunk-size 5000] [--reservoir-size 200000]
+
+Each run only reads the bundles whose collection ended since the previous run, using a server-side cursor that
+returns them in chunks. Their features are derived the same way the service derives them for a bundle forecast,
+and the rows are merged into a fixed-size uniform sample of every bundle seen so far (a reservoir sample), so
+memory stays bounded however long the history grows. The models are then either warm-started, adding boosting
+rounds fitted on the sample to the current pipelines, or refitted from scratch on the sample. The new pipelines
+are saved as a version in src/ml/versions, which can be activated with the admin reload endpoint.
+
+The database does not store the weather each bundle had, so it is looked up from the saved daily weather history,
+falling back to the monthly climatology for days the history does not cover. Runs fail without the history, as
+every bundle in a month would otherwise get the same weather and the models would lose the weather signal.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import joblib
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+from ..features import FEATURES, bundle_features
+from ..registry import ModelRegistry, VERSION_FILE
+from ..weather import Climatology
+from .train_model import ENGINES, ML_DIR, TARGETS, create_classifier, fit_targets, save_pipelines
+
+ROOT_DIR = os.path.join(ML_DIR, "..", "..")
+STATE_DIR = os.path.join(ML_DIR, "retrain_state")
+WEATHER_HISTORY_PATH = os.path.join(ROOT_DIR, "data_seeding", "weather_files", "weather_data_exeter.csv")
+
+# Bundles are only trained on once their collection window has been over for this long, so no-shows are recorded
+LABEL_SETTLE_HOURS = 24
+
+# Warm starts keep adding rounds until the ensemble reaches this size, then the next run refits
+MAX_ESTIMATORS = 1000
+
+# Bundles ordered by when their collection ended, so the last row read is the watermark of the next run
+_SELECT_OUTCOMES = (
+    "SELECT b.bundle_id, b.collection_start, b.posting_time, b.collection_end, b.retail_price, b.price, b.category, "
+    "EXISTS (SELECT 1 FROM reservations r WHERE r.bundle_id = b.bundle_id) AS is_reserved, "
+    "EXISTS (SELECT 1 FROM reservations r WHERE r.bundle_id = b.bundle_id AND r.status = 'COLLECTED') "
+    "AS is_collected "
+    "FROM bundles b "
+)
+OUTCOMES_QUERY = text(_SELECT_OUTCOMES + "WHERE b.collection_end <= :until ORDER BY b.collection_end, b.bundle_id")
+OUTCOMES_SINCE_QUERY = text(
+    _SELECT_OUTCOMES + "WHERE (b.collection_end, b.bundle_id) > (:end, :bid) AND b.collection_end <= :until "
+    "ORDER BY b.collection_end, b.bundle_id"
+)
+
+
+class WeatherHistory:
+    """
+    The weather on each day, from the saved daily weather history or, for days it does not cover, the climatology.
+    """
+
+    def __init__(self, path=WEATHER_HISTORY_PATH, climatology=None):
+        """
+        :param path: CSV file with date, condition and avgtemp_c columns, as saved by save_weather_data.py.
+        :param climatology: Climatology used for days without history.
+        """
+        self.path = path
+        self.days = {}
+        if os.path.exists(path):
+            history = pd.read_csv(path, usecols=['date', 'condition', 'avgtemp_c'])
+            self.days = {
+                row.date: (row.condition.strip(), float(row.avgtemp_c)) for row in history.itertuples(index=False)
+            }
+        self.climatology = climatology or Climatology()
+
+    def lookup(self, days):
+        """
+        Gets the weather of many days at once.
+        :param days: Series or array of datetimes.
+        :return: Series of conditions and series of temperatures.
+        """
+        days = pd.Series(days)
+        weather = [
+            self.days.get(date) or self.climatology.lookup(day)
+            for date, day in zip(days.dt.strftime('%Y-%m-%d'), days.dt.date)
+        ]
+        conditions, temperatures = zip(*weather) if weather else ((), ())
+        return (pd.Series(conditions, index=days.index, dtype=object),
+                pd.Series(temperatures, index=days.index, dtype=float))
+
+
+class Reservoir:
+    """
+    A uniform random sample of at most capacity rows from every row ever added (Algorithm R).
+    Once full, the i-th row seen replaces a random row of the sample with probability capacity / i.
+    """
+
+    def __init__(self, capacity, seed=42):
+        """
+        :param capacity: Maximum number of rows kept.
+        :param seed: Random seed of the replacement choices.
+        """
+        self.capacity = capacity
+        self.seen = 0
+        self.rows = None
+        self._rng = np.random.default_rng(seed)
+
+    def add(self, chunk):
+        """
+        Adds a chunk of rows to the sample.
+        :param chunk: Dataframe with the same columns as every other chunk.
+        """
+        chunk = chunk.reset_index(drop=True)
+
+        # Rows fill the sample until it reaches capacity
+        free = self.capacity - (0 if self.rows is None else len(self.rows))
+        if free > 0:
+            head = chunk.iloc[:free]
+            self.rows = head.copy() if self.rows is None else pd.concat([self.rows, head], ignore_index=True)
+            self.seen += len(head)
+            chunk = chunk.iloc[free:].reset_index(drop=True)
+        if chunk.empty:
+            return
+
+        # Each later row picks a random slot among all rows seen up to it and replaces that row if the slot is in
+        # the sample. Of rows picking the same slot, the last one wins, as if they were added one at a time.
+        positions = self.seen + np.arange(1, len(chunk) + 1)
+        slots = (self._rng.random(len(chunk)) * positions).astype(np.int64)
+        accepted = np.flatnonzero(slots < self.capacity)
+        winners = pd.Series(accepted, index=slots[accepted])
+        winners = winners[~winners.index.duplicated(keep='last')]
+
+        for column in self.rows.columns:
+            self.rows.iloc[winners.index.to_numpy(), self.rows.columns.get_loc(column)] = (
+                chunk[column].to_numpy()[winners.to_numpy()]
+            )
+        self.seen += len(chunk)
+
+    def save(self, path):
+        """
+        Saves the sample together with the state of its random generator.
+        """
+        joblib.dump({'capacity': self.capacity, 'seen': self.seen, 'rows': self.rows,
+                     'rng': self._rng.bit_generator.state}, path)
+
+    @classmethod
+    def load(cls, path, capacity):
+        """
+        Loads a saved sample, or creates an empty one if there is none.
+        :param path: File the sample was saved to.
+        :param capacity: Capacity of a new sample, a saved sample keeps its own.
+        """
+        reservoir = cls(capacity)
+        if os.path.exists(path):
+            saved = joblib.load(path)
+            reservoir.capacity, reservoir.seen, reservoir.rows = saved['capacity'], saved['seen'], saved['rows']
+            reservoir._rng.bit_generator.state = saved['rng']
+        return reservoir
+
+
+def read_state(state_dir):
+    """
+    :return: Dictionary of the watermark, the collection end and bundle ID of the last bundle read, and the last
+             version saved, both None before the first run.
+    """
+    path = os.path.join(state_dir, "state.json")
+    if not os.path.exists(path):
+        return {'watermark': None, 'version': None}
+    with open(path) as file:
+        return json.load(file)
+
+
+def write_state(state_dir, state, reservoir):
+    """
+    Saves the sample and then the watermark, each replacing the previous file only once fully written.
+    """
+    os.makedirs(state_dir, exist_ok=True)
+    reservoir_path = os.path.join(state_dir, "reservoir.pkl")
+    reservoir.save(reservoir_path + ".tmp")
+    os.replace(reservoir_path + ".tmp", reservoir_path)
+
+    state_path = os.path.join(state_dir, "state.json")
+    with open(state_path + ".tmp", "w") as file:
+        json.dump(state, file, indent=2)
+    os.replace(state_path + ".tmp", state_path)
+
+
+def read_new_outcomes(engine, watermark, until, chunk_size):
+    """
+    Reads the bundles whose collection ended after the watermark with a server-side cursor.
+    :param engine: SQLAlchemy engine of the database.
+    :param watermark: Dictionary of the last collection end and bundle ID read, or None to read every bundle.
+    :param until: Only bundles whose collection ended by this time are read.
+    :param chunk_size: Number of rows fetched from the database at a time.
+    :return: Iterator of dataframes of bundle columns and the is_reserved and is_collected targets.
+    """
+    if watermark is None:
+        query, params = OUTCOMES_QUERY, {'until': until}
+    else:
+        query = OUTCOMES_SINCE_QUERY
+        params = {'until': until, 'end': datetime.fromisoformat(watermark['collection_end']),
+                  'bid': watermark['bundle_id']}
+
+    with engine.connect() as connection:
+        result = connection.execution_options(stream_results=True, yield_per=chunk_size).execute(query, params)
+        for rows in result.mappings().partitions(chunk_size):
+            yield pd.DataFrame([dict(row) for row in rows])
+
+
+def warm_start(model_dir, version, X, targets, rounds, engine):
+    """
+    Adds boosting rounds to the current pipelines, keeping their fitted preprocessing.
+    :param model_dir: Model directory of the registry.
+    :param version: Version to start from, or None for the models in model_dir itself.
+    :param X: Dataframe of input features.
+    :param targets: Dictionary of target name to its column.
+    :param rounds: Boosting rounds to add.
+    :param engine: Engine the current pipelines must use.
+    :return: Dictionary of target name to (fitted pipeline, fit seconds), or None if the pipelines cannot be
+             warm-started because they use another engine or already have MAX_ESTIMATORS rounds.
+    """
+    model_version = ModelRegistry(model_dir).load(version, use_artifact=False)
+    pipelines = {'reservation': model_version.model_reservation, 'collection': model_version.model_collection}
+
+    fitted = {}
+    for target, pipeline in pipelines.items():
+        classifier = pipeline[-1]
+        parameter = 'n_estimators' if engine == 'gbm' else 'max_iter'
+        current = classifier.get_params().get(parameter)
+        if not isinstance(classifier, type(create_classifier(engine))) or current + rounds > MAX_ESTIMATORS:
+            return None
+
+        started_at = time.perf_counter()
+        classifier.set_params(warm_start=True, **{parameter: current + rounds})
+        classifier.fit(pipeline[:-1].transform(X), targets[target])
+        fitted[target] = (pipeline, time.perf_counter() - started_at)
+    return fitted
+
+
+def save_version(fitted, model_dir, version):
+    """
+    Saves the pipelines as a named version the registry can activate.
+    :return: Directory of the version.
+    """
+    path = ModelRegistry(model_dir).version_path(version)
+    os.makedirs(path, exist_ok=True)
+    save_pipelines(fitted, path)
+    with open(os.path.join(path, VERSION_FILE), "w") as file:
+        file.write(version + "\n")
+    return path
+
+
+def retrain(engine, model_dir=ML_DIR, state_dir=STATE_DIR, mode='auto', model_engine='gbm', chunk_size=5000,
+            reservoir_size=200_000, estimators=300, warm_start_rounds=50, weather_history=None, now=None):
+    """
+    Reads the bundles added since the last run, merges them into the sample and warm-starts or refits the models.
+    :param engine: SQLAlchemy engine of the database.
+    :param model_dir: Model directory of the registry, new versions are saved to its versions directory and warm
+                      starts begin from the last version saved, or the models in model_dir on the first run.
+    :param state_dir: Directory the watermark and sample are kept in.
+    :param mode: 'warm_start', 'refit', or 'auto' to warm-start while possible and refit otherwise.
+    :param model_engine: Engine of refitted pipelines, 'gbm' or 'hist'.
+    :param chunk_size: Number of rows read from the database at a time.
+    :param reservoir_size: Maximum number of rows kept in the sample.
+    :param estimators: Boosting rounds of refitted pipelines.
+    :param warm_start_rounds: Boosting rounds added by a warm start.
+    :param weather_history: WeatherHistory of the bundles weather, loaded from the default files when None.
+    :param now: Current time, used to decide which bundles have settled.
+    :return: Dictionary describing the run, with the saved version if the models were retrained.
+    :raises: ValueError if there is no daily weather history.
+    """
+    weather_history = weather_history or WeatherHistory()
+    if not weather_history.days:
+        raise ValueError(f"No daily weather history at {weather_history.path}, save it with "
+                         f"data_seeding/weather_files/save_weather_data.py before retraining")
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+    until = now - timedelta(hours=LABEL_SETTLE_HOURS)
+
+    state = read_state(state_dir)
+    watermark = state['watermark']
+    reservoir = Reservoir.load(os.path.join(state_dir, "reservoir.pkl"), reservoir_size)
+
+    new_rows = 0
+    for chunk in read_new_outcomes(engine, watermark, until, chunk_size):
+        features = bundle_features(chunk, weather_history.lookup)
+        for target, (column, _) in TARGETS.items():
+            features[column] = chunk[column].astype(bool)
+        reservoir.add(features)
+        new_rows += len(chunk)
+
+        last = chunk.iloc[-1]
+        watermark = {'collection_end': pd.Timestamp(last['collection_end']).isoformat(),
+                     'bundle_id': str(last['bundle_id'])}
+
+    run = {'new_rows': new_rows, 'sample_rows': 0 if reservoir.rows is None else len(reservoir.rows),
+           'rows_seen': reservoir.seen, 'watermark': watermark}
+    if new_rows == 0:
+        return run
+
+    X = reservoir.rows[FEATURES]
+    targets = {target: reservoir.rows[column].astype(bool) for target, (column, _) in TARGETS.items()}
+
+    fitted = None
+    if mode in ('auto', 'warm_start'):
+        fitted = warm_start(model_dir, state['version'], X, targets, warm_start_rounds, model_engine)
+        if fitted is None and mode == 'warm_start':
+            raise ValueError(f"The current models cannot be warm-started with the '{model_engine}' engine")
+    run['mode'] = 'warm_start' if fitted is not None else 'refit'
+    if fitted is None:
+        fitted, _ = fit_targets(model_engine, X, targets, estimators)
+
+    version = now.strftime('%Y%m%dT%H%M%S')
+    run['version'] = version
+    run['path'] = save_version(fitted, model_dir, version)
+
+    # The watermark only moves on once the new version is saved, so a failed run reads the same rows again
+    write_state(state_dir, {'watermark': watermark, 'version': version}, reservoir)
+    return run
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Retrain the models from the bundles and reservations in the database.")
+    parser.add_argument("--database-url", help="Database URL, defaults to the services database.")
+    parser.add_argument("--mode", choices=('auto', 'warm_start', 'refit'), default='auto',
+                        help="Warm-start the current models, refit them, or warm-start while possible.")
+    parser.add_argument("--engine", choices=ENGINES, default='gbm', help="Engine of refitted pipelines.")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="Rows read from the database at a time.")
+    parser.add_argument("--reservoir-size", type=int, default=200_000, help="Rows kept in the training sample.")
+    parser.add_argument("--estimators", type=int, default=300, help="Boosting rounds of refitted pipelines.")
+    parser.add_argument("--warm-start-rounds", type=int, default=50, help="Boosting rounds added by a warm start.")
+    parser.add_argument("--model-dir", default=ML_DIR, help="Model directory of the service.")
+    parser.add_argument("--state-dir", default=STATE_DIR, help="Directory the watermark and sample are kept in.")
+    args = parser.parse_args(argv)
+
+    if args.database_url:
+        engine = create_engine(args.database_url)
+    else:
+        from ..database import engine
+
+    run = retrain(engine, args.model_dir, args.state_dir, args.mode, args.engine, args.chunk_size,
+                  args.reservoir_size, args.estimators, args.warm_start_rounds)
+    if run['new_rows'] == 0:
+        print("No new bundles since the last run")
+    else:
+        print(f"Read {run['new_rows']} new bundles, {run['rows_seen']} seen in total, trained on a sample of "
+              f"{run['sample_rows']} with {run['mode']} and saved version {run['version']} to {run['path']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
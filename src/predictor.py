@@ -0,0 +1,220 @@
+import joblib
+import numpy as np
+from scipy.special import expit
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import FunctionTransformer, OneHotEncoder, StandardScaler
+
+from .metrics import time_stage
+from .trees import FlatForest
+
+
+class CompiledPreprocessor:
+    """
+    Plain NumPy version of the fitted ColumnTransformer.
+    One-hot encoding uses lookup tables from category to output column and numeric columns use the fitted
+    log1p and scaler constants, giving the same matrix as the sklearn preprocessor without pandas.
+    """
+
+    def __init__(self, input_columns, categorical, numeric_columns, numeric_offset, log_mask, mean, scale, n_outputs):
+        """
+        :param input_columns: Names of the input columns, in the order used for NumPy rows.
+        :param categorical: List of (column, {category: output index}) lookup tables.
+        :param numeric_columns: Names of the numeric input columns, in output order.
+        :param numeric_offset: Output index of the first numeric column.
+        :param log_mask: Boolean array marking the numeric columns that are log1p transformed.
+        :param mean: Scaler mean of each numeric column.
+        :param scale: Scaler scale of each numeric column.
+        :param n_outputs: Width of the transformed matrix.
+        """
+        self.input_columns = list(input_columns)
+        self.categorical = categorical
+        self.numeric_columns = numeric_columns
+        self.numeric_offset = numeric_offset
+        self.log_mask = log_mask
+        self.mean = mean
+        self.scale = scale
+        self.n_outputs = n_outputs
+
+    @classmethod
+    def from_column_transformer(cls, preprocessor):
+        """
+        Compiles a fitted ColumnTransformer made of one-hot, log1p and standard scaler pipelines.
+        :param preprocessor: The fitted ColumnTransformer.
+        :return: The compiled preprocessor.
+        :raises: ValueError if the preprocessor uses a step that cannot be compiled.
+        """
+        categorical = []
+        numeric_columns = []
+        log_mask = []
+        mean = []
+        scale = []
+        offset = 0
+
+        for name, transformer, columns in preprocessor.transformers_:
+            if isinstance(transformer, str):
+                if transformer == 'drop':
+                    continue
+                raise ValueError(f"Cannot compile transformer '{name}'")
+
+            steps = transformer.steps if isinstance(transformer, Pipeline) else [(name, transformer)]
+            encoder = [step for _, step in steps if isinstance(step, OneHotEncoder)]
+
+            if encoder:
+                # Categorical transformers must come before every numeric one so the numeric block is contiguous
+                if len(steps) != 1 or encoder[0].drop_idx_ is not None or numeric_columns:
+                    raise ValueError(f"Cannot compile categorical transformer '{name}'")
+                for column, categories in zip(columns, encoder[0].categories_):
+                    categorical.append((column, {category: offset + i for i, category in enumerate(categories)}))
+                    offset += len(categories)
+                continue
+
+            column_log = False
+            column_mean = np.zeros(len(columns))
+            column_scale = np.ones(len(columns))
+            for _, step in steps:
+                if isinstance(step, FunctionTransformer) and step.func is np.log1p and step.inverse_func is None:
+                    column_log = True
+                elif isinstance(step, StandardScaler):
+                    column_mean = step.mean_ if step.with_mean else column_mean
+                    column_scale = step.scale_ if step.with_std else column_scale
+                else:
+                    raise ValueError(f"Cannot compile step {step!r} of transformer '{name}'")
+
+            numeric_columns.extend(columns)
+            log_mask.extend([column_log] * len(columns))
+            mean.extend(column_mean)
+            scale.extend(column_scale)
+
+        numeric_offset = offset
+        return cls(
+            preprocessor.feature_names_in_, categorical, numeric_columns, numeric_offset,
+            np.array(log_mask, dtype=bool), np.array(mean, dtype=np.float64), np.array(scale, dtype=np.float64),
+            numeric_offset + len(numeric_columns)
+        )
+
+    def columns(self, rows):
+        """
+        Gets each input column as a sequence of values.
+        :param rows: A dict, a list of dicts, a NumPy row or matrix in input_columns order, or a dataframe.
+        :return: Dictionary of column name to values and the number of rows.
+        """
+        if isinstance(rows, dict):
+            return {column: [rows[column]] for column in self.input_columns}, 1
+
+        if isinstance(rows, np.ndarray):
+            matrix = rows.reshape(1, -1) if rows.ndim == 1 else rows
+            return {column: matrix[:, i] for i, column in enumerate(self.input_columns)}, len(matrix)
+
+        if hasattr(rows, 'columns'):
+            return {column: rows[column].to_numpy() for column in self.input_columns}, len(rows)
+
+        return {column: [row[column] for row in rows] for column in self.input_columns}, len(rows)
+
+    def transform(self, rows):
+        """
+        Transforms the input rows into the matrix the classifiers were trained on.
+        :param rows: A dict, a list of dicts, a NumPy row or matrix in input_columns order, or a dataframe.
+        :return: Float64 matrix with one row per input row.
+        """
+        columns, n_rows = self.columns(rows)
+        matrix = np.zeros((n_rows, self.n_outputs), dtype=np.float64)
+
+        # Sets the output column of each known category to 1, unknown categories are left as all zeros
+        for column, lookup in self.categorical:
+            indices = np.fromiter((lookup.get(value, -1) for value in columns[column]), dtype=np.intp, count=n_rows)
+            known = indices >= 0
+            matrix[np.flatnonzero(known), indices[known]] = 1.0
+
+        numeric = np.column_stack([np.asarray(columns[column], dtype=np.float64) for column in self.numeric_columns])
+        numeric[:, self.log_mask] = np.log1p(numeric[:, self.log_mask])
+        numeric -= self.mean
+        numeric /= self.scale
+        matrix[:, self.numeric_offset:] = numeric
+
+        return matrix
+
+
+class CompiledEnsemble:
+    """
+    A fitted binary GradientBoostingClassifier evaluated with the flattened tree engine.
+    """
+
+    def __init__(self, forest, classes):
+        """
+        :param forest: The classifiers trees packed into a FlatForest.
+        :param classes: The classifiers classes_ array.
+        """
+        self.forest = forest
+        self.classes = classes
+
+    @classmethod
+    def from_classifier(cls, classifier):
+        """
+        Extracts the trees from a fitted classifier.
+        :param classifier: Fitted binary GradientBoostingClassifier.
+        :return: The compiled ensemble.
+        :raises: ValueError if the classifier is not a binary GradientBoostingClassifier.
+        """
+        return cls(FlatForest.from_gradient_boosting(classifier), classifier.classes_)
+
+    def predict(self, matrix):
+        """
+        Predicts the class and positive class probability of each row.
+        :param matrix: Transformed input matrix.
+        :return: Array of predicted classes and array of positive class probabilities.
+        """
+        scores = self.forest.decision_function(matrix)
+        return self.classes[(scores >= 0).astype(int)], expit(scores)
+
+
+class CompiledPredictor:
+    """
+    Pandas-free predictor for the reservation and collection models, exported from the fitted pipelines.
+    Has the same predict interface as InferenceEngine but takes plain dicts or NumPy rows.
+    """
+
+    def __init__(self, reservation_preprocessor, reservation_ensemble, collection_preprocessor, collection_ensemble):
+        self.reservation_preprocessor = reservation_preprocessor
+        self.reservation_ensemble = reservation_ensemble
+        self.collection_preprocessor = collection_preprocessor
+        self.collection_ensemble = collection_ensemble
+
+    @classmethod
+    def from_pipelines(cls, model_reservation, model_collection):
+        """
+        Compiles the fitted reservation and collection pipelines.
+        :param model_reservation: Fitted reservation pipeline.
+        :param model_collection: Fitted collection pipeline.
+        :return: The compiled predictor.
+        :raises: ValueError if either pipeline contains a step that cannot be compiled.
+        """
+        reservation_preprocessor = CompiledPreprocessor.from_column_transformer(model_reservation[0])
+        if joblib.hash(model_reservation[:-1]) == joblib.hash(model_collection[:-1]):
+            collection_preprocessor = reservation_preprocessor
+        else:
+            collection_preprocessor = CompiledPreprocessor.from_column_transformer(model_collection[0])
+
+        return cls(
+            reservation_preprocessor, CompiledEnsemble.from_classifier(model_reservation[-1]),
+            collection_preprocessor, CompiledEnsemble.from_classifier(model_collection[-1])
+        )
+
+    def predict(self, rows):
+        """
+        Predicts reservation and collection for the input rows.
+        :param rows: A dict, a list of dicts, a NumPy row or matrix in input column order, or a dataframe.
+        :return: Arrays of reservation predictions, reservation probabilities, collection predictions and collection probabilities.
+        """
+        with time_stage("preprocessing"):
+            reservation_matrix = self.reservation_preprocessor.transform(rows)
+            if self.collection_preprocessor is self.reservation_preprocessor:
+                collection_matrix = reservation_matrix
+            else:
+                collection_matrix = self.collection_preprocessor.transform(rows)
+
+        with time_stage("inference_reservation"):
+            reservation_predictions, reservation_probabilities = self.reservation_ensemble.predict(reservation_matrix)
+        with time_stage("inference_collection"):
+            collection_predictions, collection_probabilities = self.collection_ensemble.predict(collection_matrix)
+
+        return reservation_predictions, reservation_probabilities, collection_predictions, collection_probabilities
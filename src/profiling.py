@@ -0,0 +1,146 @@
+import hmac
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from dotenv import load_dotenv
+
+from . import auth
+
+# Load environment variables
+load_dotenv()
+
+# Profiling is off unless enabled here, and then only runs for requests sending the admin token in PROFILE_HEADER
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/forecast-profiles")
+PROFILE_HEADER = b"x-profile-token"
+
+# Milliseconds between stack samples
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "1"))
+
+# Requests that can be profiled, the single predictions but not the batch endpoint sharing the predict prefix. The
+# middleware runs before routing, so the raw path is matched rather than the route template
+PROFILED_PATHS = re.compile(r"/forecast/(simulate|predict/(?!batch$)[^/]+)$")
+
+
+class StackSampler:
+    """
+    Sampling profiler recording the call stacks of the request's event loop thread and the inference threads.
+    Stacks are written in the collapsed format read by flamegraph.pl and speedscope, one line per unique stack
+    with frames from the root down separated by semicolons and followed by the number of samples.
+    """
+
+    def __init__(self, thread_ids, interval):
+        """
+        :param thread_ids: Idents of threads to sample on top of the inference threads.
+        :param interval: Seconds between samples.
+        """
+        self.thread_ids = set(thread_ids)
+        self.interval = interval
+        self.samples = 0
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _targets(self):
+        """
+        Gets the idents of the threads to sample, including inference threads started after profiling began.
+        """
+        inference = {thread.ident for thread in threading.enumerate() if thread.name.startswith("inference")}
+        return self.thread_ids | inference
+
+    def _sample(self):
+        """
+        Records the current stack of every target thread.
+        """
+        frames = sys._current_frames()
+        for thread_id in self._targets():
+            frame = frames.get(thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+    def start(self):
+        """
+        Starts sampling on a background thread.
+        """
+        def run():
+            while not self._stop.wait(self.interval):
+                self._sample()
+
+        self._thread = threading.Thread(target=run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops sampling.
+        """
+        self._stop.set()
+        self._thread.join()
+
+    def write_collapsed(self, path):
+        """
+        Writes the recorded stacks in the collapsed stack format.
+        :param path: File to write.
+        """
+        with open(path, "w") as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f"{stack} {count}\n")
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware profiling single prediction requests that ask for it with the admin token.
+    Only one request is profiled at a time, others are served normally. The name of the profile file is returned
+    in the X-Profile-File response header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._lock = threading.Lock()
+
+    def _wants_profile(self, scope):
+        """
+        Checks profiling is enabled and the request is a profiled path with the privileged header.
+        """
+        if not PROFILING_ENABLED or scope["type"] != "http" or not PROFILED_PATHS.search(scope["path"]):
+            return False
+
+        token = dict(scope["headers"]).get(PROFILE_HEADER, b"")
+        return bool(auth.ADMIN_TOKEN) and hmac.compare_digest(token, auth.ADMIN_TOKEN.encode())
+
+    async def __call__(self, scope, receive, send):
+        if not self._wants_profile(scope) or not self._lock.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            # Named by time and the last part of the path, which is the bundle ID for bundle forecasts
+            endpoint = re.sub(r"[^A-Za-z0-9_-]", "_", scope["path"].rsplit("/", 1)[-1])
+            name = f"{time.strftime('%Y%m%dT%H%M%S')}-{time.time_ns() % 10**9:09d}-{endpoint}.collapsed"
+            sampler = StackSampler([threading.get_ident()], PROFILE_INTERVAL_MS / 1000)
+
+            async def send_with_profile_header(message):
+                if message["type"] == "http.response.start":
+                    message = dict(message, headers=list(message.get("headers", [])) + [
+                        (b"x-profile-file", name.encode())
+                    ])
+                await send(message)
+
+            sampler.start()
+            try:
+                await self.app(scope, receive, send_with_profile_header)
+            finally:
+                sampler.stop()
+                sampler.write_collapsed(os.path.join(PROFILE_DIR, name))
+        finally:
+            self._lock.release()
@@ -0,0 +1,303 @@
+import hashlib
+import os
+import threading
+from datetime import datetime, timezone
+
+import joblib
+import pandas as pd
+from dotenv import load_dotenv
+
+from .artifact import ARTIFACT_FILE, ArtifactError, load_artifact
+from .inference import InferenceEngine
+from .metrics import time_stage
+from .predictor import CompiledPredictor
+
+# Load environment variables
+load_dotenv()
+
+# Largest batch scored with the compiled predictor before switching to the sklearn pipelines, the two take about
+# as long from around 10000 rows
+COMPILED_MAX_ROWS = int(os.getenv("COMPILED_MAX_ROWS", "5000"))
+
+# Model files every version directory must contain
+RESERVATION_FILE = "pipeline_reservation.pkl"
+COLLECTION_FILE = "pipeline_collection.pkl"
+VERSION_FILE = "VERSION"
+
+# Versions with an exported artifact are memory-mapped from it instead of unpickling the pipelines
+MODEL_ARTIFACT_ENABLED = os.getenv("MODEL_ARTIFACT_ENABLED", "true").lower() == "true"
+
+# Input used to warm up and sanity check a new version before it goes live
+WARM_UP_INPUT = {
+    'discount': 0.5,
+    'price': 5.0,
+    'weather': 'Sunny',
+    'category': 'BREAD_BAKED_GOODS',
+    'temperature': 18.0,
+    'day': 'Friday',
+    'lead_time': 2.0,
+    'window_length': 1.5,
+    'time_of_day': 17
+}
+
+
+class ModelVersion:
+    """
+    One loaded version of the reservation and collection models together with their inference engines.
+    A version loaded from an artifact only has the compiled predictor, which then serves every batch size. It is
+    faster than the pipelines up to COMPILED_MAX_ROWS and about as fast beyond, which the engine benchmarks check.
+    """
+
+    def __init__(self, version, path, model_reservation, model_collection, compiled_predictor=None):
+        """
+        :param version: Name of the version.
+        :param path: Directory the models were loaded from.
+        :param model_reservation: Fitted reservation pipeline, or None when loaded from an artifact.
+        :param model_collection: Fitted collection pipeline, or None when loaded from an artifact.
+        :param compiled_predictor: Predictor loaded from an artifact, compiled from the pipelines when None.
+        """
+        self.version = version
+        self.path = path
+        self.model_reservation = model_reservation
+        self.model_collection = model_collection
+        self.loaded_at = datetime.now(timezone.utc)
+        self.compiled_predictor = compiled_predictor
+        self.inference_engine = None
+        if compiled_predictor is not None:
+            return
+
+        self.inference_engine = InferenceEngine(model_reservation, model_collection)
+
+        # Compiling the pipelines for fast predictions, falling back to sklearn if they contain unsupported steps
+        try:
+            self.compiled_predictor = CompiledPredictor.from_pipelines(model_reservation, model_collection)
+        except ValueError as e:
+            print(f"Could not compile models for version {version}: {e}")
+
+    def predict(self, rows):
+        """
+        Predicts reservation and collection with the fastest engine for the number of rows.
+        :param rows: A dict for a single prediction, or a list of dicts or a dataframe with one row per prediction.
+        :return: Arrays of reservation predictions, reservation probabilities, collection predictions and collection probabilities.
+        """
+        n_rows = 1 if isinstance(rows, dict) else len(rows)
+
+        # The compiled predictor skips the pandas preprocessing, which outweighs sklearn's faster tree traversal until
+        # batches are very large
+        if self.compiled_predictor and (n_rows <= COMPILED_MAX_ROWS or self.inference_engine is None):
+            return self.compiled_predictor.predict(rows)
+
+        if isinstance(rows, dict):
+            rows = [rows]
+        if isinstance(rows, list):
+            with time_stage("dataframe"):
+                rows = pd.DataFrame(rows)
+        return self.inference_engine.predict(rows)
+
+    def warm_up(self):
+        """
+        Runs sample predictions through every engine so the first real request does not pay for lazy initialisation.
+        :raises: ValueError if the engines disagree, meaning the version cannot be served safely.
+        """
+        if self.inference_engine is None:
+            self.compiled_predictor.predict(WARM_UP_INPUT)
+            return
+
+        sklearn_outputs = self.inference_engine.predict(pd.DataFrame([WARM_UP_INPUT]))
+        if self.compiled_predictor:
+            compiled_outputs = self.compiled_predictor.predict(WARM_UP_INPUT)
+            for sklearn_output, compiled_output in zip(sklearn_outputs, compiled_outputs):
+                if sklearn_output[0] != compiled_output[0]:
+                    raise ValueError(f"Compiled predictor does not match the pipelines for version {self.version}")
+
+    def describe(self):
+        """
+        :return: Dictionary describing the version.
+        """
+        return {
+            'model_version': self.version,
+            'path': self.path,
+            'loaded_at': self.loaded_at.isoformat(),
+            'compiled': self.compiled_predictor is not None,
+            'format': 'pickle' if self.inference_engine else 'artifact'
+        }
+
+
+class ModelRegistry:
+    """
+    Holds the model version currently being served and swaps in new versions without a restart.
+    A new version is fully loaded and warmed up before it replaces the current one, so requests never see a
+    partially loaded model. Requests read current once and keep using that version even if a swap happens.
+    """
+
+    def __init__(self, model_dir):
+        """
+        :param model_dir: Directory holding the default models and a 'versions' directory of named versions.
+        """
+        self.model_dir = model_dir
+        self.current = None
+        self.history = []
+        self._listeners = []
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+        self._stop_watching = threading.Event()
+        self._watched_signature = None
+
+    def version_path(self, version=None):
+        """
+        Gets the directory of a version.
+        :param version: Name of a directory in model_dir/versions, or None for the models in model_dir itself.
+        :return: Path of the version directory.
+        :raises: ValueError if the version name is not a plain directory name.
+        """
+        if version is None:
+            return self.model_dir
+        if os.path.basename(version) != version or version in ("", ".", ".."):
+            raise ValueError(f"Invalid model version '{version}'")
+        return os.path.join(self.model_dir, "versions", version)
+
+    def load(self, version=None, use_artifact=MODEL_ARTIFACT_ENABLED):
+        """
+        Loads and warms up a version without making it live.
+        :param version: Name of the version to load, or None for the models in model_dir.
+        :param use_artifact: Memory-map the versions artifact when it has one, instead of unpickling the pipelines.
+        :return: The loaded ModelVersion.
+        :raises: ArtifactError if the version only has an artifact and it is corrupt or of another schema version.
+        """
+        return self.load_path(self.version_path(version), use_artifact)
+
+    def load_path(self, path, use_artifact=MODEL_ARTIFACT_ENABLED):
+        """
+        Loads and warms up the version in a directory without making it live, used by the inference workers to
+        load the same version as the service from its ModelVersion.path.
+        :param path: Directory of the version.
+        :param use_artifact: Memory-map the versions artifact when it has one, instead of unpickling the pipelines.
+        :return: The loaded ModelVersion.
+        :raises: ArtifactError if the version only has an artifact and it is corrupt or of another schema version.
+        """
+        reservation_path = os.path.join(path, RESERVATION_FILE)
+        collection_path = os.path.join(path, COLLECTION_FILE)
+        artifact_path = os.path.join(path, ARTIFACT_FILE)
+        has_pipelines = os.path.exists(reservation_path) and os.path.exists(collection_path)
+        name = _version_name(path, reservation_path, collection_path) if has_pipelines else None
+
+        if use_artifact and os.path.exists(artifact_path):
+            try:
+                compiled_predictor, artifact_version = load_artifact(artifact_path)
+            except ArtifactError as e:
+                # A bad artifact is only fatal when there are no pipelines to fall back to
+                if name is None:
+                    raise
+                print(f"Could not load artifact of version {name}: {e}")
+            else:
+                # An artifact exported from older pipelines than the ones next to it is ignored
+                if name is None or artifact_version == name:
+                    model_version = ModelVersion(artifact_version, path, None, None, compiled_predictor)
+                    model_version.warm_up()
+                    return model_version
+                print(f"Ignoring artifact of version {artifact_version} as the pipelines are version {name}")
+
+        model_version = ModelVersion(name, path, joblib.load(reservation_path), joblib.load(collection_path))
+        model_version.warm_up()
+        return model_version
+
+    def activate(self, model_version):
+        """
+        Makes a loaded version live.
+        :param model_version: The ModelVersion to serve.
+        """
+        previous = self.current
+        self.current = model_version
+        self.history.append(model_version.describe())
+
+        for listener in self._listeners:
+            listener(model_version, previous)
+
+    def reload(self, version=None):
+        """
+        Loads, warms up and activates a version. The current version keeps serving if anything fails.
+        :param version: Name of the version to load, or None for the models in model_dir.
+        :return: The new ModelVersion.
+        """
+        with self._reload_lock:
+            model_version = self.load(version)
+            self.activate(model_version)
+            self._watched_signature = self._signature()
+            return model_version
+
+    def add_listener(self, listener):
+        """
+        Registers a function called with the new and previous version after every swap.
+        :param listener: Function taking (new_version, previous_version).
+        """
+        self._listeners.append(listener)
+
+    def _signature(self):
+        """
+        Gets the modification times of the default model files, used to detect a new version being copied in.
+        """
+        signature = []
+        for name in (RESERVATION_FILE, COLLECTION_FILE, VERSION_FILE, ARTIFACT_FILE):
+            path = os.path.join(self.model_dir, name)
+            signature.append(os.stat(path).st_mtime_ns if os.path.exists(path) else None)
+        return tuple(signature)
+
+    def check_for_changes(self):
+        """
+        Reloads the default models if their files have changed since they were last loaded.
+        :return: True if a new version was activated.
+        """
+        if self._signature() == self._watched_signature:
+            return False
+
+        try:
+            model_version = self.reload()
+            print(f"Model version {model_version.version} activated")
+            return True
+        except Exception as e:
+            # Files may still be being copied in, so the next check tries again
+            print(f"Could not reload models: {e}")
+            return False
+
+    def start_watching(self, interval):
+        """
+        Starts a background thread that reloads the default models when their files change.
+        :param interval: Seconds between checks.
+        """
+        if self._watcher is not None:
+            return
+
+        self._stop_watching.clear()
+
+        def watch():
+            while not self._stop_watching.wait(interval):
+                self.check_for_changes()
+
+        self._watcher = threading.Thread(target=watch, name="model-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self):
+        """
+        Stops the background file watcher.
+        """
+        if self._watcher is not None:
+            self._stop_watching.set()
+            self._watcher.join()
+            self._watcher = None
+
+
+def _version_name(path, reservation_path, collection_path):
+    """
+    Gets the name of a version from its VERSION file, or a digest of the pipeline files if it has none.
+    """
+    version_file = os.path.join(path, VERSION_FILE)
+    if os.path.exists(version_file):
+        with open(version_file) as file:
+            return file.read().strip()
+
+    digest = hashlib.sha256()
+    for model_path in (reservation_path, collection_path):
+        with open(model_path, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()[:12]
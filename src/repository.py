@@ -0,0 +1,78 @@
+import uuid
+
+from sqlalchemy import text, bindparam
+
+# Bundle columns the models need, everything else in the bundles table is left in the database
+BUNDLE_COLUMNS = (
+    "bundle_id", "collection_start", "posting_time", "collection_end", "retail_price", "price", "category"
+)
+
+_SELECT_BUNDLES = (
+    "SELECT " + ", ".join(f"b.{column}" for column in BUNDLE_COLUMNS) + ", v.postcode "
+    "FROM bundles b LEFT JOIN vendor v ON v.vendor_id = b.vendor_id "
+)
+
+# Built once so SQLAlchemy reuses the compiled statement and asyncpg its prepared statement on every request
+BUNDLE_QUERY = text(_SELECT_BUNDLES + "WHERE b.bundle_id = :bid AND b.vendor_id = :vid")
+BUNDLES_QUERY = text(
+    _SELECT_BUNDLES + "WHERE b.bundle_id IN :bids AND b.vendor_id = :vid"
+).bindparams(bindparam('bids', expanding=True))
+ACTIVE_BUNDLES_QUERY = text(
+    "SELECT " + ", ".join(BUNDLE_COLUMNS) + " FROM bundles "
+    "WHERE vendor_id = :vid AND collection_end >= CURRENT_TIMESTAMP ORDER BY collection_start"
+)
+
+
+async def get_bundle(db, bundle_id, vendor_id):
+    """
+    Gets a bundle of the vendor together with the vendors postcode in one query.
+    :param db: Async database session.
+    :param bundle_id: ID of the bundle.
+    :param vendor_id: ID of the vendor.
+    :return: Mapping of the bundle columns and postcode, or None if the vendor has no such bundle.
+             The postcode is None if the vendor has no location.
+    """
+    return (await db.execute(BUNDLE_QUERY, {'bid': bundle_id, 'vid': vendor_id})).mappings().first()
+
+
+def _normalise_id(bundle_id):
+    """
+    Gets the canonical form of a bundle ID, so IDs compare equal whether they are strings, in any case, or the UUID
+    objects asyncpg returns for Postgres uuid columns.
+    :param bundle_id: ID of the bundle.
+    :return: The lowercase hyphenated UUID, or the ID as a string if it is not a UUID.
+    """
+    try:
+        return str(uuid.UUID(str(bundle_id)))
+    except ValueError:
+        return str(bundle_id)
+
+
+async def get_bundles(db, bundle_ids, vendor_id):
+    """
+    Gets many bundles of the vendor together with the vendors postcode in one query.
+    :param db: Async database session.
+    :param bundle_ids: IDs of the bundles.
+    :param vendor_id: ID of the vendor.
+    :return: Dictionary of bundle ID, as it was requested, to the mapping of its columns and postcode, for every
+             bundle that was found.
+    """
+
+    # Both sides are normalised as SQLite returns the stored strings while asyncpg returns UUID objects
+    requested = {_normalise_id(bundle_id): bundle_id for bundle_id in bundle_ids}
+    rows = (await db.execute(BUNDLES_QUERY, {'bids': list(requested), 'vid': vendor_id})).mappings().all()
+    return {requested[_normalise_id(row['bundle_id'])]: row for row in rows}
+
+
+async def stream_active_bundles(db, vendor_id, chunk_size):
+    """
+    Reads every active or upcoming bundle of the vendor with a server-side cursor.
+    :param db: Async database session.
+    :param vendor_id: ID of the vendor.
+    :param chunk_size: Number of bundles read from the database at a time.
+    :return: Async iterator of lists of bundle mappings, ordered by collection start.
+    """
+    query = ACTIVE_BUNDLES_QUERY.execution_options(yield_per=chunk_size)
+    result = (await db.stream(query, {'vid': vendor_id})).mappings()
+    async for chunk in result.partitions(chunk_size):
+        yield chunk
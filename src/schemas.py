@@ -1,4 +1,5 @@
-from pydantic import BaseModel
+from typing import Optional
+from pydantic import BaseModel, Field
 
 class SimulationRequest(BaseModel):
     """
@@ -11,4 +12,18 @@ class SimulationRequest(BaseModel):
     weather: str
     category: str
     day: str
-    time_of_day: int
\ No newline at end of file
+    time_of_day: int
+
+
+class BatchPredictionRequest(BaseModel):
+    """
+    Defines the input structure for the batch prediction request.
+    """
+    bundle_ids: list[str] = Field(min_length=1, max_length=500)
+
+
+class ModelReloadRequest(BaseModel):
+    """
+    Defines the input structure for the model reload request.
+    """
+    version: Optional[str] = None
\ No newline at end of file
@@ -1,65 +1,270 @@
+import copy
 import os
-import requests
-import joblib
+import pandas as pd
 from fastapi import HTTPException
 from sqlalchemy import text
 from dotenv import load_dotenv
 
+from .batching import MicroBatcher, input_may_be_at_fault
+from .cache import TTLCache
+from .metrics import time_stage
+from .concurrency import StageBusy, db_limiter, weather_limiter, run_inference, inference_pool
+from .features import bundle_features, bundle_feature_columns
+from .registry import ModelRegistry, COMPILED_MAX_ROWS, WARM_UP_INPUT
+from .weather import WeatherClient, WeatherUnavailable, Climatology
+
 # Load environment variables
 load_dotenv()
 
+# Weather only changes every few minutes so it is cached per postcode
+WEATHER_CACHE_TTL = float(os.getenv("WEATHER_CACHE_TTL", "600"))
+WEATHER_CACHE_SIZE = int(os.getenv("WEATHER_CACHE_SIZE", "1024"))
+weather_cache = TTLCache(ttl=WEATHER_CACHE_TTL, maxsize=WEATHER_CACHE_SIZE)
+
+# Pooled weather API client and the typical weather used when the API is unavailable
+weather_client = WeatherClient(os.getenv("WEATHER_API_KEY"))
+climatology = Climatology()
+
 # Location of the models
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 ML_DIR = os.path.join(BASE_DIR, "ml")
+MODEL_DIR = os.getenv("MODEL_DIR", ML_DIR)
+
+# Seconds between checks for new model files, 0 disables the watcher
+MODEL_WATCH_INTERVAL = float(os.getenv("MODEL_WATCH_INTERVAL", "0"))
+
+# Holds the model version being served so a retrained model can be swapped in without a restart
+registry = ModelRegistry(MODEL_DIR)
+
+
+def load_worker_models(path):
+    """
+    Loads the version being served in an inference worker process, run by each worker when it starts.
+    :param path: Directory of the version, from its ModelVersion.path.
+    """
+    registry.current = registry.load_path(path)
+
+
+def restart_inference_workers(new_version, previous_version):
+    """
+    Replaces the inference worker processes, which hold the models from when they started, after every swap.
+    """
+    inference_pool.set_initializer(load_worker_models, new_version.path)
+    inference_pool.restart()
+
+
+registry.add_listener(restart_inference_workers)
+
+# Identical inputs get the same forecast, so predictions are cached for as long as the weather they used
+PREDICTION_CACHE_ENABLED = os.getenv("PREDICTION_CACHE_ENABLED", "true").lower() == "true"
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "4096"))
+
+# Decimal places the float features are rounded to, fewer places make nearby inputs share a cache entry
+PREDICTION_CACHE_DECIMALS = int(os.getenv("PREDICTION_CACHE_DECIMALS", "4"))
+
+prediction_cache = TTLCache(
+    ttl=WEATHER_CACHE_TTL if PREDICTION_CACHE_ENABLED else 0, maxsize=PREDICTION_CACHE_SIZE
+)
 
-# Attempting to load the pre-trained ML pipelines.
-try:
-    model_reservation = joblib.load(os.path.join(ML_DIR, "pipeline_reservation.pkl"))
-    model_collection = joblib.load(os.path.join(ML_DIR, "pipeline_collection.pkl"))
-    print("Models loaded successfully")
-except Exception as e:
-    print(f"Could not load models: {e}")
-    model_reservation = None
-    model_collection = None
+# Model features in the order used for the prediction cache key
+FLOAT_FEATURES = ('discount', 'price', 'temperature', 'lead_time', 'window_length')
+CATEGORICAL_FEATURES = ('weather', 'category', 'day')
 
+# Cached predictions belong to the model version that made them
+registry.add_listener(lambda new_version, previous_version: prediction_cache.clear())
 
-def predict(input_df):
+# Concurrent single predictions are collected into batches, the window only applies while the service is busy
+BATCH_ENABLED = os.getenv("BATCH_ENABLED", "true").lower() == "true"
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "64"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "2"))
+
+# Bundle row used to warm up building model inputs from the database columns
+WARM_UP_BUNDLE = {
+    'collection_start': '2025-01-10 17:00:00',
+    'posting_time': '2025-01-10 15:00:00',
+    'collection_end': '2025-01-10 18:30:00',
+    'retail_price': 10.0,
+    'price': 5.0,
+    'category': WARM_UP_INPUT['category']
+}
+
+
+def load_models():
     """
-    Runs input_df through both the reservation and collection models and returns a prediction for each.
-    :param input_df: Dataframe containing input data such as discount, price, weather etc.
+    Loads and activates the pre-trained ML pipelines, unless a version is already being served.
+    :return: The ModelVersion being served.
+    :raises: Exception if the model files cannot be loaded.
+    """
+    if registry.current is None:
+        model_version = registry.reload()
+        print(f"Models loaded successfully, version {model_version.version}")
+    return registry.current
+
+
+def warm_up():
+    """
+    Runs sample inputs through the service level prediction paths, so the first real requests do not pay for
+    lazy initialisation. The registry already warms up the models themselves when a version is loaded, this
+    covers building inputs from a bundle, formatting results and the sklearn path used for large batches.
+    :raises: HTTPException if a prediction fails.
+    """
+    input_data = build_bundle_input(WARM_UP_BUNDLE, WARM_UP_INPUT['weather'], WARM_UP_INPUT['temperature'])
+    predict_many([input_data, WARM_UP_INPUT])
+    predict_batch(pd.DataFrame([WARM_UP_INPUT] * (COMPILED_MAX_ROWS + 1)))
+
+
+def format_result(reservation_prediction, reservation_probability, collection_prediction, collection_probability):
+    """
+    Builds the response dictionary for a single forecast.
+    :param reservation_prediction: Boolean reservation prediction.
+    :param reservation_probability: Probability that the bundle is reserved.
+    :param collection_prediction: Boolean collection prediction.
+    :param collection_probability: Probability that the bundle is collected.
     :return: A nested dictionary containing boolean predictions for both reservation and collection and their corresponding confidence.
     """
-    if not model_reservation or not model_collection:
+    return {
+        'reservation': {
+            'reservation_prediction': bool(reservation_prediction),
+            'reservation_probability': round(float(reservation_probability) * 100),
+        },
+        'collection': {
+            'collection_prediction': bool(collection_prediction),
+            'collection_probability': round(float(collection_probability) * 100),
+        }
+    }
+
+
+def predict(input_data):
+    """
+    Runs a single input through both the reservation and collection models and returns a prediction for each.
+    Uses the compiled predictor when available so the hot path does not build a dataframe.
+    :param input_data: Dictionary containing input data such as discount, price, weather etc.
+    :return: A nested dictionary containing boolean predictions for both reservation and collection, their corresponding confidence and the model version.
+    """
+    return _predict_rows(input_data)[0]
+
+
+async def predict_async(input_data):
+    """
+    Runs a single input through both models without blocking the event loop.
+    Inputs that were predicted recently are answered from the prediction cache, otherwise the input joins a
+    micro-batch with other concurrent requests when batching is enabled.
+    :param input_data: Dictionary containing input data such as discount, price, weather etc.
+    :return: A nested dictionary containing boolean predictions for both reservation and collection, their corresponding confidence and the model version.
+    """
+    model = registry.current
+    if not model or prediction_cache.ttl <= 0:
+        return await _predict_uncached(input_data)
+
+    # The rounded input is what gets predicted so every input sharing a key gets the same forecast
+    features = canonicalize_input(input_data)
+    key = (model.version,) + tuple(features.values())
+    result = await prediction_cache.aget_or_load(key, lambda: _predict_uncached(features))
+
+    # Callers add fields such as the bundle ID, so each gets its own copy of the cached result
+    return copy.deepcopy(result)
+
+
+async def _predict_uncached(input_data):
+    """
+    Runs a single input through both models, in a micro-batch when batching is enabled.
+    """
+    if BATCH_ENABLED:
+        return await batcher.submit(input_data)
+    return await run_inference(predict, input_data)
+
+
+def canonicalize_input(input_data):
+    """
+    Puts the model features of an input into a fixed order with the floats rounded, used as the prediction cache key.
+    :param input_data: Dictionary containing input data such as discount, price, weather etc.
+    :return: Dictionary of the features with the float features rounded to PREDICTION_CACHE_DECIMALS places.
+    """
+    features = {feature: round(float(input_data[feature]), PREDICTION_CACHE_DECIMALS) for feature in FLOAT_FEATURES}
+    features.update({feature: str(input_data[feature]) for feature in CATEGORICAL_FEATURES})
+    features['time_of_day'] = int(input_data['time_of_day'])
+    return features
+
+
+def predict_batch(input_df):
+    """
+    Runs every row of input_df through both models in a single call per model.
+    :param input_df: Dataframe with one row per forecast, containing input data such as discount, price, weather etc.
+    :return: A list with one result dictionary per row, in the same order as input_df.
+    """
+    return _predict_rows(input_df)
+
+
+def predict_many(rows):
+    """
+    Runs a list of inputs through both models together, used by the micro-batcher.
+    :param rows: List of dictionaries containing input data such as discount, price, weather etc.
+    :return: A list with one result dictionary per input, in the same order as rows.
+    """
+    return _predict_rows(rows)
+
+
+def _predict_rows(rows):
+    """
+    Runs the rows through the model version currently being served.
+    :param rows: A dict for a single prediction, or a list of dicts or a dataframe with one row per prediction.
+    :return: A list with one result dictionary per row.
+    """
+    # Read once so the whole request uses the same version even if a new one is swapped in
+    model = registry.current
+    if not model:
         raise HTTPException(status_code=500, detail="Models not loaded")
 
     try:
-        # Passes the input dataframe to the previously loaded models
-        reservation_prediction = bool(model_reservation.predict(input_df)[0])
-
-        # Returns an array [[prob_false, prob_true]] therefore get just prob_true
-        reservation_probability = float(model_reservation.predict_proba(input_df)[0][1])
-
-        collection_prediction = bool(model_collection.predict(input_df)[0])
-        collection_probability = float(model_collection.predict_proba(input_df)[0][1])
-
-        return {
-            'reservation': {
-                'reservation_prediction': reservation_prediction,
-                'reservation_probability': round(reservation_probability * 100),
-            },
-            'collection': {
-                'collection_prediction': collection_prediction,
-                'collection_probability': round(collection_probability * 100),
-            }
-        }
+        reservation_predictions, reservation_probabilities, collection_predictions, collection_probabilities = (
+            model.predict(rows)
+        )
+
+        results = [
+            format_result(*row) for row in zip(
+                reservation_predictions, reservation_probabilities,
+                collection_predictions, collection_probabilities
+            )
+        ]
+        for result in results:
+            result['model_version'] = model.version
+
+        return results
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-def get_current_weather(vendor_id, db):
+def build_bundle_input(bundle, weather, temperature):
+    """
+    Derives the model input features from a bundle row.
+    :param bundle: Mapping of the bundle columns returned from the database.
+    :param weather: Weather condition at the vendors location.
+    :param temperature: Temperature at the vendors location.
+    :return: Dictionary of input data for the models.
+    """
+    columns = bundle_feature_columns([bundle], lambda collection_start: (weather, temperature))
+    return {feature: values.tolist()[0] for feature, values in columns.items()}
+
+
+def predict_bundle_batch(bundles, weather, temperature):
+    """
+    Derives the model input features of many bundles of one vendor and runs them through both models. Both happen
+    in one call so they run on the inference pool rather than the event loop.
+    :param bundles: List of dictionaries of the bundle columns returned from the database.
+    :param weather: Weather condition at the vendors location.
+    :param temperature: Temperature at the vendors location.
+    :return: A list with one result dictionary per bundle, in the same order as bundles.
+    """
+    with time_stage("dataframe"):
+        input_df = bundle_features(bundles, lambda collection_start: (weather, temperature))
+    return predict_batch(input_df)
+
+
+async def get_current_weather(vendor_id, db):
     """
     Gets the weather data for a given vendors location.
+    Falls back to the typical weather for the month if the weather API is slow or down.
     :param vendor_id: ID of the vendor.
     :param db: Database session.
     :return: Condition and temperature data.
@@ -68,32 +273,76 @@ def get_current_weather(vendor_id, db):
     try:
         # Gets the vendors postcode from the vendors table using a parameterised query
         query = text("SELECT postcode FROM vendor WHERE vendor_id = :vid")
-        postcode = db.execute(query, {'vid': vendor_id}).mappings().first()
+        async with db_limiter:
+            with time_stage("postcode_query"):
+                postcode = (await db.execute(query, {'vid': vendor_id})).mappings().first()
+    except StageBusy:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database Error: {e}")
 
     if not postcode:
         raise HTTPException(status_code=404, detail="Postcode not found")
 
+    return await get_weather_for_postcode(postcode['postcode'])
+
+
+async def get_weather_for_postcode(postcode):
+    """
+    Gets the weather data for a postcode, used when the postcode was already read with the bundle.
+    Falls back to the typical weather for the month if the weather API is slow or down.
+    :param postcode: Postcode of the vendor.
+    :return: Condition and temperature data.
+    :raises: HTTPException 404 if the vendor has no postcode.
+    """
+    if not postcode:
+        raise HTTPException(status_code=404, detail="Postcode not found")
+
+    with time_stage("weather"):
+        return await _weather_for_postcode(postcode)
+
+
+async def _weather_for_postcode(postcode):
+    """
+    Gets the weather data for a postcode from the cache, the weather API or the climatology.
+    """
+    # For local deployment if no api key is provided
+    if not weather_client.api_key:
+        # Return mock data
+        return "Sunny", 20.0
+
     try:
-        # Gets the weather for the vendors location using the weather API
-        api_key = os.getenv("WEATHER_API_KEY")
-        
-        # For local deployment if no api key is provided
-        if not api_key:
-            # Return mock data
-            return "Sunny", 20.0
-        
-        postcode = postcode['postcode']
-        url = f"https://api.weatherapi.com/v1/current.json?key={api_key}&q={postcode}"
+        # Requests for the same postcode share a cached result and at most one call to the weather API at a time
+        return await weather_cache.aget_or_load(postcode, lambda: fetch_weather(postcode))
 
-        response = requests.get(url).json()
+    except (WeatherUnavailable, StageBusy) as e:
+        # The fallback is not cached so the live weather is used again as soon as the API recovers
+        print(f"Weather API unavailable, using climatology: {e}")
+        return climatology.lookup()
 
-        # Gets just the temperature and weather conditions from the JSON response
-        temperature = response['current']['temp_c']
-        weather = response['current']['condition']['text']
 
-        return weather, temperature
+async def fetch_weather(postcode):
+    """
+    Calls the weather API within the weather stage limit, so a slow API cannot hold up more than its share of requests.
+    :param postcode: Postcode of the vendor.
+    :return: Condition and temperature data.
+    """
+    async with weather_limiter:
+        return await weather_client.fetch(postcode)
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Weather API Error: {e}")
+
+def retry_batch_rows(error):
+    """
+    Decides whether a failed batch is retried one row at a time. Busy stages and missing models fail every row
+    alike, so only errors that one of the inputs may have caused are retried.
+    :param error: The exception the batch raised.
+    :return: True if the rows should be retried alone.
+    """
+    return input_may_be_at_fault(error) and registry.current is not None
+
+
+# Created after predict_many is defined as it is the function each batch runs
+batcher = MicroBatcher(
+    predict_many, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS, run=run_inference,
+    retry_rows=retry_batch_rows
+)
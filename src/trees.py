@@ -0,0 +1,155 @@
+import numpy as np
+from sklearn.ensemble import GradientBoostingClassifier
+
+# Rows evaluated at a time, bounding the size of the (trees, rows) node index matrix so it stays in the CPU cache
+BLOCK_SIZE = 256
+
+
+class FlatForest:
+    """
+    Every tree of a boosted ensemble packed into contiguous NumPy arrays.
+    Each tree is stored as a complete binary tree of depth max_depth in breadth-first order, with shallower
+    branches padded by splits that always go left. A batch of rows then walks every tree one level at a time
+    using only index arithmetic, reading the splits of each level from one array holding that level of every tree.
+    """
+
+    def __init__(self, feature, threshold, value, max_depth, init_raw):
+        """
+        :param feature: Array of shape (trees, 2 ** max_depth - 1) with the feature each split node uses.
+        :param threshold: Float32 array of the same shape, rows with feature <= threshold go left.
+        :param value: Array of shape (trees, 2 ** max_depth) with each leaf value, already scaled by the learning rate.
+        :param max_depth: Depth of the deepest tree.
+        :param init_raw: Raw prediction every row starts from before the trees are added.
+        """
+        self.feature = np.ascontiguousarray(feature, dtype=np.intp)
+        self.threshold = np.ascontiguousarray(threshold, dtype=np.float32)
+        self.value = np.ascontiguousarray(value, dtype=np.float64)
+        self.max_depth = max_depth
+        self.init_raw = init_raw
+
+        # Splits of each level of every tree, tree by tree, so a row at node i of a level moves to node 2i or 2i+1
+        levels = [slice(2 ** depth - 1, 2 ** (depth + 1) - 1) for depth in range(max_depth)]
+        self._level_feature = [self.feature[:, level].ravel() for level in levels]
+        self._level_threshold = [self.threshold[:, level].ravel() for level in levels]
+
+    @property
+    def n_trees(self):
+        return len(self.feature)
+
+    @classmethod
+    def from_gradient_boosting(cls, classifier):
+        """
+        Packs the trees of a fitted binary GradientBoostingClassifier.
+        :param classifier: Fitted binary GradientBoostingClassifier.
+        :return: The flattened forest.
+        :raises: ValueError if the classifier is not a binary GradientBoostingClassifier.
+        """
+        if not isinstance(classifier, GradientBoostingClassifier) or classifier.n_trees_per_iteration_ != 1:
+            raise ValueError(f"Cannot flatten classifier {classifier!r}")
+
+        trees = [estimator.tree_ for estimator in classifier.estimators_[:, 0]]
+        max_depth = max(tree.max_depth for tree in trees)
+        n_splits = 2 ** max_depth - 1
+
+        feature = np.zeros((len(trees), n_splits), dtype=np.intp)
+        threshold = np.full((len(trees), n_splits), np.inf)
+        value = np.zeros((len(trees), n_splits + 1))
+
+        for t, tree in enumerate(trees):
+            # Copies each sklearn node to its breadth-first position, leaves above max_depth fill every slot below them
+            stack = [(0, 0, 0)]
+            while stack:
+                node, position, depth = stack.pop()
+                is_leaf = tree.children_left[node] == -1
+
+                if depth == max_depth:
+                    value[t, position - n_splits] = tree.value[node, 0, 0]
+                    continue
+
+                if not is_leaf:
+                    feature[t, position] = tree.feature[node]
+                    threshold[t, position] = tree.threshold[node]
+
+                stack.append((tree.children_left[node] if not is_leaf else node, 2 * position + 1, depth + 1))
+                stack.append((tree.children_right[node] if not is_leaf else node, 2 * position + 2, depth + 1))
+
+        # Scaled here the same way sklearn scales each leaf value while predicting
+        value = classifier.learning_rate * value
+
+        # The init estimator predicts the class prior so its raw prediction is the same for every row
+        probe = np.zeros((1, classifier.n_features_in_), dtype=np.float32)
+        init_raw = float(classifier._raw_predict_init(probe)[0, 0])
+
+        return cls(feature, _round_down_to_float32(threshold), value, max_depth, init_raw)
+
+    def apply(self, matrix):
+        """
+        Finds the leaf each row reaches in every tree.
+        :param matrix: Input matrix of shape (rows, features).
+        :return: Array of shape (trees, rows) with the leaf position of each row within each tree.
+        """
+        return self._walk(matrix) - (np.arange(self.n_trees) << self.max_depth)[:, None]
+
+    def _walk(self, matrix):
+        """
+        Walks a block of rows down every tree.
+        :param matrix: Input matrix of shape (rows, features).
+        :return: Array of shape (trees, rows) with the index of the leaf each row reaches in the flattened values.
+        """
+        # Stored feature-major so rows sitting at the same node read neighbouring values
+        columns = np.ascontiguousarray(np.asarray(matrix, dtype=np.float32).T)
+        n_rows = columns.shape[1]
+        flat_columns = columns.ravel()
+        rows = np.arange(n_rows)
+
+        # Every row starts at the root, so the first split of each tree compares whole columns without any gather
+        nodes = (columns[self._level_feature[0]] > self._level_threshold[0][:, None]).astype(np.intp)
+        nodes += (np.arange(self.n_trees) << 1)[:, None]
+
+        # Nodes are numbered level by level across all the trees, so the children of node i are 2i and 2i+1
+        for feature, threshold in zip(self._level_feature[1:], self._level_threshold[1:]):
+            go_right = flat_columns[(feature * n_rows)[nodes] + rows] > threshold[nodes]
+            nodes <<= 1
+            nodes += go_right
+
+        return nodes
+
+    def decision_function(self, matrix):
+        """
+        Computes the raw decision score of each row.
+        :param matrix: Input matrix of shape (rows, features).
+        :return: Float64 array of raw scores.
+        :raises: ValueError if the matrix contains NaN or infinity, which sklearn also rejects.
+        """
+        matrix = np.asarray(matrix)
+        if not np.isfinite(matrix).all():
+            raise ValueError("Input contains NaN or infinity")
+
+        scores = np.empty(len(matrix), dtype=np.float64)
+        flat_value = self.value.ravel()
+
+        for start in range(0, len(matrix), BLOCK_SIZE):
+            leaves = flat_value[self._walk(matrix[start:start + BLOCK_SIZE])]
+
+            # Tree values are added one after another, like sklearn, so the sums round identically. NumPy only adds
+            # in order along the first axis of a 2D array, so a single row uses a running sum instead
+            if leaves.shape[1] > 1:
+                scores[start:start + BLOCK_SIZE] = np.add.reduce(leaves, axis=0, initial=self.init_raw)
+            else:
+                scores[start] = np.add.accumulate(np.concatenate([[self.init_raw], leaves[:, 0]]))[-1]
+
+        return scores
+
+
+def _round_down_to_float32(threshold):
+    """
+    Converts float64 thresholds to the largest float32 not above them.
+    For a float32 input x, x <= threshold then gives the same result in float32 as in float64, which is how
+    sklearn compares its float32 inputs to float64 thresholds.
+    :param threshold: Float64 thresholds.
+    :return: Float32 thresholds.
+    """
+    rounded = threshold.astype(np.float32)
+    too_high = rounded.astype(np.float64) > threshold
+    rounded[too_high] = np.nextafter(rounded[too_high], np.float32(-np.inf))
+    return rounded
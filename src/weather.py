@@ -0,0 +1,203 @@
+import asyncio
+import os
+import time
+from datetime import date
+
+import httpx
+import pandas as pd
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Weather API connection settings
+WEATHER_API_URL = os.getenv("WEATHER_API_URL", "https://api.weatherapi.com")
+WEATHER_CONNECT_TIMEOUT = float(os.getenv("WEATHER_CONNECT_TIMEOUT", "2.0"))
+WEATHER_READ_TIMEOUT = float(os.getenv("WEATHER_READ_TIMEOUT", "3.0"))
+WEATHER_MAX_CONNECTIONS = int(os.getenv("WEATHER_MAX_CONNECTIONS", "20"))
+
+# Circuit breaker settings
+WEATHER_BREAKER_FAILURES = int(os.getenv("WEATHER_BREAKER_FAILURES", "5"))
+WEATHER_BREAKER_RESET = float(os.getenv("WEATHER_BREAKER_RESET", "30"))
+
+# Monthly climatology built from the saved historical weather data
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CLIMATOLOGY_PATH = os.getenv("CLIMATOLOGY_PATH", os.path.join(BASE_DIR, "ml", "climatology.csv"))
+
+# Used when no climatology is available for the month
+DEFAULT_WEATHER = ("Sunny", 20.0)
+
+
+class WeatherUnavailable(Exception):
+    """
+    Raised when the weather API cannot be used to get the current weather.
+    """
+
+
+class CircuitBreaker:
+    """
+    Stops calls to a failing dependency for a while once it has failed several times in a row.
+    After reset_timeout a single trial call is let through, closing the breaker again if it succeeds.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout, timer=time.monotonic):
+        """
+        :param failure_threshold: Consecutive failures before the breaker opens.
+        :param reset_timeout: Seconds the breaker stays open before allowing a trial call.
+        :param timer: Clock used to time the open state.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.timer = timer
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    @property
+    def state(self):
+        """
+        The current state of the breaker, either 'closed', 'open' or 'half_open'.
+        """
+        if self.opened_at is None:
+            return "closed"
+        if self.timer() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        """
+        Checks whether a call may be made.
+        :return: True if the call should go ahead.
+        """
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._trial_running:
+            self._trial_running = True
+            return True
+        return False
+
+    def record_success(self):
+        """
+        Closes the breaker after a successful call.
+        """
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    def record_failure(self):
+        """
+        Counts a failed call, opening the breaker once the threshold is reached or a trial call fails.
+        """
+        self.failures += 1
+        if self._trial_running or self.failures >= self.failure_threshold:
+            self.opened_at = self.timer()
+        self._trial_running = False
+
+    def end_trial(self):
+        """
+        Ends a trial call that finished without recording a result, such as one that was cancelled, so the next
+        call can be let through instead of the breaker staying open forever.
+        """
+        self._trial_running = False
+
+
+class Climatology:
+    """
+    Typical weather for each month, used in place of the live weather when the weather API is unavailable.
+    """
+
+    def __init__(self, path=CLIMATOLOGY_PATH):
+        """
+        :param path: CSV file with month, condition and temperature columns.
+        """
+        self.months = {}
+        if os.path.exists(path):
+            climatology = pd.read_csv(path)
+            self.months = {
+                int(row.month): (row.condition, float(row.temperature))
+                for row in climatology.itertuples(index=False)
+            }
+
+    def lookup(self, day=None):
+        """
+        Gets the typical weather for the month of a given day.
+        :param day: The date to get the weather for, defaults to today.
+        :return: Condition and temperature data.
+        """
+        day = day or date.today()
+        return self.months.get(day.month, DEFAULT_WEATHER)
+
+
+class WeatherClient:
+    """
+    Async client for the current weather API that reuses pooled keep-alive connections.
+    """
+
+    def __init__(self, api_key, base_url=WEATHER_API_URL, connect_timeout=WEATHER_CONNECT_TIMEOUT,
+                 read_timeout=WEATHER_READ_TIMEOUT, max_connections=WEATHER_MAX_CONNECTIONS, breaker=None):
+        """
+        :param api_key: The weather API key.
+        :param base_url: Base URL of the weather API.
+        :param connect_timeout: Seconds allowed to open a connection.
+        :param read_timeout: Seconds allowed for the whole response to arrive.
+        :param max_connections: Maximum number of pooled connections.
+        :param breaker: Circuit breaker guarding the API, a default one is created if not given.
+        """
+        self.api_key = api_key
+        self.base_url = base_url
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self.breaker = breaker or CircuitBreaker(WEATHER_BREAKER_FAILURES, WEATHER_BREAKER_RESET)
+        self._client = None
+        self._loop = None
+
+    def _get_client(self):
+        """
+        Gets the pooled HTTP client, creating it for the running event loop if needed.
+        """
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._client = httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout, limits=self.limits)
+            self._loop = loop
+        return self._client
+
+    async def fetch(self, postcode):
+        """
+        Gets the current weather for a postcode from the weather API.
+        :param postcode: The postcode to get the weather for.
+        :return: Condition and temperature data.
+        :raises: WeatherUnavailable if the circuit breaker is open or the request fails.
+        """
+        trial = self.breaker.state == "half_open"
+        if not self.breaker.allow():
+            raise WeatherUnavailable("Circuit breaker is open")
+
+        try:
+            response = await self._get_client().get(
+                "/v1/current.json", params={'key': self.api_key, 'q': postcode}
+            )
+            response.raise_for_status()
+            data = response.json()
+
+            # Gets just the temperature and weather conditions from the JSON response
+            temperature = data['current']['temp_c']
+            weather = data['current']['condition']['text']
+
+        except (httpx.HTTPError, KeyError, TypeError, ValueError) as e:
+            self.breaker.record_failure()
+            raise WeatherUnavailable(str(e) or type(e).__name__) from e
+        finally:
+            if trial:
+                self.breaker.end_trial()
+
+        self.breaker.record_success()
+        return weather, temperature
+
+    async def aclose(self):
+        """
+        Closes the pooled connections.
+        """
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,8 @@
+from src import services
+
+
+def pytest_sessionstart(session):
+    """
+    Loads the models before the test modules are collected, as the service itself only loads them on startup.
+    """
+    services.load_models()
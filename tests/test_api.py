@@ -1,10 +1,13 @@
+import json
 import pytest
 import time
 import jwt
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 from fastapi.testclient import TestClient
 from src.main import app, get_db
 from src.auth import SECRET_KEY, ALGORITHM
+from src import services
+from src.services import prediction_cache, registry
 
 # Initialises the test client and if a test fails a traceback will be given rather than just returning a 500 status code
 client = TestClient(app, raise_server_exceptions=True)
@@ -33,6 +36,7 @@ def mock_db_session():
         "postcode": "SW1A 1AA",
         "name": "Test Vendor",
     }
+    session.execute = AsyncMock(return_value=MagicMock())
     session.execute.return_value.mappings.return_value.first.return_value = mock_data
     app.dependency_overrides[get_db] = lambda: session
     yield session
@@ -71,16 +75,43 @@ def test_forecast_bundle_id(token, mock_db_session):
 
     headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
 
-    # Patch 'get_current_weather' to set the weather rather use the API.
-    with patch("src.main.get_current_weather", return_value=("Sunny", 25.0)):
+    # Patch 'get_weather_for_postcode' to set the weather rather use the API.
+    with patch("src.main.get_weather_for_postcode", return_value=("Sunny", 25.0)) as weather:
         response = client.get(f"/forecast/predict/{BUNDLE_ID}", headers=headers)
 
     assert response.status_code == 200
     data = response.json()
 
+    # The bundle and vendor postcode are read in a single query
+    assert mock_db_session.execute.await_count == 1
+    weather.assert_awaited_once_with("SW1A 1AA")
+
     # Ensure the ML model output is present
     assert "reservation" in data
     assert "collection" in data
+    assert "model_version" in data
+
+
+def test_metrics_report_stage_latencies(token, mock_db_session):
+    """
+    Tests the GET /metrics endpoint reports the stages and status of a bundle forecast.
+    :param token: The JWT token.
+    :param mock_db_session: The mock database session.
+    """
+
+    headers = {"Authorization": f"Bearer {token}"}
+    with patch("src.main.get_weather_for_postcode", return_value=("Sunny", 25.0)):
+        client.get(f"/forecast/predict/{BUNDLE_ID}", headers=headers)
+
+    response = client.get("/forecast/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+
+    # Requests are labelled with the route template rather than the bundle ID
+    assert 'forecast_requests_total{method="GET",path="/forecast/predict/{bundle_id}",status="200"}' in response.text
+    for stage in ("auth", "bundle_query", "preprocessing", "inference_reservation", "inference_collection"):
+        assert f'forecast_stage_duration_seconds_count{{stage="{stage}"}}' in response.text
+    assert 'forecast_cache_hits_total{cache="prediction"}' in response.text
 
 
 def test_forecast_simulation(token, payload, mock_db_session):
@@ -103,3 +134,121 @@ def test_forecast_simulation(token, payload, mock_db_session):
     # Ensure the ML model output is present
     assert "reservation" in data
     assert "collection" in data
+    assert "model_version" in data
+
+
+def test_forecast_simulation_is_cached(token, payload, mock_db_session):
+    """
+    Tests repeated identical simulations are answered from the prediction cache until the model is swapped.
+    :param token: The JWT token.
+    :param payload: The predetermined payload.
+    :param mock_db_session: The database session.
+    """
+
+    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+    prediction_cache.clear()
+    hits = prediction_cache.hits
+
+    with patch("src.main.get_current_weather", return_value=("Rain", 15.0)), \
+            patch("src.services.run_inference", wraps=services.run_inference) as run_inference, \
+            patch("src.services.BATCH_ENABLED", False):
+        first = client.post("/forecast/simulate", json=payload, headers=headers).json()
+        second = client.post("/forecast/simulate", json=dict(payload, price=11.00001), headers=headers).json()
+
+        # Prices within the rounding of the cache key share an entry so the models only run once
+        assert first == second
+        assert run_inference.call_count == 1
+        assert prediction_cache.hits == hits + 1
+
+        # Swapping in a model version invalidates the cached predictions
+        registry.activate(registry.current)
+        client.post("/forecast/simulate", json=payload, headers=headers)
+        assert run_inference.call_count == 2
+
+
+def test_forecast_batch(token, mock_db_session):
+    """
+    Tests the POST /predict/batch endpoint.
+    :param token: The JWT token.
+    :param mock_db_session: The mock database session.
+    """
+
+    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+
+    # The batch query returns every bundle in one result set
+    bundle = mock_db_session.execute.return_value.mappings.return_value.first.return_value
+    mock_db_session.execute.return_value.mappings.return_value.all.return_value = [bundle]
+
+    # Patch 'get_weather_for_postcode' to set the weather rather use the API.
+    with patch("src.main.get_weather_for_postcode", return_value=("Sunny", 25.0)) as weather:
+        response = client.post(
+            "/forecast/predict/batch",
+            json={"bundle_ids": [BUNDLE_ID, BUNDLE_ID, "missing-bundle"]},
+            headers=headers
+        )
+
+    assert response.status_code == 200
+    data = response.json()
+
+    # Duplicate IDs are only forecast once and unknown IDs are reported back
+    assert [forecast["bundle_id"] for forecast in data["forecasts"]] == [BUNDLE_ID]
+    assert data["not_found"] == ["missing-bundle"]
+    assert "reservation" in data["forecasts"][0]
+    assert "collection" in data["forecasts"][0]
+
+    # The weather is only fetched once for the whole batch
+    assert weather.call_count == 1
+    assert mock_db_session.execute.await_count == 1
+
+
+def test_forecast_stream(token, mock_db_session):
+    """
+    Tests the GET /stream endpoint.
+    :param token: The JWT token.
+    :param mock_db_session: The mock database session.
+    """
+
+    headers = {"Authorization": f"Bearer {token}"}
+
+    # The streaming session returns the vendors bundles in two chunks
+    bundle = mock_db_session.execute.return_value.mappings.return_value.first.return_value
+    stream_result = MagicMock()
+    stream_result.mappings.return_value.partitions.return_value.__aiter__.return_value = [[bundle, bundle], [bundle]]
+    stream_session = MagicMock(stream=AsyncMock(return_value=stream_result), close=AsyncMock())
+
+    # Patch 'get_current_weather' to set the weather rather use the API.
+    with patch("src.main.get_current_weather", return_value=("Sunny", 25.0)), \
+            patch("src.main.AsyncSessionLocal", return_value=stream_session):
+        response = client.get("/forecast/stream", headers=headers)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+
+    # One forecast is returned per line and the streaming session is closed afterwards
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert len(lines) == 3
+    assert all(line["bundle_id"] == BUNDLE_ID and "reservation" in line for line in lines)
+    stream_session.close.assert_awaited_once()
+
+
+def test_admin_reload_models(monkeypatch):
+    """
+    Tests the POST /admin/models/reload endpoint swaps in the models and needs the admin token.
+    """
+
+    monkeypatch.setattr("src.auth.ADMIN_TOKEN", "admin-secret")
+
+    response = client.post("/forecast/admin/models/reload", json={}, headers={"X-Admin-Token": "wrong"})
+    assert response.status_code == 403
+
+    response = client.post("/forecast/admin/models/reload", json={}, headers={"X-Admin-Token": "admin-secret"})
+    assert response.status_code == 200
+    data = response.json()
+
+    # Reloading the same files gives the same version
+    assert data["current"]["model_version"] == data["previous_version"]
+
+    response = client.post(
+        "/forecast/admin/models/reload", json={"version": "../ml"}, headers={"X-Admin-Token": "admin-secret"}
+    )
+    assert response.status_code == 400
@@ -0,0 +1,121 @@
+import os
+import shutil
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from src.artifact import ARTIFACT_FILE, HEADER, ArtifactError, export_artifact, load_artifact, main
+from src.ml.train_model import create_model_pipeline, load_dataset
+from src.registry import ModelRegistry, RESERVATION_FILE, COLLECTION_FILE, WARM_UP_INPUT
+from src.services import ML_DIR, registry
+
+
+@pytest.fixture(scope="module")
+def artifact(tmp_path_factory):
+    """
+    Exports the compiled shipped models.
+    :return: Path of the artifact.
+    """
+    path = str(tmp_path_factory.mktemp("artifact") / ARTIFACT_FILE)
+    export_artifact(registry.current.compiled_predictor, path, registry.current.version)
+    return path
+
+
+def test_artifact_predicts_like_the_pipelines(artifact):
+    """
+    Tests the memory-mapped predictor gives exactly the same outputs as the predictor compiled from the pipelines.
+    :param artifact: The artifact file.
+    """
+
+    predictor, version = load_artifact(artifact)
+    rows = pd.read_csv(os.path.join(ML_DIR, "dataset.csv"), nrows=1000).drop(['is_collected', 'is_reserved'], axis=1)
+
+    assert version == registry.current.version
+    for loaded, compiled in zip(predictor.predict(rows), registry.current.compiled_predictor.predict(rows)):
+        np.testing.assert_array_equal(loaded, compiled)
+
+    # The tree arrays are views of the mapped file rather than copies
+    value = predictor.reservation_ensemble.forest.value
+    assert not value.flags.owndata and not value.flags.writeable
+
+
+def corrupt(source, target, offset, data):
+    """
+    Copies an artifact with bytes at offset replaced.
+    """
+    shutil.copy(source, target)
+    with open(target, "r+b") as file:
+        file.seek(offset)
+        file.write(data)
+    return str(target)
+
+
+def test_loader_rejects_invalid_artifacts(artifact, tmp_path):
+    """
+    Tests corrupt files, files of another schema version and other files are refused.
+    :param artifact: The artifact file.
+    """
+
+    size = os.path.getsize(artifact)
+    with pytest.raises(ArtifactError, match="checksum"):
+        load_artifact(corrupt(artifact, tmp_path / "flipped.bin", size - 8, b"\xff" * 8))
+    with pytest.raises(ArtifactError, match="schema version 99"):
+        load_artifact(corrupt(artifact, tmp_path / "future.bin", 8, (99).to_bytes(4, "little")))
+    with pytest.raises(ArtifactError, match="not a model artifact"):
+        load_artifact(corrupt(artifact, tmp_path / "pickle.bin", 0, b"\x80\x04\x95"))
+
+    truncated = tmp_path / "truncated.bin"
+    truncated.write_bytes(open(artifact, "rb").read()[:HEADER.size + 10])
+    with pytest.raises(ArtifactError, match="truncated"):
+        load_artifact(str(truncated))
+
+
+def test_registry_prefers_matching_artifact(artifact, tmp_path):
+    """
+    Tests the registry serves a version from its artifact, ignores an artifact from older pipelines and falls back
+    to the pipelines when the artifact is corrupt.
+    :param artifact: The artifact file.
+    """
+
+    artifact_only = tmp_path / "artifact_only"
+    artifact_only.mkdir()
+    shutil.copy(artifact, artifact_only / ARTIFACT_FILE)
+
+    model_version = ModelRegistry(str(artifact_only)).load()
+    assert model_version.describe()['format'] == 'artifact'
+    assert model_version.version == registry.current.version
+    # Batches the pipelines would normally serve go to the compiled predictor, as there are no pipelines
+    reservation_predictions, *_ = model_version.predict(pd.DataFrame([WARM_UP_INPUT] * 500))
+    assert len(reservation_predictions) == 500
+
+    with_pipelines = tmp_path / "with_pipelines"
+    shutil.copytree(artifact_only, with_pipelines)
+    for name in (RESERVATION_FILE, COLLECTION_FILE):
+        shutil.copy(os.path.join(ML_DIR, name), with_pipelines / name)
+    assert ModelRegistry(str(with_pipelines)).load().describe()['format'] == 'artifact'
+
+    (with_pipelines / "VERSION").write_text("retrained\n")
+    assert ModelRegistry(str(with_pipelines)).load().describe()['format'] == 'pickle'
+
+    (with_pipelines / "VERSION").unlink()
+    corrupt(artifact, with_pipelines / ARTIFACT_FILE, os.path.getsize(artifact) - 8, b"\xff" * 8)
+    assert ModelRegistry(str(with_pipelines)).load().describe()['format'] == 'pickle'
+
+    shutil.copy(with_pipelines / ARTIFACT_FILE, artifact_only / ARTIFACT_FILE)
+    with pytest.raises(ArtifactError):
+        ModelRegistry(str(artifact_only)).load()
+
+
+def test_export_skips_models_that_cannot_be_compiled(tmp_path):
+    """
+    Tests exporting 'hist' models, which cannot be compiled, succeeds without writing an artifact so image builds
+    shipping them do not fail.
+    """
+
+    X, targets = load_dataset()
+    for (target, y), name in zip(targets.items(), (RESERVATION_FILE, COLLECTION_FILE)):
+        pipeline = create_model_pipeline('hist', n_estimators=5).fit(X[:2000], y[:2000])
+        joblib.dump(pipeline, tmp_path / name)
+
+    assert main(["--model-dir", str(tmp_path)]) == 0
+    assert not (tmp_path / ARTIFACT_FILE).exists()
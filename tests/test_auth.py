@@ -0,0 +1,93 @@
+import time
+import asyncio
+import jwt
+import pytest
+from unittest.mock import patch
+from fastapi import HTTPException
+from src import auth
+from src.auth import get_current_vendor_id, clear_token_cache, SECRET_KEY, ALGORITHM
+
+VENDOR_ID = "e27daa6e-3e67-4d51-8ac0-cc73c621fd40"
+
+
+@pytest.fixture(autouse=True)
+def empty_token_cache():
+    """
+    Starts every test with an empty verified token cache.
+    """
+    clear_token_cache()
+    yield
+    clear_token_cache()
+
+
+def make_token(expires_in=3600, **claims):
+    """
+    Generates a JWT token signed with the secret key.
+    :param expires_in: Seconds until the token expires.
+    :return: The JWT token.
+    """
+    payload = {"sub": VENDOR_ID, "exp": time.time() + expires_in, **claims}
+    return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
+
+
+def test_repeat_tokens_skip_verification():
+    """
+    Tests a token is only verified the first time it is seen.
+    """
+
+    token = make_token()
+
+    with patch("src.auth.jwt.decode", wraps=jwt.decode) as decode:
+        assert asyncio.run(get_current_vendor_id(token)) == VENDOR_ID
+        assert asyncio.run(get_current_vendor_id(token)) == VENDOR_ID
+
+    assert decode.call_count == 1
+    assert auth.token_cache.hits >= 1
+
+
+def test_cached_token_expires_with_exp_claim():
+    """
+    Tests a cached token is rejected once its exp claim has passed.
+    """
+
+    token = make_token(expires_in=1)
+    assert asyncio.run(get_current_vendor_id(token)) == VENDOR_ID
+
+    time.sleep(1.1)
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(get_current_vendor_id(token))
+    assert error.value.status_code == 401
+
+
+def test_invalid_tokens_are_not_cached():
+    """
+    Tests tokens that fail verification are rejected every time and never cached.
+    """
+
+    token = jwt.encode({"sub": VENDOR_ID, "exp": time.time() + 3600}, b"a-different-signing-key-of-32-bytes", algorithm=ALGORITHM)
+
+    for _ in range(2):
+        with pytest.raises(HTTPException) as error:
+            asyncio.run(get_current_vendor_id(token))
+        assert error.value.status_code == 401
+    assert len(auth.token_cache) == 0
+
+
+def test_cache_can_be_cleared_and_disabled():
+    """
+    Tests clearing the cache forces verification again and a disabled cache never stores tokens.
+    """
+
+    token = make_token()
+
+    with patch("src.auth.jwt.decode", wraps=jwt.decode) as decode:
+        asyncio.run(get_current_vendor_id(token))
+        clear_token_cache()
+        asyncio.run(get_current_vendor_id(token))
+        assert decode.call_count == 2
+
+        with patch.object(auth.token_cache, "ttl", 0):
+            clear_token_cache()
+            asyncio.run(get_current_vendor_id(token))
+            asyncio.run(get_current_vendor_id(token))
+        assert decode.call_count == 4
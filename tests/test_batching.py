@@ -0,0 +1,106 @@
+import asyncio
+import pytest
+from src.batching import MicroBatcher
+from src.concurrency import StageBusy
+
+
+async def slow_run(fn, rows):
+    """
+    Runs a batch after a short delay, standing in for inference on the threadpool.
+    """
+    await asyncio.sleep(0.02)
+    return fn(rows)
+
+
+def double_rows(rows):
+    """
+    Stand-in for the models, fails the whole batch if any input is negative.
+    """
+    if any(row < 0 for row in rows):
+        raise ValueError("Negative input")
+    return [row * 2 for row in rows]
+
+
+def test_concurrent_requests_are_batched():
+    """
+    Tests requests arriving while a batch runs are collected together and each caller gets its own result.
+    """
+
+    batcher = MicroBatcher(double_rows, max_batch_size=8, max_wait_ms=50, run=slow_run)
+
+    async def submit_all():
+        return await asyncio.gather(*(batcher.submit(i) for i in range(10)))
+
+    assert asyncio.run(submit_all()) == [i * 2 for i in range(10)]
+
+    stats = batcher.stats()
+    assert stats["rows"] == 10
+    assert stats["batches"] < 10
+    assert max(int(size) for size, count in stats["batch_size_counts"].items() if count and size != "+Inf") <= 8
+
+
+def test_idle_request_is_not_delayed():
+    """
+    Tests a request arriving when the batcher is idle runs straight away instead of waiting for the window.
+    """
+
+    batcher = MicroBatcher(double_rows, max_batch_size=8, max_wait_ms=10_000, run=slow_run)
+
+    async def submit_one():
+        return await asyncio.wait_for(batcher.submit(3), timeout=1)
+
+    assert asyncio.run(submit_one()) == 6
+    assert batcher.stats()["max_queue_wait_ms"] < 1000
+
+
+def test_bad_input_only_fails_its_own_request():
+    """
+    Tests a failing input in a batch is retried alone so the other callers still get results.
+    """
+
+    batcher = MicroBatcher(double_rows, max_batch_size=8, max_wait_ms=50, run=slow_run)
+
+    async def submit_all():
+        return await asyncio.gather(*(batcher.submit(i) for i in (1, -1, 2)), return_exceptions=True)
+
+    first, failed, last = asyncio.run(submit_all())
+
+    assert (first, last) == (2, 4)
+    assert isinstance(failed, ValueError)
+
+
+def test_busy_batch_is_not_retried_row_by_row():
+    """
+    Tests a batch rejected because the service is busy fails every caller at once instead of queueing each row
+    again, and that rows failing because of their input are retried concurrently.
+    """
+
+    calls = []
+
+    async def busy_run(fn, rows):
+        calls.append(rows)
+        await asyncio.sleep(0.05)
+        if any(row < 0 for row in rows):
+            raise ValueError("Negative input")
+        raise StageBusy("inference")
+
+    async def submit_all(inputs):
+        batcher = MicroBatcher(double_rows, max_batch_size=8, max_wait_ms=50, run=busy_run)
+        # Holds the batcher busy so the inputs that follow are collected into one batch
+        first = asyncio.ensure_future(batcher.submit(0))
+        await asyncio.sleep(0.01)
+        started_at = asyncio.get_running_loop().time()
+        results = await asyncio.gather(*(batcher.submit(i) for i in inputs), return_exceptions=True)
+        await asyncio.gather(first, return_exceptions=True)
+        return results, asyncio.get_running_loop().time() - started_at
+
+    results, _ = asyncio.run(submit_all([1, 2, 3, 4]))
+    assert all(isinstance(result, StageBusy) for result in results)
+    assert [len(rows) for rows in calls] == [1, 4]
+
+    calls.clear()
+    results, elapsed = asyncio.run(submit_all([1, -1, 2, 3]))
+    assert [type(result) for result in results] == [StageBusy, ValueError, StageBusy, StageBusy]
+    assert [len(rows) for rows in calls] == [1, 4, 1, 1, 1, 1]
+    # Four retries run one after another would take 0.2s on their own
+    assert elapsed < 0.25
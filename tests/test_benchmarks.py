@@ -0,0 +1,39 @@
+from benchmarks.run import compare, bundle_from_row, environment_differences, load_rows
+from src.services import build_bundle_input
+
+
+def test_compare_flags_regressions_past_threshold():
+    """
+    Tests only benchmarks slower than the baseline by more than the threshold are reported.
+    """
+
+    baseline = {'fast': {'median_ms': 1.0}, 'slow': {'median_ms': 1.0}}
+    results = {'fast': {'median_ms': 1.2}, 'slow': {'median_ms': 1.5}, 'new': {'median_ms': 9.0}}
+
+    assert [name for name, *_ in compare(results, baseline, threshold=0.25)] == ['slow']
+
+
+def test_baseline_from_another_environment_is_not_compared():
+    """
+    Tests a baseline recorded on another Python version or CPU count is reported as not comparable.
+    """
+
+    report = {'python': '3.12.4', 'sklearn': '1.7.1', 'machine': 'x86_64', 'cpu_count': 8}
+
+    assert environment_differences(report, dict(report)) == []
+    assert environment_differences(report, dict(report, python='3.11.7', cpu_count=1)) == [
+        ('python', '3.11.7', '3.12.4'), ('cpu_count', 1, 8)
+    ]
+
+
+def test_bundles_reproduce_sampled_rows():
+    """
+    Tests the stubbed bundles give the bundle path the same inputs as the sampled rows.
+    """
+
+    row = load_rows(n_rows=1)[0]
+    rebuilt = build_bundle_input(bundle_from_row(row, 0), row['weather'], row['temperature'])
+
+    assert rebuilt['day'] == row['day'] and rebuilt['time_of_day'] == row['time_of_day']
+    for feature in ('discount', 'price', 'lead_time', 'window_length'):
+        assert abs(rebuilt[feature] - row[feature]) < 1e-6
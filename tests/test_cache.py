@@ -0,0 +1,92 @@
+import asyncio
+import pytest
+from src.cache import TTLCache
+
+
+class FakeClock:
+    """
+    Clock that only moves when the test advances it.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_entries_expire_after_ttl():
+    """
+    Tests cached values are returned until their TTL passes.
+    """
+
+    clock = FakeClock()
+    cache = TTLCache(ttl=60, maxsize=10, timer=clock)
+    cache.set("EX4 4QJ", ("Sunny", 20.0))
+
+    clock.now = 59
+    assert cache.get("EX4 4QJ") == ("Sunny", 20.0)
+
+    clock.now = 60
+    assert cache.get("EX4 4QJ") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_least_recently_used_entry_is_evicted():
+    """
+    Tests the cache never grows past its maximum size.
+    """
+
+    cache = TTLCache(ttl=60, maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+
+    # Reading 'a' makes 'b' the least recently used entry
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+
+
+def test_concurrent_misses_share_one_load():
+    """
+    Tests concurrent requests for the same key only call the loader once.
+    """
+
+    cache = TTLCache(ttl=60, maxsize=10)
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        # Gives the other requests time to queue up behind the first load
+        await asyncio.sleep(0.05)
+        return "Cloudy", 12.0
+
+    async def request_all():
+        return await asyncio.gather(*(cache.aget_or_load("EX1", loader) for _ in range(8)))
+
+    results = asyncio.run(request_all())
+
+    assert len(calls) == 1
+    assert results == [("Cloudy", 12.0)] * 8
+
+
+def test_failed_loads_are_not_cached():
+    """
+    Tests an exception from the loader is raised and the next call tries again.
+    """
+
+    cache = TTLCache(ttl=60, maxsize=10)
+
+    async def failing_loader():
+        raise RuntimeError("Weather API down")
+
+    async def working_loader():
+        return "Sunny", 20.0
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(cache.aget_or_load("EX1", failing_loader))
+
+    assert asyncio.run(cache.aget_or_load("EX1", working_loader)) == ("Sunny", 20.0)
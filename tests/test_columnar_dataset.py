@@ -0,0 +1,81 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from src.ml import dataset, train_model
+
+
+@pytest.fixture(scope="module")
+def built(tmp_path_factory):
+    """
+    Builds the columnar dataset from the first rows of the CSV.
+    :return: The dataset directory and the CSV rows it was built from.
+    """
+    directory = tmp_path_factory.mktemp("columnar")
+    csv_path = directory / "dataset.csv"
+    rows = pd.read_csv(dataset.CSV_PATH, nrows=2000)
+    rows.to_csv(csv_path, index=False)
+
+    assert dataset.build(csv_path, directory / "dataset") == 2000
+    return directory / "dataset", rows
+
+
+def test_columns_have_explicit_types(built):
+    """
+    Tests every column is loaded memory-mapped with its storage type and the same values as the CSV.
+    :param built: The dataset directory and CSV rows.
+    """
+
+    path, rows = built
+    df = dataset.load(path)
+
+    assert df.dtypes.astype(str).to_dict() == dataset.COLUMN_TYPES
+    assert isinstance(df['price'].to_numpy().base, np.memmap)
+    assert (df['weather'].astype(str) == rows['weather']).all()
+    assert (df['is_collected'] == rows['is_collected']).all()
+    assert (df['time_of_day'] == rows['time_of_day']).all()
+    assert np.allclose(df['lead_time'], rows['lead_time'], rtol=1e-6)
+
+
+def test_load_projects_columns(built):
+    """
+    Tests only the requested columns are loaded.
+    :param built: The dataset directory and CSV rows.
+    """
+
+    path, _ = built
+    df = dataset.load(path, columns=['category', 'price'], mmap=False)
+
+    assert list(df.columns) == ['category', 'price']
+    assert len(df) == 2000
+
+
+def test_training_reads_the_columnar_dataset(built):
+    """
+    Tests training gets the same features and targets from the columnar dataset as from the CSV.
+    :param built: The dataset directory and CSV rows.
+    """
+
+    path, rows = built
+    X, targets = train_model.load_dataset(str(path))
+
+    assert list(X.columns) == [column for column in rows.columns if not column.startswith('is_')]
+    assert (targets['reservation'] == rows['is_reserved']).all()
+
+
+def test_build_is_stale_once_the_csv_changes(tmp_path):
+    """
+    Tests a build is current until the CSV it was built from changes, and only a change of content counts.
+    """
+
+    csv_path = tmp_path / "dataset.csv"
+    pd.read_csv(dataset.CSV_PATH, nrows=100).to_csv(csv_path, index=False)
+    dataset.build(csv_path, tmp_path / "dataset")
+    assert dataset.is_current(tmp_path / "dataset", csv_path)
+
+    # Touching the file without changing it keeps the build
+    os.utime(csv_path, ns=(0, 0))
+    assert dataset.is_current(tmp_path / "dataset", csv_path)
+
+    pd.read_csv(dataset.CSV_PATH, nrows=200).to_csv(csv_path, index=False)
+    assert not dataset.is_current(tmp_path / "dataset", csv_path)
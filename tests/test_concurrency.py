@@ -0,0 +1,156 @@
+import asyncio
+import threading
+import time
+import pytest
+from fastapi import HTTPException
+from src import services
+from src.concurrency import StageLimiter, StageBusy, InferencePool, run_inference
+from src.registry import WARM_UP_INPUT
+
+
+def test_stage_limiter_rejects_when_full():
+    """
+    Tests a request waiting longer than the queue timeout for a full stage fails with a 503.
+    """
+
+    limiter = StageLimiter("weather", limit=1, queue_timeout=0.05)
+
+    async def hold_and_wait():
+        async with limiter:
+            with pytest.raises(StageBusy) as error:
+                async with limiter:
+                    pass
+            return error.value
+
+    error = asyncio.run(hold_and_wait())
+    assert error.status_code == 503
+    assert limiter.stats() == {'limit': 1, 'in_use': 0, 'waiting': 0, 'rejected': 1}
+
+
+def test_stage_limiter_bounds_concurrency():
+    """
+    Tests no more than the limit run inside a stage at once and queued requests run once a slot frees up.
+    """
+
+    limiter = StageLimiter("database", limit=2, queue_timeout=1)
+    peak = 0
+
+    async def query():
+        nonlocal peak
+        async with limiter:
+            peak = max(peak, limiter.in_use)
+            await asyncio.sleep(0.01)
+
+    async def run_all():
+        await asyncio.gather(*(query() for _ in range(6)))
+
+    asyncio.run(run_all())
+    assert peak == 2
+    assert limiter.in_use == 0
+
+
+def test_inference_runs_on_dedicated_executor():
+    """
+    Tests inference runs on the inference threads rather than the shared threadpool.
+    """
+
+    thread_name = asyncio.run(run_inference(lambda: threading.current_thread().name))
+    assert thread_name.startswith("inference")
+
+
+def reject_input(rows):
+    """
+    Stand-in for a prediction that fails with a HTTPException.
+    """
+    raise HTTPException(status_code=500, detail="Models not loaded")
+
+
+def test_process_pool_matches_in_process_predictions():
+    """
+    Tests inference workers load the served models, return the same forecasts as the service and pass
+    HTTPExceptions back.
+    """
+
+    rows = [dict(WARM_UP_INPUT, price=price) for price in (2.0, 5.0, 9.0)]
+    pool = InferencePool(workers=2, backend="process")
+    pool.set_initializer(services.load_worker_models, services.registry.current.path)
+
+    async def run_both():
+        return await pool.run(services.predict_many, rows), await pool.run(reject_input, rows)
+
+    try:
+        with pytest.raises(HTTPException) as error:
+            asyncio.run(run_both())
+        assert error.value.status_code == 500
+
+        assert asyncio.run(pool.run(services.predict_many, rows)) == services.predict_many(rows)
+
+        # Restarting starts new workers, which is how they pick up a new model version
+        pool.restart()
+        assert pool.stats() == {'backend': 'process', 'workers': 2, 'restarts': 1}
+        assert asyncio.run(pool.run(services.predict_many, rows)) == services.predict_many(rows)
+    finally:
+        pool.shutdown()
+
+
+def worker_model_version(rows):
+    """
+    Gets the model version an inference worker is serving.
+    """
+    return services.registry.current.version
+
+
+def test_process_pool_workers_are_not_forked_from_threads():
+    """
+    Tests restarting from another thread, as the admin reload and model watcher do, starts workers without
+    forking the threaded service and without the workers depending on models loaded before they started.
+    """
+
+    pool = InferencePool(workers=1, backend="process")
+    pool.set_initializer(services.load_worker_models, services.registry.current.path)
+    try:
+        pool.start()
+        restart = threading.Thread(target=pool.restart)
+        restart.start()
+        restart.join(timeout=60)
+
+        assert not restart.is_alive()
+        assert pool.executor._mp_context.get_start_method() == "forkserver"
+        assert asyncio.run(pool.run(worker_model_version, [])) == services.registry.current.version
+    finally:
+        pool.shutdown()
+
+
+def load_worker_models_slowly(path):
+    """
+    Loads the served models in an inference worker after a delay, standing in for a large model version.
+    """
+    time.sleep(1)
+    services.load_worker_models(path)
+
+
+def test_requests_are_served_while_workers_restart():
+    """
+    Tests requests keep running on the old workers while the new ones load the models, rather than waiting for
+    them with the pool locked.
+    """
+
+    pool = InferencePool(workers=1, backend="process")
+    pool.set_initializer(services.load_worker_models, services.registry.current.path)
+    try:
+        pool.start()
+        previous = pool.executor
+        pool.set_initializer(load_worker_models_slowly, services.registry.current.path)
+        restart = threading.Thread(target=pool.restart)
+        restart.start()
+
+        started = time.perf_counter()
+        assert asyncio.run(pool.run(worker_model_version, [])) == services.registry.current.version
+        assert time.perf_counter() - started < 0.5
+        assert pool.executor is previous
+
+        restart.join(timeout=60)
+        assert pool.executor is not previous
+        assert pool.stats()['restarts'] == 1
+    finally:
+        pool.shutdown()
@@ -0,0 +1,203 @@
+import math
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import pytest
+from data_seeding.create_reservations import (
+    COLLECTION_WEIGHTS, RANDOM_SEED, RESERVATION_WEIGHTS, generate_reservations, simulate_reservations
+)
+
+CONDITIONS = ["Sunny", "Partly cloudy", "Light rain"]
+CATEGORIES = ["BREAD_BAKED_GOODS", "READY_MEALS_HOT_FOOD", "MEAT_PROTEIN"]
+NORMALISED_WEATHER = pd.DataFrame({"condition": CONDITIONS, "value": [1.0, 0.9, 0.4]})
+NORMALISED_CATEGORIES = pd.DataFrame({"category": CATEGORIES, "value": [0.6, 1.0, 0.8]})
+USERS = pd.DataFrame({"user_id": [f"user-{i}" for i in range(5)]})
+
+
+def make_bundles(n_bundles, seed=0):
+    """
+    Builds a synthetic bundles frame spread over a fortnight with mixed prices, times and categories.
+    """
+
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i in range(n_bundles):
+        start = datetime(2026, 1, 5) + timedelta(days=int(rng.integers(0, 14)), hours=int(rng.integers(7, 23)))
+        retail_price = round(float(rng.uniform(4, 20)), 2)
+        rows.append({
+            "bundle_id": f"bundle-{i}",
+            "category": CATEGORIES[i % len(CATEGORIES)],
+            "price": round(retail_price * float(rng.uniform(0.2, 1.1)), 2),
+            "retail_price": retail_price,
+            "posting_time": (start - timedelta(minutes=int(rng.integers(30, 600)))).strftime("%Y-%m-%dT%H:%M:%S"),
+            "collection_start": start.strftime("%Y-%m-%dT%H:%M:%S"),
+            "collection_end": (start + timedelta(minutes=int(rng.integers(60, 300)))).strftime("%Y-%m-%dT%H:%M:%S")
+        })
+    return pd.DataFrame(rows)
+
+
+def make_weather():
+    """
+    Builds the daily weather for every collection date of the synthetic bundles.
+    """
+
+    dates = pd.date_range("2026-01-05", periods=14).strftime("%Y-%m-%d")
+    return pd.DataFrame({
+        "date": dates,
+        "condition": [f" {CONDITIONS[i % len(CONDITIONS)]} " for i in range(len(dates))],
+        "avgtemp_c": np.linspace(2.0, 24.0, len(dates))
+    })
+
+
+def reference_decision(bundle, weather, weights, threshold):
+    """
+    Makes a decision for a single bundle the way the original per-row implementation did.
+    """
+
+    fmt = "%Y-%m-%dT%H:%M:%S"
+    post_datetime = datetime.strptime(bundle["posting_time"], fmt)
+    start_datetime = datetime.strptime(bundle["collection_start"], fmt)
+    end_datetime = datetime.strptime(bundle["collection_end"], fmt)
+
+    day = weather[weather["date"] == start_datetime.strftime("%Y-%m-%d")].iloc[0]
+    lead_time = (start_datetime - post_datetime).total_seconds() / 3600
+    window_length = (end_datetime - start_datetime).total_seconds() / 3600
+    hour = start_datetime.hour
+
+    if lead_time < 1:
+        normalised_lead_time = 0.3
+    elif lead_time <= 4:
+        normalised_lead_time = 1.0
+    elif lead_time > 6:
+        normalised_lead_time = 0.4
+    else:
+        normalised_lead_time = 0.6
+
+    if 11 <= hour <= 14:
+        normalised_time_of_day = 1.0
+    elif 17 <= hour <= 20:
+        normalised_time_of_day = 0.9
+    elif 8 <= hour <= 10:
+        normalised_time_of_day = 0.6
+    elif hour > 21:
+        normalised_time_of_day = 0.2
+    else:
+        normalised_time_of_day = 0.5
+
+    factors = {
+        "discount": max(0, (bundle["retail_price"] - bundle["price"]) / bundle["retail_price"]),
+        "price": math.exp(-0.1 * bundle["price"]),
+        "weather": NORMALISED_WEATHER.set_index("condition")["value"][day["condition"].strip()],
+        "category": NORMALISED_CATEGORIES.set_index("category")["value"][bundle["category"]],
+        "temperature": math.exp(-((day["avgtemp_c"] - 20) ** 2) / (2 * (10 ** 2))),
+        "day_of_week": 1.0 if start_datetime.weekday() >= 5 else 0.7,
+        "lead_time": normalised_lead_time,
+        "window_length": min(1.0, window_length / 4.0),
+        "time_of_day": normalised_time_of_day
+    }
+    return sum(factors[name] * weight for name, weight in weights.items()) > threshold
+
+
+def test_reservations_match_the_per_row_decisions():
+    """
+    Tests the reservations have the database schema and that the bundles reserved and collected are the ones the
+    original per-row logic picks for the same thresholds.
+    """
+
+    bundles = make_bundles(300)
+    weather = make_weather()
+
+    reservations, dataset = simulate_reservations(
+        bundles, USERS, weather, NORMALISED_WEATHER, NORMALISED_CATEGORIES
+    )
+
+    # Replays the seeded draws in the order the simulation makes them to get the same thresholds
+    rng = np.random.default_rng(RANDOM_SEED)
+    rng.integers(0, len(USERS), len(bundles))
+    reservation_thresholds = 0.5 + rng.uniform(-0.05, 0.05, len(bundles))
+    collection_thresholds = 0.5 + rng.uniform(-0.05, 0.05, len(bundles))
+
+    is_reserved = np.array([
+        reference_decision(bundle, weather, RESERVATION_WEIGHTS, threshold)
+        for (_, bundle), threshold in zip(bundles.iterrows(), reservation_thresholds)
+    ])
+    is_collected = is_reserved & np.array([
+        reference_decision(bundle, weather, COLLECTION_WEIGHTS, threshold)
+        for (_, bundle), threshold in zip(bundles.iterrows(), collection_thresholds)
+    ])
+
+    assert list(reservations.columns) == [
+        "reservation_id", "bundle_id", "user_id", "amount_due", "reservation_time", "collection_time",
+        "collection_status"
+    ]
+    assert set(reservations["collection_status"]) <= {"COLLECTED", "NO_SHOW"}
+    assert 0 < is_reserved.sum() < len(bundles)
+
+    assert dataset["is_reserved"].tolist() == is_reserved.tolist()
+    assert dataset["is_collected"].tolist() == is_collected.tolist()
+    assert reservations["bundle_id"].tolist() == bundles.loc[is_reserved, "bundle_id"].tolist()
+    assert (reservations["collection_status"] == "COLLECTED").tolist() == is_collected[is_reserved].tolist()
+    assert reservations["reservation_id"].is_unique
+
+
+def test_reservation_and_collection_times_fall_in_the_bundle_window():
+    """
+    Tests every reservation is made after posting and at least an hour before the end of the collection window, and
+    every collection happens inside the window after the reservation.
+    """
+
+    bundles = make_bundles(300).set_index("bundle_id")
+    reservations, _ = simulate_reservations(
+        bundles.reset_index(), USERS, make_weather(), NORMALISED_WEATHER, NORMALISED_CATEGORIES
+    )
+
+    reserved = bundles.loc[reservations["bundle_id"]]
+    reservation_time = pd.to_datetime(reservations["reservation_time"]).to_numpy()
+    collection_time = pd.to_datetime(reservations["collection_time"]).to_numpy()
+    collection_end = pd.to_datetime(reserved["collection_end"]).to_numpy()
+
+    assert (reservation_time >= pd.to_datetime(reserved["posting_time"]).to_numpy()).all()
+    assert (reservation_time <= collection_end - np.timedelta64(1, "h")).all()
+    assert (collection_time >= pd.to_datetime(reserved["collection_start"]).to_numpy()).all()
+    assert (collection_time >= reservation_time).all()
+    assert (collection_time <= collection_end).all()
+
+
+def test_generate_reservations_reads_and_writes_the_given_files(tmp_path):
+    """
+    Tests the datasets are only read when generating, from the paths given, and both outputs are written.
+    """
+
+    paths = {
+        "bundles_path": tmp_path / "bundles.csv",
+        "users_path": tmp_path / "users.csv",
+        "weather_path": tmp_path / "weather.csv",
+        "normalised_weather_path": tmp_path / "normalised_weather.csv",
+        "normalised_categories_path": tmp_path / "categories.csv"
+    }
+    make_bundles(50).to_csv(paths["bundles_path"], index=False)
+    USERS.to_csv(paths["users_path"], index=False)
+    make_weather().to_csv(paths["weather_path"], index=False)
+    NORMALISED_WEATHER.to_csv(paths["normalised_weather_path"], index=False)
+    NORMALISED_CATEGORIES.to_csv(paths["normalised_categories_path"], index=False)
+
+    reservations, dataset = generate_reservations(
+        **paths, reservations_path=tmp_path / "reservations.csv", dataset_path=tmp_path / "ml.csv"
+    )
+
+    assert len(pd.read_csv(tmp_path / "reservations.csv")) == len(reservations)
+    assert list(pd.read_csv(tmp_path / "ml.csv").columns) == list(dataset.columns)
+    assert len(dataset) == 50
+
+
+def test_missing_weather_is_reported():
+    """
+    Tests a bundle collected on a date without weather raises an error naming the date.
+    """
+
+    weather = make_weather().iloc[1:]
+
+    with pytest.raises(ValueError, match="2026-01-05"):
+        simulate_reservations(
+            make_bundles(300), USERS, weather, NORMALISED_WEATHER, NORMALISED_CATEGORIES
+        )
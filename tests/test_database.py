@@ -0,0 +1,36 @@
+import asyncio
+import pytest
+from sqlalchemy import exc, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from src.database import TimedAsyncAdaptedQueuePool, pool_metrics
+
+
+def test_pool_records_checkout_waits_and_timeouts(tmp_path):
+    """
+    Tests the pool records every checkout and counts requests that time out waiting for a connection.
+    """
+
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}",
+        poolclass=TimedAsyncAdaptedQueuePool, pool_size=1, max_overflow=0, pool_timeout=0.05
+    )
+    checkouts, timeouts = pool_metrics.checkouts, pool_metrics.timeouts
+
+    async def hold_only_connection():
+        async with engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+
+            # The only connection is in use so a second checkout has to wait and then times out
+            with pytest.raises(exc.TimeoutError):
+                async with engine.connect():
+                    pass
+
+        async with engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+        await engine.dispose()
+
+    asyncio.run(hold_only_connection())
+
+    assert pool_metrics.checkouts - checkouts == 2
+    assert pool_metrics.timeouts - timeouts == 1
+    assert pool_metrics.wait_max >= 0
@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta, timezone
+import pandas as pd
+import pytest
+from src.features import FEATURES, bundle_features
+from src.services import build_bundle_input
+
+BUNDLE = {
+    'collection_start': '2025-01-10 17:00:00',
+    'posting_time': '2025-01-10 14:30:00',
+    'collection_end': '2025-01-10 18:30:00',
+    'retail_price': 10.0,
+    'price': 4.0,
+    'category': 'BREAD_BAKED_GOODS'
+}
+
+
+def test_bundle_features_are_derived_from_the_bundle_columns():
+    """
+    Tests the features of a bundle and the order of the columns, which matches the training dataset.
+    """
+
+    features = bundle_features([BUNDLE], lambda collection_start: ("Sunny", 18.0))
+
+    assert list(features.columns) == FEATURES
+    assert features.iloc[0].to_dict() == pytest.approx({
+        'discount': 0.6, 'price': 4.0, 'weather': "Sunny", 'category': 'BREAD_BAKED_GOODS', 'temperature': 18.0,
+        'day': 'Friday', 'lead_time': 2.5, 'time_of_day': 17, 'window_length': 1.5
+    })
+
+
+def test_bundle_features_accept_datetimes_and_weather_per_bundle():
+    """
+    Tests bundles with datetime columns, as asyncpg returns them, give the same features as string timestamps and
+    the weather lookup is given every collection start.
+    """
+
+    as_datetimes = [
+        dict(BUNDLE, **{column: datetime.fromisoformat(BUNDLE[column]) for column in
+                        ('collection_start', 'posting_time', 'collection_end')}),
+        dict(BUNDLE, collection_start=datetime(2025, 1, 11, 9), price=12.0)
+    ]
+
+    def lookup(collection_start):
+        days = pd.Series(collection_start)
+        return days.dt.day.map({10: "Sunny", 11: "Overcast"}), days.dt.hour.astype(float)
+
+    features = bundle_features(as_datetimes, lookup)
+
+    assert features.iloc[0].to_dict() == bundle_features([BUNDLE], lookup).iloc[0].to_dict()
+    assert features['weather'].tolist() == ["Sunny", "Overcast"]
+    assert features['temperature'].tolist() == [17.0, 9.0]
+    # Prices above the retail price give no discount rather than a negative one
+    assert features['discount'].tolist() == pytest.approx([0.6, 0.0])
+    assert build_bundle_input(as_datetimes[0], "Sunny", 17.0) == features.iloc[0].to_dict()
+
+
+def test_timezone_aware_timestamps_keep_their_local_time():
+    """
+    Tests timestamps with a timezone give the day and hour at the vendor rather than in UTC.
+    """
+
+    tz = timezone(timedelta(hours=5))
+    bundle = dict(
+        BUNDLE, collection_start=datetime(2025, 1, 10, 2, tzinfo=tz), posting_time=datetime(2025, 1, 9, 23, tzinfo=tz),
+        collection_end=datetime(2025, 1, 10, 4, tzinfo=tz)
+    )
+
+    features = build_bundle_input(bundle, "Sunny", 18.0)
+
+    assert (features['day'], features['time_of_day']) == ('Friday', 2)
+    assert (features['lead_time'], features['window_length']) == (3.0, 2.0)
@@ -0,0 +1,56 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from src.inference import InferenceEngine, _predict_from_decision
+from src.services import ML_DIR, registry
+
+model_reservation = registry.current.model_reservation
+model_collection = registry.current.model_collection
+
+
+@pytest.fixture(scope="module")
+def dataset():
+    """
+    Loads the model inputs from the training dataset.
+    :return: Dataframe of input features.
+    """
+    df = pd.read_csv(os.path.join(ML_DIR, "dataset.csv"))
+    return df.drop(['is_collected', 'is_reserved'], axis=1).sample(n=2000, random_state=42)
+
+
+def test_engine_matches_pipelines(dataset):
+    """
+    Tests the single-pass engine gives exactly the same outputs as calling each pipeline directly.
+    :param dataset: The model inputs.
+    """
+
+    engine = InferenceEngine(model_reservation, model_collection)
+    assert engine.shared_preprocessor
+
+    reservation_predictions, reservation_probabilities, collection_predictions, collection_probabilities = engine.predict(dataset)
+
+    np.testing.assert_array_equal(reservation_predictions, model_reservation.predict(dataset))
+    np.testing.assert_array_equal(reservation_probabilities, model_reservation.predict_proba(dataset)[:, 1])
+    np.testing.assert_array_equal(collection_predictions, model_collection.predict(dataset))
+    np.testing.assert_array_equal(collection_probabilities, model_collection.predict_proba(dataset)[:, 1])
+
+
+def test_predictions_follow_the_decision_score_sign():
+    """
+    Tests scores so close to 0 that their probability rounds to 0.5 are labelled by their sign, as predict does.
+    """
+
+    classifier = model_reservation[-1]
+    scores = np.array([-1e-17, 0.0, 1e-17, -2.0, 2.0])
+
+    class FixedScores:
+        classes_ = classifier.classes_
+
+        def decision_function(self, matrix):
+            return scores
+
+    predictions, probabilities = _predict_from_decision(FixedScores(), None)
+
+    np.testing.assert_array_equal(predictions, classifier.classes_[[0, 1, 1, 0, 1]])
+    assert probabilities[0] == 0.5
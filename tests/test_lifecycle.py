@@ -0,0 +1,80 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+from fastapi.testclient import TestClient
+from src import lifecycle
+from src.lifecycle import Readiness, start_up
+from src.main import app
+from src.services import registry
+
+
+def test_start_up_stops_at_failed_step_and_retries():
+    """
+    Tests a failing step leaves the service not ready with the error reported, and a later attempt finishes
+    starting up without repeating the steps that already succeeded.
+    """
+
+    state = Readiness()
+    prewarm = AsyncMock(side_effect=[ConnectionRefusedError("database unreachable"), None])
+
+    with patch.object(lifecycle, "prewarm_pool", prewarm), \
+            patch.object(lifecycle.services, "warm_up", wraps=lifecycle.services.warm_up) as warm_up:
+        assert not asyncio.run(start_up(state))
+        assert state.completed == {'models': True, 'warm_up': True, 'inference_pool': True, 'database': False}
+        assert state.errors == {'database': "database unreachable"}
+
+        assert asyncio.run(start_up(state))
+
+    assert state.ready
+    assert state.errors == {}
+    assert warm_up.call_count == 1
+    assert prewarm.await_count == 2
+
+
+def test_not_ready_without_models():
+    """
+    Tests readiness fails when no model version is being served, even if every step completed.
+    """
+
+    state = Readiness()
+    state.completed = {step: True for step in Readiness.STEPS}
+
+    with patch.object(registry, "current", None):
+        assert not state.ready
+
+
+def test_liveness_and_readiness_endpoints():
+    """
+    Tests liveness always answers while readiness returns a 503 until startup has finished.
+    """
+
+    client = TestClient(app)
+    state = Readiness()
+
+    with patch.object(lifecycle, "readiness", state), patch("src.main.readiness", state):
+        assert client.get("/forecast/actuator/live").status_code == 200
+
+        response = client.get("/forecast/actuator/ready")
+        assert response.status_code == 503
+        assert response.json()['ready'] is False
+
+        state.completed = {step: True for step in Readiness.STEPS}
+        response = client.get("/forecast/actuator/ready")
+        assert response.status_code == 200
+        assert response.json()['checks']['database'] is True
+
+
+def test_lifespan_makes_service_ready():
+    """
+    Tests starting the application loads, warms up and opens database connections before serving.
+    """
+
+    state = Readiness()
+
+    with patch.object(lifecycle, "readiness", state), patch("src.main.readiness", state), \
+            patch("src.main.start_up", lambda: start_up(state)), \
+            patch.object(lifecycle, "prewarm_pool", AsyncMock()) as prewarm:
+        with TestClient(app) as client:
+            response = client.get("/forecast/actuator/ready")
+
+    assert response.status_code == 200
+    prewarm.assert_awaited_once()
@@ -0,0 +1,56 @@
+import asyncio
+import sqlite3
+from loadtest.run import percentile
+from loadtest.stand_ins import FakeWeatherServer, seed_database
+from src.weather import WeatherClient
+
+
+def test_seeded_database_has_bundles_for_every_vendor(tmp_path):
+    """
+    Tests the stand-in database holds bundles joined to vendor postcodes like the production tables.
+    """
+
+    path = str(tmp_path / "forecast.db")
+    bundles = seed_database(path, bundles_per_vendor=2)
+
+    with sqlite3.connect(path) as connection:
+        rows = connection.execute(
+            "SELECT b.bundle_id, v.postcode FROM bundles b JOIN vendor v ON v.vendor_id = b.vendor_id"
+        ).fetchall()
+
+    assert len(rows) == len(bundles) > 0
+    assert all(postcode for _, postcode in rows)
+
+
+def test_fake_weather_server_answers_weather_client():
+    """
+    Tests the fake weather API returns responses the service's weather client can read.
+    """
+
+    server = FakeWeatherServer(latency_ms=1, jitter_ms=0).start()
+    try:
+        client = WeatherClient("load-test", base_url=server.url)
+
+        async def fetch():
+            try:
+                return await client.fetch("EX4 4QJ")
+            finally:
+                await client.aclose()
+
+        condition, temperature = asyncio.run(fetch())
+    finally:
+        server.stop()
+
+    assert isinstance(condition, str) and isinstance(temperature, float)
+    assert server.requests == 1
+
+
+def test_percentile_uses_nearest_rank():
+    """
+    Tests percentiles are taken from the sorted latencies.
+    """
+
+    latencies = [i / 100 for i in range(1, 101)]
+    assert percentile(latencies, 50) == 0.5
+    assert percentile(latencies, 99) == 0.99
+    assert percentile([], 95) == 0.0
@@ -0,0 +1,56 @@
+import asyncio
+from src import services
+from src.concurrency import InferencePool
+from src.metrics import Counter, Histogram, STAGE_LATENCY
+from src.registry import WARM_UP_INPUT
+
+
+def test_histogram_renders_cumulative_buckets():
+    """
+    Tests observations are rendered as cumulative Prometheus buckets with a sum and count.
+    """
+
+    histogram = Histogram("stage_seconds", "Stage latency.", ("stage",), buckets=(0.01, 0.1))
+    histogram.observe(0.005, stage="weather")
+    histogram.observe(0.05, stage="weather")
+    histogram.observe(5.0, stage="weather")
+
+    lines = histogram.render()
+
+    assert lines[:2] == ["# HELP stage_seconds Stage latency.", "# TYPE stage_seconds histogram"]
+    assert 'stage_seconds_bucket{stage="weather",le="0.01"} 1' in lines
+    assert 'stage_seconds_bucket{stage="weather",le="0.1"} 2' in lines
+    assert 'stage_seconds_bucket{stage="weather",le="+Inf"} 3' in lines
+    assert 'stage_seconds_sum{stage="weather"} 5.055' in lines
+    assert 'stage_seconds_count{stage="weather"} 3' in lines
+
+
+def test_counter_escapes_label_values():
+    """
+    Tests label values are escaped so they cannot break the text format.
+    """
+
+    counter = Counter("requests_total", "Requests.", ("path",))
+    counter.inc(path='/a"b')
+    counter.inc(path='/a"b')
+
+    assert counter.render()[-1] == 'requests_total{path="/a\\"b"} 2.0'
+
+
+def test_process_backend_stages_reach_the_service():
+    """
+    Tests stages timed inside inference worker processes are observed in the services own metrics.
+    """
+
+    pool = InferencePool(workers=1, backend="process")
+    pool.set_initializer(services.load_worker_models, services.registry.current.path)
+    stages = ("preprocessing", "inference_reservation", "inference_collection")
+    try:
+        pool.start()
+        before = {stage: STAGE_LATENCY.count(stage=stage) for stage in stages}
+        for _ in range(3):
+            asyncio.run(pool.run(services.predict_many, [WARM_UP_INPUT]))
+
+        assert {stage: STAGE_LATENCY.count(stage=stage) - before[stage] for stage in stages} == dict.fromkeys(stages, 3)
+    finally:
+        pool.shutdown()
@@ -0,0 +1,119 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from src.predictor import CompiledPredictor
+from src.trees import BLOCK_SIZE
+from src.services import ML_DIR, registry
+
+model_reservation = registry.current.model_reservation
+model_collection = registry.current.model_collection
+
+
+@pytest.fixture(scope="module")
+def dataset():
+    """
+    Loads the model inputs from the training dataset.
+    :return: Dataframe of input features.
+    """
+    df = pd.read_csv(os.path.join(ML_DIR, "dataset.csv"))
+    return df.drop(['is_collected', 'is_reserved'], axis=1)
+
+
+@pytest.fixture(scope="module")
+def predictor():
+    """
+    Compiles the pipelines shipped with the service.
+    :return: The compiled predictor.
+    """
+    return CompiledPredictor.from_pipelines(model_reservation, model_collection)
+
+
+def assert_matches_pipelines(outputs, input_df):
+    """
+    Checks compiled predictor outputs are identical to the sklearn pipelines.
+    :param outputs: The compiled predictor outputs.
+    :param input_df: The inputs as a dataframe.
+    """
+    reservation_predictions, reservation_probabilities, collection_predictions, collection_probabilities = outputs
+
+    np.testing.assert_array_equal(reservation_predictions, model_reservation.predict(input_df))
+    np.testing.assert_array_equal(reservation_probabilities, model_reservation.predict_proba(input_df)[:, 1])
+    np.testing.assert_array_equal(collection_predictions, model_collection.predict(input_df))
+    np.testing.assert_array_equal(collection_probabilities, model_collection.predict_proba(input_df)[:, 1])
+
+
+def test_parity_with_pipelines(predictor, dataset):
+    """
+    Tests the compiled predictor gives the same outputs as the pipelines on the training data.
+    :param predictor: The compiled predictor.
+    :param dataset: The model inputs.
+    """
+    assert_matches_pipelines(predictor.predict(dataset.to_dict('records')), dataset)
+
+
+def test_single_dict_and_numpy_row(predictor, dataset):
+    """
+    Tests a plain dict and a NumPy row give the same result as the pipelines.
+    :param predictor: The compiled predictor.
+    :param dataset: The model inputs.
+    """
+    row = dataset.iloc[:1]
+
+    assert_matches_pipelines(predictor.predict(row.iloc[0].to_dict()), row)
+    assert_matches_pipelines(predictor.predict(row.to_numpy()[0]), row)
+
+
+def test_unknown_categories_are_ignored(predictor, dataset):
+    """
+    Tests categories not seen in training are encoded as all zeros, like the OneHotEncoder.
+    :param predictor: The compiled predictor.
+    :param dataset: The model inputs.
+    """
+    row = dataset.iloc[:1].assign(weather="Blizzard", category="UNKNOWN_CATEGORY")
+
+    assert_matches_pipelines(predictor.predict(row.iloc[0].to_dict()), row)
+
+
+def test_flat_forest_matches_classifier(predictor, dataset):
+    """
+    Tests the flattened tree engine gives the same raw scores as the classifier for every row of the dataset.
+    :param predictor: The compiled predictor.
+    :param dataset: The model inputs.
+    """
+    matrix = model_reservation[:-1].transform(dataset)
+
+    np.testing.assert_array_equal(
+        predictor.reservation_ensemble.forest.decision_function(matrix),
+        model_reservation[-1].decision_function(matrix)
+    )
+
+
+def test_flat_forest_matches_classifier_across_blocks(predictor, dataset):
+    """
+    Tests a batch ending in a block of a single row, which is summed separately, scores like the classifier and
+    the leaves found by apply give the same scores.
+    :param predictor: The compiled predictor.
+    :param dataset: The model inputs.
+    """
+    matrix = model_collection[:-1].transform(dataset.iloc[:BLOCK_SIZE + 1])
+    forest = predictor.collection_ensemble.forest
+
+    np.testing.assert_array_equal(forest.decision_function(matrix), model_collection[-1].decision_function(matrix))
+
+    # The leaves found by apply add up to the same scores
+    leaves = forest.value[np.arange(forest.n_trees)[:, None], forest.apply(matrix)]
+    np.testing.assert_allclose(forest.init_raw + leaves.sum(axis=0), forest.decision_function(matrix))
+
+
+def test_non_finite_inputs_are_rejected(predictor, dataset):
+    """
+    Tests inputs that become NaN, such as a lead time below -1 hours, raise an error like sklearn does.
+    :param predictor: The compiled predictor.
+    :param dataset: The model inputs.
+    """
+    row = dataset.iloc[0].to_dict()
+    row['lead_time'] = -2.0
+
+    with pytest.raises(ValueError):
+        predictor.predict(row)
@@ -0,0 +1,55 @@
+import os
+import time
+import jwt
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from src.main import app
+from src.auth import SECRET_KEY, ALGORITHM
+from src.profiling import PROFILED_PATHS
+
+client = TestClient(app)
+
+VENDOR_ID = "e27daa6e-3e67-4d51-8ac0-cc73c621fd40"
+PAYLOAD = {
+    "price": 11.0, "discount": 1.0, "lead_time": 5, "window_length": 5.0,
+    "weather": "Heavy Rain", "category": "DRINKS_BEVERAGES",
+    "day": "Monday", "time_of_day": 15
+}
+
+
+def test_profile_is_written_for_privileged_requests(tmp_path, monkeypatch):
+    """
+    Tests a request sending the admin token in the profiling header gets a collapsed stack profile written.
+    """
+
+    monkeypatch.setattr("src.profiling.PROFILING_ENABLED", True)
+    monkeypatch.setattr("src.profiling.PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr("src.auth.ADMIN_TOKEN", "admin-secret")
+
+    token = jwt.encode({"sub": VENDOR_ID, "exp": time.time() + 3600}, SECRET_KEY, algorithm=ALGORITHM)
+    headers = {"Authorization": f"Bearer {token}"}
+
+    with patch("src.main.get_current_weather", return_value=("Rain", 15.0)):
+        unprofiled = client.post("/forecast/simulate", json=PAYLOAD, headers=dict(headers, **{"X-Profile-Token": "wrong"}))
+        profiled = client.post("/forecast/simulate", json=PAYLOAD, headers=dict(headers, **{"X-Profile-Token": "admin-secret"}))
+
+    assert unprofiled.status_code == profiled.status_code == 200
+    assert "x-profile-file" not in unprofiled.headers
+    assert os.listdir(tmp_path) == [profiled.headers["x-profile-file"]]
+
+    # Each line is a semicolon separated stack followed by its sample count
+    with open(tmp_path / profiled.headers["x-profile-file"]) as file:
+        lines = file.read().splitlines()
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+
+
+def test_only_single_prediction_paths_are_profiled():
+    """
+    Tests the simulate and single bundle prediction paths can be profiled but the batch endpoint cannot.
+    """
+
+    assert PROFILED_PATHS.search("/forecast/simulate")
+    assert PROFILED_PATHS.search("/forecast/predict/0cd9b33a-1202-48f1-a42e-a65b895b5e1f")
+    assert PROFILED_PATHS.search("/forecast/predict/batch-1")
+    assert not PROFILED_PATHS.search("/forecast/predict/batch")
+    assert not PROFILED_PATHS.search("/forecast/stream")
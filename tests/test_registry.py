@@ -0,0 +1,74 @@
+import os
+import shutil
+import pytest
+from src.registry import ModelRegistry, RESERVATION_FILE, COLLECTION_FILE, VERSION_FILE
+from src.services import ML_DIR
+
+
+@pytest.fixture
+def model_dir(tmp_path):
+    """
+    Copies the shipped models into a temporary model directory.
+    :return: Path of the model directory.
+    """
+    for name in (RESERVATION_FILE, COLLECTION_FILE):
+        shutil.copy(os.path.join(ML_DIR, name), tmp_path / name)
+    return tmp_path
+
+
+def test_reload_swaps_versions(model_dir):
+    """
+    Tests a named version replaces the default one and listeners are told about the swap.
+    :param model_dir: The model directory.
+    """
+
+    registry = ModelRegistry(str(model_dir))
+    swaps = []
+    registry.add_listener(lambda new, previous: swaps.append((new.version, previous and previous.version)))
+
+    default = registry.reload()
+
+    # Without a VERSION file the version is named after a digest of the model files
+    assert len(default.version) == 12
+
+    version_dir = model_dir / "versions" / "2025-06-01"
+    shutil.copytree(model_dir, version_dir, ignore=shutil.ignore_patterns("versions"))
+    (version_dir / VERSION_FILE).write_text("2025-06-01\n")
+
+    registry.reload("2025-06-01")
+
+    assert registry.current.version == "2025-06-01"
+    assert swaps == [(default.version, None), ("2025-06-01", default.version)]
+
+
+def test_failed_reload_keeps_current_version(model_dir):
+    """
+    Tests a version that cannot be loaded never replaces the one being served.
+    :param model_dir: The model directory.
+    """
+
+    registry = ModelRegistry(str(model_dir))
+    current = registry.reload()
+
+    with pytest.raises(FileNotFoundError):
+        registry.reload("missing-version")
+    with pytest.raises(ValueError):
+        registry.reload("../outside")
+
+    assert registry.current is current
+
+
+def test_watcher_reloads_changed_files(model_dir):
+    """
+    Tests new model files copied into the directory are picked up.
+    :param model_dir: The model directory.
+    """
+
+    registry = ModelRegistry(str(model_dir))
+    registry.reload()
+    assert not registry.check_for_changes()
+
+    (model_dir / VERSION_FILE).write_text("retrained")
+
+    assert registry.check_for_changes()
+    assert registry.current.version == "retrained"
@@ -0,0 +1,144 @@
+import asyncio
+import uuid
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from src.repository import get_bundle, get_bundles, stream_active_bundles
+
+VENDOR_ID = "e27daa6e-3e67-4d51-8ac0-cc73c621fd40"
+OTHER_VENDOR_ID = "5b0f3c1e-9f8a-4c6d-8e2b-1a7d9c3e4f60"
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    """
+    Creates a SQLite database with the bundles and vendor tables standing in for Postgres.
+    :return: Async session factory bound to the database.
+    """
+
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'forecast.db'}")
+
+    async def create():
+        async with engine.begin() as connection:
+            await connection.execute(text("CREATE TABLE vendor (vendor_id TEXT PRIMARY KEY, name TEXT, postcode TEXT)"))
+            await connection.execute(text(
+                "CREATE TABLE bundles (bundle_id TEXT PRIMARY KEY, vendor_id TEXT, collection_start TEXT, "
+                "posting_time TEXT, collection_end TEXT, retail_price REAL, price REAL, category TEXT, description TEXT)"
+            ))
+            await connection.execute(text("INSERT INTO vendor VALUES (:vid, 'Test Vendor', 'EX4 4QJ')"), {'vid': VENDOR_ID})
+            await connection.execute(
+                text(
+                    "INSERT INTO bundles VALUES (:bid, :vid, '2099-10-30 10:00:00', '2099-10-30 08:00:00', "
+                    "'2099-10-30 11:00:00', 20.0, 10.0, 'DRINKS_BEVERAGES', 'Unused')"
+                ),
+                [{'bid': f"bundle-{i}", 'vid': VENDOR_ID} for i in range(5)] + [{'bid': "other", 'vid': OTHER_VENDOR_ID}]
+            )
+
+    asyncio.run(create())
+    yield async_sessionmaker(engine)
+    asyncio.run(engine.dispose())
+
+
+def test_get_bundle_includes_postcode(session_factory):
+    """
+    Tests a bundle is returned with only the columns the models need and the vendors postcode.
+    """
+
+    async def fetch():
+        async with session_factory() as db:
+            return await get_bundle(db, "bundle-1", VENDOR_ID), await get_bundle(db, "other", VENDOR_ID)
+
+    bundle, other_vendors_bundle = asyncio.run(fetch())
+
+    assert bundle['postcode'] == "EX4 4QJ"
+    assert bundle['price'] == 10.0
+    assert "description" not in bundle
+
+    # Bundles of other vendors are not returned
+    assert other_vendors_bundle is None
+
+
+def test_get_bundles_returns_found_bundles(session_factory):
+    """
+    Tests many bundles are returned by ID and missing or other vendors bundles are left out.
+    """
+
+    async def fetch():
+        async with session_factory() as db:
+            return await get_bundles(db, ["bundle-0", "bundle-3", "missing", "other"], VENDOR_ID)
+
+    bundles = asyncio.run(fetch())
+
+    assert sorted(bundles) == ["bundle-0", "bundle-3"]
+    assert all(bundle['postcode'] == "EX4 4QJ" for bundle in bundles.values())
+
+
+def test_get_bundle_without_vendor_location(session_factory):
+    """
+    Tests a bundle whose vendor has no location is still returned, with no postcode.
+    """
+
+    async def fetch():
+        async with session_factory() as db:
+            return await get_bundle(db, "other", OTHER_VENDOR_ID)
+
+    assert asyncio.run(fetch())['postcode'] is None
+
+
+def test_stream_active_bundles_in_chunks(session_factory):
+    """
+    Tests the vendors bundles are streamed in chunks of the requested size.
+    """
+
+    async def fetch():
+        async with session_factory() as db:
+            return [chunk async for chunk in stream_active_bundles(db, VENDOR_ID, 2)]
+
+    chunks = asyncio.run(fetch())
+
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+
+
+def test_get_bundles_matches_uuid_ids_in_any_form(session_factory):
+    """
+    Tests bundles stored under UUIDs are found and keyed by the requested ID whether it is upper case or returned by
+    the database as a UUID object, as asyncpg does for Postgres uuid columns.
+    """
+
+    bundle_id = "0cd9b33a-1202-48f1-a42e-a65b895b5e1f"
+
+    class UUIDRows:
+        """
+        Stands in for the asyncpg result, which returns UUID objects for the bundle IDs.
+        """
+
+        def __init__(self, result):
+            self.result = result
+
+        def mappings(self):
+            return self
+
+        def all(self):
+            return [dict(row, bundle_id=uuid.UUID(row['bundle_id'])) for row in self.result.mappings().all()]
+
+    async def fetch():
+        async with session_factory() as db:
+            await db.execute(
+                text("INSERT INTO bundles SELECT :bid, vendor_id, collection_start, posting_time, collection_end, "
+                     "retail_price, price, category, description FROM bundles WHERE bundle_id = 'bundle-0'"),
+                {'bid': bundle_id}
+            )
+            from_sqlite = await get_bundles(db, [bundle_id.upper()], VENDOR_ID)
+
+            execute = db.execute
+
+            async def execute_with_uuids(*args, **kwargs):
+                return UUIDRows(await execute(*args, **kwargs))
+            db.execute = execute_with_uuids
+            from_asyncpg = await get_bundles(db, [bundle_id], VENDOR_ID)
+            return from_sqlite, from_asyncpg
+
+    from_sqlite, from_asyncpg = asyncio.run(fetch())
+
+    assert list(from_sqlite) == [bundle_id.upper()]
+    assert list(from_asyncpg) == [bundle_id]
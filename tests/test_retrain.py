@@ -0,0 +1,206 @@
+import os
+import re
+import shutil
+import sqlite3
+import uuid
+from datetime import datetime, timedelta
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine
+from src.ml.retrain import Reservoir, WeatherHistory, read_new_outcomes, retrain
+from src.registry import RESERVATION_FILE, COLLECTION_FILE
+from src.services import ML_DIR
+
+NOW = datetime(2025, 6, 1, 12)
+
+SEEDING_DIR = os.path.join(os.path.dirname(__file__), "..", "data_seeding", "database_seeding_files")
+
+SCHEMA = """
+CREATE TABLE bundles (
+    bundle_id TEXT PRIMARY KEY,
+    collection_start TEXT,
+    posting_time TEXT,
+    collection_end TEXT,
+    retail_price REAL,
+    price REAL,
+    category TEXT
+);
+CREATE TABLE reservations (
+    reservation_id TEXT PRIMARY KEY,
+    bundle_id TEXT,
+    status TEXT
+);
+"""
+
+
+def insert_bundles(path, count, days_ago, seed):
+    """
+    Inserts bundles that finished collection days_ago days before NOW, with a reservation for some of them.
+    """
+    rng = np.random.default_rng(seed)
+    categories = ['BREAD_BAKED_GOODS', 'DRINKS_BEVERAGES', 'SWEET_TREATS_DESSERTS']
+    with sqlite3.connect(path) as connection:
+        for i in range(count):
+            bundle_id = str(uuid.UUID(int=int(rng.integers(0, 2**63))))
+            collection_start = NOW - timedelta(days=days_ago, hours=int(rng.integers(6, 18)))
+            connection.execute("INSERT INTO bundles VALUES (?, ?, ?, ?, ?, ?, ?)", (
+                bundle_id,
+                collection_start.strftime('%Y-%m-%d %H:%M:%S'),
+                (collection_start - timedelta(hours=float(rng.uniform(0.5, 6)))).strftime('%Y-%m-%d %H:%M:%S'),
+                (collection_start + timedelta(hours=float(rng.uniform(1, 4)))).strftime('%Y-%m-%d %H:%M:%S'),
+                10.0, float(rng.uniform(2, 9)), categories[i % len(categories)]
+            ))
+            if rng.random() < 0.6:
+                status = 'COLLECTED' if rng.random() < 0.7 else 'NO_SHOW'
+                connection.execute("INSERT INTO reservations VALUES (?, ?, ?)", (str(uuid.uuid4()), bundle_id, status))
+
+
+@pytest.fixture
+def database(tmp_path):
+    """
+    Creates a SQLite database with the bundles and reservations tables.
+    :return: Path of the database.
+    """
+    path = tmp_path / "forecast.db"
+    with sqlite3.connect(path) as connection:
+        connection.executescript(SCHEMA)
+    return path
+
+
+@pytest.fixture
+def model_dir(tmp_path):
+    """
+    Copies the shipped models into a temporary model directory.
+    :return: Path of the model directory.
+    """
+    path = tmp_path / "models"
+    path.mkdir()
+    for name in (RESERVATION_FILE, COLLECTION_FILE):
+        shutil.copy(os.path.join(ML_DIR, name), path / name)
+    return path
+
+
+@pytest.fixture
+def weather_history(tmp_path):
+    """
+    Saves a daily weather history covering the weeks before NOW.
+    :return: WeatherHistory read from it.
+    """
+    path = tmp_path / "weather.csv"
+    days = pd.date_range(NOW - timedelta(days=20), NOW)
+    pd.DataFrame({
+        'date': days.strftime('%Y-%m-%d'),
+        'condition': np.resize(['Sunny ', 'Overcast', 'Patchy rain possible', 'Partly cloudy'], len(days)),
+        'avgtemp_c': np.linspace(8, 19, len(days)).round(1)
+    }).to_csv(path, index=False)
+    return WeatherHistory(path=str(path))
+
+
+def test_reservoir_is_bounded_and_uniform():
+    """
+    Tests the sample never grows past its capacity and keeps rows from across the whole history.
+    """
+
+    reservoir = Reservoir(capacity=500, seed=1)
+    for start in range(0, 20000, 700):
+        reservoir.add(pd.DataFrame({'row': np.arange(start, min(start + 700, 20000))}))
+
+    assert reservoir.seen == 20000
+    assert len(reservoir.rows) == 500
+    assert reservoir.rows['row'].is_unique
+    # A uniform sample of 0..19999 has a mean near 10000 and rows from every part of the history
+    assert 9000 < reservoir.rows['row'].mean() < 11000
+    assert (reservoir.rows['row'] < 5000).any() and (reservoir.rows['row'] >= 15000).any()
+
+
+def test_retrain_reads_only_new_bundles(database, model_dir, weather_history, tmp_path):
+    """
+    Tests each run only reads bundles settled since the previous run, warm-starts from the last saved version and
+    does nothing when there is nothing new.
+    :param database: The SQLite database.
+    :param model_dir: The model directory.
+    :param weather_history: The daily weather history.
+    """
+
+    engine = create_engine(f"sqlite:///{database}")
+    state_dir = tmp_path / "state"
+    options = dict(model_dir=str(model_dir), state_dir=str(state_dir), chunk_size=64, reservoir_size=300,
+                   warm_start_rounds=5, weather_history=weather_history, now=NOW)
+
+    insert_bundles(database, 250, days_ago=10, seed=1)
+    # Collection ended too recently for the outcome to be final
+    insert_bundles(database, 20, days_ago=0, seed=2)
+
+    first = retrain(engine, **options)
+    assert first['new_rows'] == 250
+    assert first['mode'] == 'warm_start'
+
+    insert_bundles(database, 150, days_ago=5, seed=3)
+    second = retrain(engine, **dict(options, now=NOW + timedelta(minutes=1)))
+    assert second['new_rows'] == 150
+    assert second['rows_seen'] == 400
+    assert second['sample_rows'] == 300
+
+    pipeline = joblib.load(os.path.join(second['path'], RESERVATION_FILE))
+    assert pipeline[-1].n_estimators == 310
+
+    third = retrain(engine, **dict(options, now=NOW + timedelta(minutes=2)))
+    assert third['new_rows'] == 0
+    assert 'version' not in third
+
+
+def test_retrain_refuses_to_run_without_weather_history(database, model_dir, tmp_path):
+    """
+    Tests retraining fails rather than training on the climatology alone when the daily weather history is missing,
+    leaving the watermark where it was.
+    :param database: The SQLite database.
+    :param model_dir: The model directory.
+    """
+
+    insert_bundles(database, 50, days_ago=10, seed=1)
+    missing = WeatherHistory(path=str(tmp_path / "missing.csv"))
+    state_dir = tmp_path / "state"
+
+    with pytest.raises(ValueError, match="No daily weather history"):
+        retrain(create_engine(f"sqlite:///{database}"), model_dir=str(model_dir), state_dir=str(state_dir),
+                weather_history=missing, now=NOW)
+    assert not state_dir.exists()
+
+
+def test_outcomes_query_matches_the_seeded_schema(tmp_path):
+    """
+    Tests the outcomes query runs against reservations loaded from the database seeding file, whose columns are
+    mapped to snake case like the rest of the database, and reads each bundles outcome from its status.
+    """
+
+    reservations = pd.read_csv(os.path.join(SEEDING_DIR, "reservations_seeding.csv"), nrows=300)
+    reservations.columns = [re.sub(r"(?<!^)(?=[A-Z])", "_", column).lower() for column in reservations.columns]
+
+    # The seeded bundles are not in the repository, so bundles are made for the reservations and some without any
+    rng = np.random.default_rng(0)
+    bundle_ids = list(reservations['bundle_id']) + [str(uuid.UUID(int=i)) for i in range(100)]
+    collection_start = pd.Timestamp(NOW) - pd.to_timedelta(rng.integers(30, 200, len(bundle_ids)), unit='h')
+    bundles = pd.DataFrame({
+        'bundle_id': bundle_ids,
+        'collection_start': collection_start.strftime('%Y-%m-%d %H:%M:%S'),
+        'posting_time': (collection_start - pd.Timedelta(hours=2)).strftime('%Y-%m-%d %H:%M:%S'),
+        'collection_end': (collection_start + pd.Timedelta(hours=2)).strftime('%Y-%m-%d %H:%M:%S'),
+        'retail_price': 10.0,
+        'price': 5.0,
+        'category': 'BREAD_BAKED_GOODS'
+    })
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'seeded.db'}")
+    reservations.to_sql("reservations", engine, index=False)
+    bundles.to_sql("bundles", engine, index=False)
+
+    outcomes = pd.concat(read_new_outcomes(engine, None, NOW, chunk_size=128)).set_index('bundle_id')
+    expected = reservations.set_index('bundle_id')['status'] == 'COLLECTED'
+
+    assert expected.any() and not expected.all()
+    assert len(outcomes) == len(bundles)
+    assert outcomes['is_reserved'].astype(bool).sum() == len(reservations)
+    assert (outcomes.loc[expected.index, 'is_collected'].astype(bool) == expected).all()
+    assert not outcomes.drop(expected.index)['is_collected'].astype(bool).any()
@@ -0,0 +1,71 @@
+import json
+import pytest
+from src.ml import train_model
+from src.registry import ModelRegistry, WARM_UP_INPUT
+
+
+@pytest.fixture(scope="module")
+def small_dataset(tmp_path_factory):
+    """
+    Writes the first rows of the training dataset to a temporary file so fits are quick.
+    :return: Path of the dataset.
+    """
+    path = tmp_path_factory.mktemp("dataset") / "dataset.csv"
+    with open(train_model.DATASET_PATH) as source, open(path, "w") as file:
+        for _, line in zip(range(1501), source):
+            file.write(line)
+    return path
+
+
+def test_compare_engines_reports_every_target(small_dataset):
+    """
+    Tests each engine is reported with its fit time, size and holdout metrics for both targets.
+    :param small_dataset: The dataset file.
+    """
+
+    X, targets = train_model.load_dataset(small_dataset)
+    report = train_model.compare_engines(train_model.ENGINES, X, targets, n_estimators=10, jobs=2)
+
+    assert set(report) == {'gbm', 'hist'}
+    for results in report.values():
+        assert results['wall_time_s'] > 0
+        for target in ('reservation', 'collection'):
+            assert results[target]['size_bytes'] > 0
+            assert 0.5 < results[target]['accuracy'] <= 1
+            assert 0 < results[target]['roc_auc'] <= 1
+
+
+def test_saved_hist_models_can_be_served(small_dataset, tmp_path):
+    """
+    Tests models trained with the histogram engine load into the registry and are served without the compiled
+    predictor, which only supports the default engine.
+    :param small_dataset: The dataset file.
+    :param tmp_path: Directory the models are saved to.
+    """
+
+    report_path = tmp_path / "report.json"
+    assert train_model.main([
+        "--dataset", str(small_dataset), "--engine", "hist", "--estimators", "10",
+        "--output-dir", str(tmp_path), "--report", str(report_path)
+    ]) == 0
+
+    assert set(json.loads(report_path.read_text())) == {'hist'}
+
+    model_version = ModelRegistry(str(tmp_path)).load()
+    assert model_version.compiled_predictor is None
+    assert model_version.inference_engine.shared_preprocessor
+
+    reservation_predictions, reservation_probabilities, *_ = model_version.predict(WARM_UP_INPUT)
+    assert reservation_predictions[0] == (reservation_probabilities[0] >= 0.5)
+
+
+@pytest.mark.parametrize("jobs", ["0", "-2", "two"])
+def test_invalid_job_counts_are_rejected(jobs):
+    """
+    Tests --jobs values other than -1 or a positive integer are rejected before the dataset is loaded.
+    :param jobs: The --jobs value.
+    """
+
+    with pytest.raises(SystemExit) as error:
+        train_model.main(["--jobs", jobs, "--no-save"])
+    assert error.value.code == 2
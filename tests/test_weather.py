@@ -0,0 +1,188 @@
+import asyncio
+import json
+import threading
+import time
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import AsyncMock, MagicMock, patch
+import pytest
+from src import services
+from src.weather import WeatherClient, WeatherUnavailable, CircuitBreaker, Climatology, DEFAULT_WEATHER
+
+
+class StubWeatherHandler(BaseHTTPRequestHandler):
+    """
+    Serves the current weather like the weather API, with a configurable delay and status code.
+    """
+
+    def do_GET(self):
+        self.server.requests += 1
+        time.sleep(self.server.delay)
+
+        body = json.dumps({"current": {"temp_c": 17.5, "condition": {"text": "Partly cloudy"}}}).encode()
+        self.send_response(self.server.status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    """
+    Starts a local stand-in for the weather API on a free port.
+    """
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubWeatherHandler)
+    server.requests = 0
+    server.delay = 0.0
+    server.status = 200
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_client(server, failure_threshold=2):
+    """
+    Creates a weather client pointing at the stub server with short timeouts.
+    """
+    return WeatherClient(
+        "test-key",
+        base_url=f"http://127.0.0.1:{server.server_port}",
+        connect_timeout=0.5,
+        read_timeout=0.2,
+        breaker=CircuitBreaker(failure_threshold=failure_threshold, reset_timeout=60)
+    )
+
+
+def test_fetch_reuses_pooled_connection(stub_server):
+    """
+    Tests the weather is parsed from the API response across several requests on one client.
+    """
+
+    client = make_client(stub_server)
+
+    async def fetch_twice():
+        try:
+            return [await client.fetch("EX4 4QJ"), await client.fetch("EX4 4QJ")]
+        finally:
+            await client.aclose()
+
+    assert asyncio.run(fetch_twice()) == [("Partly cloudy", 17.5)] * 2
+    assert stub_server.requests == 2
+
+
+def test_slow_api_opens_circuit_breaker(stub_server):
+    """
+    Tests requests time out and the breaker stops calling the API after repeated failures.
+    """
+
+    stub_server.delay = 0.5
+    client = make_client(stub_server, failure_threshold=2)
+
+    async def fetch_until_open():
+        try:
+            for _ in range(4):
+                with pytest.raises(WeatherUnavailable):
+                    await client.fetch("EX4 4QJ")
+        finally:
+            await client.aclose()
+
+    asyncio.run(fetch_until_open())
+
+    # Only the calls before the breaker opened reach the API
+    assert stub_server.requests == 2
+    assert client.breaker.state == "open"
+
+
+def test_server_error_counts_as_failure(stub_server):
+    """
+    Tests error status codes from the API are raised as WeatherUnavailable.
+    """
+
+    stub_server.status = 503
+    client = make_client(stub_server)
+
+    with pytest.raises(WeatherUnavailable):
+        asyncio.run(client.fetch("EX4 4QJ"))
+    assert client.breaker.failures == 1
+
+
+def test_breaker_allows_one_trial_after_reset_timeout():
+    """
+    Tests a half open breaker lets a single call through and closes when it succeeds.
+    """
+
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, timer=lambda: now[0])
+    breaker.record_failure()
+    assert not breaker.allow()
+
+    now[0] = 30.0
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_cancelled_trial_does_not_keep_breaker_open():
+    """
+    Tests a half open trial call that is cancelled lets the next call through rather than blocking every call.
+    """
+
+    now = [0.0]
+    client = WeatherClient("test-key", breaker=CircuitBreaker(failure_threshold=1, reset_timeout=30,
+                                                               timer=lambda: now[0]))
+    client.breaker.record_failure()
+    now[0] = 30.0
+
+    http_client = MagicMock(get=AsyncMock(side_effect=asyncio.CancelledError))
+    with patch.object(client, "_get_client", return_value=http_client):
+        with pytest.raises(asyncio.CancelledError):
+            asyncio.run(client.fetch("EX4 4QJ"))
+
+    assert client.breaker.allow()
+
+
+def test_shipped_climatology_covers_every_month():
+    """
+    Tests the climatology shipped with the service has typical weather for every month.
+    """
+
+    climatology = Climatology()
+    assert sorted(climatology.months) == list(range(1, 13))
+
+
+def test_climatology_lookup(tmp_path):
+    """
+    Tests the monthly climatology is read from CSV and missing months use the default weather.
+    """
+
+    path = tmp_path / "climatology.csv"
+    path.write_text("month,condition,temperature\n1,Overcast,6.2\n")
+    climatology = Climatology(str(path))
+
+    assert climatology.lookup(date(2025, 1, 15)) == ("Overcast", 6.2)
+    assert climatology.lookup(date(2025, 7, 15)) == DEFAULT_WEATHER
+
+
+def test_get_current_weather_falls_back_to_climatology():
+    """
+    Tests the service uses the climatology instead of failing when the weather API is unavailable.
+    """
+
+    session = MagicMock(execute=AsyncMock(return_value=MagicMock()))
+    session.execute.return_value.mappings.return_value.first.return_value = {"postcode": "EX4 4QJ"}
+    client = MagicMock(api_key="test-key")
+    client.fetch = AsyncMock(side_effect=WeatherUnavailable("Circuit breaker is open"))
+
+    with patch("src.services.weather_client", client), \
+            patch("src.services.climatology.lookup", return_value=("Overcast", 6.2)):
+        assert asyncio.run(services.get_current_weather("vendor", session)) == ("Overcast", 6.2)